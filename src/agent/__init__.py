@@ -2,5 +2,6 @@ from .react_agent import ReActAgent
 from .tot_agent import ToTAgent
 from .cot_agent import CoTAgent
 from .presentation_agent import PresentationAgent
+from .steps import Delta
 
-__all__ = ["ReActAgent", "CoTAgent", "ToTAgent", "PresentationAgent"]
+__all__ = ["ReActAgent", "CoTAgent", "ToTAgent", "PresentationAgent", "Delta"]
@@ -1,7 +1,8 @@
 import logging
 import re
-from typing import Callable, Iterator, Optional
+from typing import AsyncIterator, Awaitable, Callable, Iterator, Optional, Union
 
+from src.agent.steps import Call, Delta, Steps, adrive, drive, read_stream
 from src.memory import BaseMemory
 
 logger = logging.getLogger(__name__)
@@ -24,7 +25,7 @@ class CoTAgent:
 
     def __init__(
         self,
-        llm: Callable[[str], str],
+        llm: Callable[[str], Union[str, Awaitable[str]]],
         memory: Optional[BaseMemory] = None,
         *,
         max_turns: int = 5,
@@ -37,7 +38,11 @@ class CoTAgent:
         if verbose:
             logger.setLevel(logging.DEBUG)
 
-    def run_iter(self, question: str) -> Iterator[str]:
+    def _turn_done(self, lines: str) -> bool:
+        match = self.FINAL_RE.search(lines)
+        return bool(match and match.group(1).strip())
+
+    def _steps(self, question: str) -> Steps:
         scratchpad = ""
         if self.memory is not None:
             self.memory.add("user", question)
@@ -56,10 +61,12 @@ class CoTAgent:
             )
             if self.verbose:
                 logger.debug("Prompt:\n%s", prompt)
-            output = self.llm(prompt)
+            reply = yield Call(self.llm, prompt)
+            output = yield from read_stream(reply, self._turn_done)
             if self.verbose:
                 logger.debug("LLM output:\n%s", output)
-            yield output
+            if isinstance(reply, str):
+                yield output
             final_match = self.FINAL_RE.search(output)
             if final_match:
                 answer = final_match.group(1).strip()
@@ -80,10 +87,35 @@ class CoTAgent:
             logger.warning("Max turns reached with no final answer")
         yield "エラー: 最大試行回数に達しました"
 
+    def run_iter(self, question: str) -> Iterator[str]:
+        """Yield each thought, then the final answer.
+
+        With a streaming LLM each turn is yielded as :class:`Delta` pieces
+        and reading stops once the ``最終的な答え:`` line is complete.
+        """
+        return drive(self._steps(question))
+
+    def arun_iter(self, question: str) -> AsyncIterator[str]:
+        """Async version of :meth:`run_iter` for async (or blocking) LLMs."""
+        return adrive(self._steps(question))
+
     def run(self, question: str) -> str:
         answer = None
         last = ""
         for message in self.run_iter(question):
+            if isinstance(message, Delta):
+                continue
+            last = message
+            if message.startswith("最終的な答え:"):
+                answer = message[len("最終的な答え:"):].strip()
+        return answer or last
+
+    async def arun(self, question: str) -> str:
+        answer = None
+        last = ""
+        async for message in self.arun_iter(question):
+            if isinstance(message, Delta):
+                continue
             last = message
             if message.startswith("最終的な答え:"):
                 answer = message[len("最終的な答え:"):].strip()
@@ -1,7 +1,9 @@
 import json
 import re
 import tempfile
-from typing import Callable, Iterator
+from typing import AsyncIterator, Awaitable, Callable, Iterator, Union
+
+from src.agent.steps import Call, Steps, adrive, drive, read_stream
 
 class PresentationAgent:
     """Generate simple HTML presentations using an LLM."""
@@ -12,10 +14,10 @@ class PresentationAgent:
     PROMPT_TEMPLATE = (
         "あなたはプロフェッショナルなプレゼンテーションデザイナーです。"
         "トピックに沿って {n} 枚のスライド原稿を日本語で作成してください。"
-        "出力はJSON配列で、各要素は {\"title\": \"..\", \"body\": \"..\"} の形式で。"
+        "出力はJSON配列で、各要素は {{\"title\": \"..\", \"body\": \"..\"}} の形式で。"
     )
 
-    def __init__(self, llm: Callable[[str], str]):
+    def __init__(self, llm: Callable[[str], Union[str, Awaitable[str]]]):
         self.llm = llm
 
     def _parse_count(self, question: str) -> int:
@@ -44,10 +46,11 @@ class PresentationAgent:
         parts.append("</body></html>")
         return "".join(parts)
 
-    def run_iter(self, question: str) -> Iterator[str]:
+    def _steps(self, question: str) -> Steps:
         count = self._parse_count(question)
         prompt = self.PROMPT_TEMPLATE.format(n=count) + "\n" + question
-        resp = self.llm(prompt)
+        reply = yield Call(self.llm, prompt)
+        resp = yield from read_stream(reply, show=False)
         try:
             slides = json.loads(resp)
         except Exception:
@@ -59,8 +62,20 @@ class PresentationAgent:
             f.write(html)
         yield f"プレゼン資料を生成しました: {tmp.name}"
 
+    def run_iter(self, question: str) -> Iterator[str]:
+        return drive(self._steps(question))
+
+    def arun_iter(self, question: str) -> AsyncIterator[str]:
+        return adrive(self._steps(question))
+
     def run(self, question: str) -> str:
         result = ""
         for step in self.run_iter(question):
             result = step
         return result
+
+    async def arun(self, question: str) -> str:
+        result = ""
+        async for step in self.arun_iter(question):
+            result = step
+        return result
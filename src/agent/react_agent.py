@@ -1,9 +1,10 @@
 import re
 import logging
 import json
-from typing import Callable, Dict, List, Optional, Iterator
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Iterator, Union
 
 from src.tools.base import Tool, execute_tool
+from src.agent.steps import Call, Delta, Steps, adrive, drive, read_stream
 from src.memory import BaseMemory
 
 
@@ -25,7 +26,7 @@ class ReActAgent:
 
     def __init__(
         self,
-        llm: Callable[[str], str],
+        llm: Callable[[str], Union[str, Awaitable[str]]],
         tools: List[Tool],
         memory: Optional[BaseMemory] = None,
         verbose: bool = False,
@@ -43,8 +44,14 @@ class ReActAgent:
             descs.append(f"- {t.name}: {t.description}")
         return "\n".join(descs)
 
-    def run_iter(self, question: str, max_turns: int = 5) -> Iterator[str]:
-        """Yield intermediate steps of the ReAct loop."""
+    def _turn_done(self, lines: str) -> bool:
+        for regex in (self.FINAL_RE, self.ACTION_RE):
+            match = regex.search(lines)
+            if match and match.group(match.lastindex).strip():
+                return True
+        return False
+
+    def _steps(self, question: str, max_turns: int) -> Steps:
         scratchpad = ""
         if self.memory is not None:
             self.memory.add("user", question)
@@ -66,10 +73,14 @@ class ReActAgent:
             )
             if self.verbose:
                 logger.debug("Prompt:\n%s", prompt)
-            output = self.llm(prompt)
+            reply = yield Call(self.llm, prompt)
+            # A streamed turn is yielded as deltas while it arrives and
+            # cut short once its action or final answer line is complete.
+            output = yield from read_stream(reply, self._turn_done)
             if self.verbose:
                 logger.debug("LLM output:\n%s", output)
-            yield output
+            if isinstance(reply, str):
+                yield output
             final_match = self.FINAL_RE.search(output)
             if final_match:
                 answer = final_match.group(1)
@@ -93,7 +104,7 @@ class ReActAgent:
             except Exception:
                 args = {"url": tool_input}
 
-            observation = execute_tool(tool_name, args, self.tools)
+            observation = yield Call(execute_tool, tool_name, args, self.tools)
             if self.verbose:
                 logger.debug("Observation: %s", observation)
             yield f"観察: {observation}"
@@ -105,10 +116,39 @@ class ReActAgent:
             logger.warning("Max turns reached with no final answer")
         yield "エラー: 最大試行回数に達しました"
 
+    def run_iter(self, question: str, max_turns: int = 5) -> Iterator[str]:
+        """Yield intermediate steps of the ReAct loop.
+
+        With a streaming LLM each turn is yielded as :class:`Delta` pieces
+        as it is generated. Reading stops as soon as a ``行動:`` line is
+        complete, so the tool starts without waiting for the rest.
+        """
+        return drive(self._steps(question, max_turns))
+
+    def arun_iter(self, question: str, max_turns: int = 5) -> AsyncIterator[str]:
+        """Async version of :meth:`run_iter` for async (or blocking) LLMs.
+
+        Tools run in a worker thread so they do not block the event loop.
+        """
+        return adrive(self._steps(question, max_turns))
+
     def run(self, question: str, max_turns: int = 5) -> str:
         answer = None
         last = ""
         for message in self.run_iter(question, max_turns=max_turns):
+            if isinstance(message, Delta):
+                continue
+            last = message
+            if message.startswith("最終的な答え:"):
+                answer = message[len("最終的な答え:"):].strip()
+        return answer or last
+
+    async def arun(self, question: str, max_turns: int = 5) -> str:
+        answer = None
+        last = ""
+        async for message in self.arun_iter(question, max_turns=max_turns):
+            if isinstance(message, Delta):
+                continue
             last = message
             if message.startswith("最終的な答え:"):
                 answer = message[len("最終的な答え:"):].strip()
@@ -0,0 +1,131 @@
+"""Run agent loops with either blocking or async callables.
+
+Each agent writes its loop once, as a generator that yields :class:`Call`
+requests for the LLM, tools and evaluators, and yields plain strings as
+output steps. :func:`drive` runs the requests inline for ``run_iter``.
+:func:`adrive` awaits them for ``arun_iter``, so one event loop can serve
+many conversations. Coroutine functions are awaited directly. Blocking
+callables run in a worker thread so they do not stall the loop.
+
+An LLM may also return an iterator of text deltas (see ``llm.stream`` from
+:func:`src.main.create_llm`). :func:`read_stream` then passes each delta on
+as a :class:`Delta` step while it arrives. It stops reading as soon as the
+agent has what it needs.
+"""
+
+import asyncio
+import inspect
+from typing import Any, AsyncIterator, Callable, Generator, Iterator, Optional, Union
+
+Step = Union["Call", str]
+Steps = Generator[Step, Any, None]
+
+
+class Call:
+    """Request from an agent loop to call ``func(*args)`` and send back the result."""
+
+    __slots__ = ("func", "args")
+
+    def __init__(self, func: Callable[..., Any], *args: Any) -> None:
+        self.func = func
+        self.args = args
+
+
+class Delta(str):
+    """Fragment of an LLM turn, yielded while the completion streams in.
+
+    A streamed turn is yielded as consecutive deltas instead of one step;
+    print them without newlines to show the text as it is generated.
+    """
+
+    __slots__ = ()
+
+
+async def _anext(stream: Any) -> Any:
+    return await anext(stream, None)
+
+
+def read_stream(
+    reply: Any,
+    stop: Optional[Callable[[str], bool]] = None,
+    *,
+    show: bool = True,
+) -> Steps:
+    """Read an LLM *reply* inside an agent loop and return its text.
+
+    A plain string is returned unchanged. A stream of deltas is read chunk by
+    chunk, and each chunk is yielded as a :class:`Delta` when *show* is set.
+    Whenever a line completes, *stop* is called with the complete lines
+    received so far. Once it returns True the text is cut after those lines,
+    the stream is closed (which aborts the HTTP response) and the text read
+    so far is returned.
+    """
+    if isinstance(reply, str):
+        return reply
+    is_async = hasattr(reply, "__anext__")
+    text = ""
+    while True:
+        delta = yield (Call(_anext, reply) if is_async else Call(next, reply, None))
+        if delta is None:
+            return text
+        if stop is not None and "\n" in delta:
+            received = text + delta
+            lines = received[: received.rfind("\n") + 1]
+            if stop(lines):
+                if show and len(lines) > len(text):
+                    yield Delta(lines[len(text):])
+                close = getattr(reply, "aclose" if is_async else "close", None)
+                if close is not None:
+                    yield Call(close)
+                return lines.rstrip("\n")
+        text += delta
+        if show and delta:
+            yield Delta(delta)
+
+
+def drive(steps: Steps) -> Iterator[str]:
+    """Run *steps* with blocking calls and yield its output."""
+    reply = None
+    while True:
+        try:
+            step = steps.send(reply)
+        except StopIteration:
+            return
+        reply = None
+        if isinstance(step, Call):
+            reply = step.func(*step.args)
+            if inspect.isawaitable(reply) or inspect.isasyncgen(reply):
+                close = getattr(reply, "close", None)
+                if close is not None:
+                    close()
+                raise TypeError(
+                    f"{getattr(step.func, '__name__', step.func)!r} is async; use arun/arun_iter"
+                )
+        else:
+            yield step
+
+
+async def acall(func: Callable[..., Any], *args: Any) -> Any:
+    """Await ``func(*args)``, running blocking callables in a worker thread."""
+    if inspect.iscoroutinefunction(func) or inspect.isasyncgenfunction(func):
+        result = func(*args)
+        return await result if inspect.isawaitable(result) else result
+    result = await asyncio.to_thread(func, *args)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+async def adrive(steps: Steps) -> AsyncIterator[str]:
+    """Run *steps* on the event loop and yield its output."""
+    reply = None
+    while True:
+        try:
+            step = steps.send(reply)
+        except StopIteration:
+            return
+        reply = None
+        if isinstance(step, Call):
+            reply = await acall(step.func, *step.args)
+        else:
+            yield step
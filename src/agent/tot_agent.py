@@ -1,6 +1,7 @@
 import re
-from typing import Callable, List, Tuple, Iterator, Optional
+from typing import AsyncIterator, Awaitable, Callable, List, Tuple, Iterator, Optional, Union
 
+from src.agent.steps import Call, Steps, adrive, drive, read_stream
 from src.memory import BaseMemory
 
 
@@ -18,8 +19,8 @@ class ToTAgent:
 
     def __init__(
         self,
-        llm: Callable[[str], str],
-        evaluate: Callable[[str], float],
+        llm: Callable[[str], Union[str, Awaitable[str]]],
+        evaluate: Callable[[str], Union[float, Awaitable[float]]],
         *,
         max_depth: int = 2,
         breadth: int = 2,
@@ -30,9 +31,11 @@ class ToTAgent:
         Parameters
         ----------
         llm:
-            Callable that takes a prompt and returns a completion.
+            Callable that takes a prompt and returns a completion. Async
+            callables are supported by :meth:`arun` and :meth:`arun_iter`.
         evaluate:
-            Function scoring a history string, higher is better.
+            Function scoring a history string, higher is better. May be
+            async when used with :meth:`arun`.
         max_depth:
             How many rounds of expansion to perform.
         breadth:
@@ -44,7 +47,7 @@ class ToTAgent:
         self.breadth = breadth
         self.memory = memory
 
-    def _propose(self, question: str, history: str, memory: str = "") -> List[str]:
+    def _propose(self, question: str, history: str, memory: str = "") -> Steps:
         """Ask the LLM for the next thought candidates."""
         prompt = (
             f"質問: {question}\n"
@@ -52,29 +55,23 @@ class ToTAgent:
             + f"これまでの思考:\n{history}\n"
             f"{self.breadth}個の次の思考候補を箇条書きで提案してください。"
         )
-        output = self.llm(prompt)
+        reply = yield Call(self.llm, prompt)
+        output = yield from read_stream(reply, show=False)
         return [m.group(1).strip() for m in self.THOUGHT_RE.finditer(output)]
 
-    def _final(self, question: str, history: str, memory: str = "") -> str:
+    def _final(self, question: str, history: str, memory: str = "") -> Steps:
         """Request the final answer from the LLM."""
         prompt = (
             f"質問: {question}\n"
             + (f"関連履歴:\n{memory}\n" if memory else "")
             + f"思考過程:\n{history}\n最終的な答え:"
         )
-        resp = self.llm(prompt)
+        reply = yield Call(self.llm, prompt)
+        resp = yield from read_stream(reply, show=False)
         match = self.FINAL_RE.search(resp)
         return match.group(1).strip() if match else resp.strip()
 
-    def run_iter(self, question: str) -> Iterator[str]:
-        """Generate reasoning steps and yield the final answer.
-
-        The iterator yields strings describing each phase of the search:
-
-        * ``思考候補`` lines listing proposed thoughts
-        * ``選択`` lines showing which path was chosen and its score
-        * a ``最終的な答え`` line containing the answer at the end
-        """
+    def _steps(self, question: str) -> Steps:
         memory_lines: List[str] = []
         if self.memory is not None:
             try:
@@ -90,12 +87,12 @@ class ToTAgent:
         for _ in range(self.max_depth):
             candidates: List[Tuple[str, float]] = []
             for hist, _score in nodes:
-                thoughts = self._propose(question, hist, mem_context)
+                thoughts = yield from self._propose(question, hist, mem_context)
                 if thoughts:
                     yield "\n".join(f"思考候補: {t}" for t in thoughts)
                 for t in thoughts:
                     new_hist = (hist + "\n" + t) if hist else t
-                    score = self.evaluate(new_hist)
+                    score = yield Call(self.evaluate, new_hist)
                     candidates.append((new_hist, score))
             if not candidates:
                 break
@@ -103,12 +100,27 @@ class ToTAgent:
             nodes = candidates[: self.breadth]
             yield f"選択: {nodes[0][0]} (score={nodes[0][1]:.2f})"
         best_history = nodes[0][0]
-        answer = self._final(question, best_history, mem_context)
+        answer = yield from self._final(question, best_history, mem_context)
         yield f"最終的な答え: {answer}"
         if self.memory is not None:
             self.memory.add("assistant", answer)
         return
 
+    def run_iter(self, question: str) -> Iterator[str]:
+        """Generate reasoning steps and yield the final answer.
+
+        The iterator yields strings describing each phase of the search:
+
+        * ``思考候補`` lines listing proposed thoughts
+        * ``選択`` lines showing which path was chosen and its score
+        * a ``最終的な答え`` line containing the answer at the end
+        """
+        return drive(self._steps(question))
+
+    def arun_iter(self, question: str) -> AsyncIterator[str]:
+        """Async version of :meth:`run_iter` for async (or blocking) callables."""
+        return adrive(self._steps(question))
+
     def run(self, question: str) -> str:
         """Execute the search loop and return the final answer."""
         answer = None
@@ -116,3 +128,11 @@ class ToTAgent:
             if step.startswith("最終的な答え:"):
                 answer = step[len("最終的な答え:"):].strip()
         return answer or ""
+
+    async def arun(self, question: str) -> str:
+        """Async version of :meth:`run`."""
+        answer = None
+        async for step in self.arun_iter(question):
+            if step.startswith("最終的な答え:"):
+                answer = step[len("最終的な答え:"):].strip()
+        return answer or ""
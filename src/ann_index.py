@@ -0,0 +1,228 @@
+"""FAISS index construction for :class:`~src.vector_store_manager.VectorStoreManager`.
+
+Supported index types trade memory and latency against recall:
+
+* ``flat`` – exact search over full float32 vectors (``d * 4`` bytes each)
+* ``ivf_flat`` – inverted lists over full vectors, tuned with ``nprobe``
+* ``ivf_pq`` – inverted lists over product-quantized codes (``pq_m * pq_bits / 8``
+  bytes each)
+* ``hnsw`` – graph search over full vectors, tuned with ``ef_search``
+* ``sq8`` – exact scan over 8-bit scalar-quantized vectors (``d`` bytes each)
+* ``fp16`` – exact scan over half-precision vectors (``d * 2`` bytes each)
+"""
+
+import logging
+import math
+import time
+from typing import Any, Dict, List, Optional
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw", "sq8", "fp16")
+
+# Index types whose quantizers have to be trained before vectors are added.
+TRAINED_TYPES = ("ivf_flat", "ivf_pq", "sq8")
+
+DEFAULT_PQ_M = 64
+DEFAULT_PQ_BITS = 8
+DEFAULT_HNSW_M = 32
+# k-means needs roughly this many points per centroid for stable clusters.
+POINTS_PER_CENTROID = 39
+
+
+def default_nlist(num_vectors: int) -> int:
+    """Return the usual ``4 * sqrt(n)`` list count, bounded by the data size."""
+    nlist = int(4 * math.sqrt(max(num_vectors, 1)))
+    return max(1, min(nlist, num_vectors // POINTS_PER_CENTROID or 1))
+
+
+def _pq_m(dim: int, pq_m: int) -> int:
+    # PQ splits the vector into m equal parts, so m must divide the dimension.
+    m = min(pq_m, dim)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def factory_string(index_type: str, dim: int, num_vectors: int, **params: Any) -> str:
+    """Return the :func:`faiss.index_factory` description for *index_type*."""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {index_type!r} (choose from {', '.join(INDEX_TYPES)})")
+    nlist = params.get("nlist") or default_nlist(num_vectors)
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    if index_type == "ivf_pq":
+        m = _pq_m(dim, params.get("pq_m") or DEFAULT_PQ_M)
+        bits = params.get("pq_bits") or DEFAULT_PQ_BITS
+        return f"IVF{nlist},PQ{m}" if bits == DEFAULT_PQ_BITS else f"IVF{nlist},PQ{m}x{bits}"
+    if index_type == "hnsw":
+        return f"HNSW{params.get('hnsw_m') or DEFAULT_HNSW_M}"
+    if index_type == "sq8":
+        return "SQ8"
+    return "SQfp16"
+
+
+def min_training_points(index_type: str, **params: Any) -> int:
+    """Return how many vectors *index_type* needs before it can be trained."""
+    if index_type not in TRAINED_TYPES:
+        return 0
+    if index_type == "sq8":
+        return 1
+    points = POINTS_PER_CENTROID * (params.get("nlist") or 1)
+    if index_type == "ivf_pq":
+        points = max(points, 2 ** (params.get("pq_bits") or DEFAULT_PQ_BITS))
+    return points
+
+
+def create_index(index_type: str, vectors: np.ndarray, ids: np.ndarray, **params: Any) -> faiss.IndexIDMap:
+    """Build an id-mapped index of *index_type*, training it on *vectors*."""
+    dim = vectors.shape[1]
+    description = factory_string(index_type, dim, len(vectors), **params)
+    index = faiss.IndexIDMap(faiss.index_factory(dim, description))
+    if not index.is_trained:
+        logger.info("Training %s index on %d vectors.", description, len(vectors))
+        index.train(vectors)
+    if len(vectors):
+        index.add_with_ids(vectors, ids)
+    return index
+
+
+def mmap_flag(index_type: str) -> Optional[int]:
+    """Return the :func:`faiss.read_index` flag that memory-maps *index_type*.
+
+    ``IO_FLAG_MMAP`` only maps the inverted lists of IVF indexes; flat,
+    HNSW and scalar-quantized codes need ``IO_FLAG_MMAP_IFC`` (FAISS 1.9+).
+    Returns ``None`` when this FAISS version cannot map the index type.
+    Mapped indexes are read-only; see :func:`in_memory`.
+    """
+    if index_type.startswith("ivf"):
+        return faiss.IO_FLAG_MMAP
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+
+
+def _has_mapped_lists(ivf: Optional[faiss.IndexIVF]) -> bool:
+    return ivf is not None and isinstance(faiss.downcast_InvertedLists(ivf.invlists), faiss.OnDiskInvertedLists)
+
+
+def in_memory(index: faiss.Index) -> faiss.Index:
+    """Return a writable in-RAM copy of *index*, which may be memory-mapped.
+
+    Neither mapping can be written to: mapped flat codes abort the process on
+    ``add_with_ids``, and ``faiss.clone_index`` refuses (IVF) or keeps
+    viewing (flat) the mapped data. Mapped IVF lists are copied list by list
+    because serializing them only records a reference to the mapped file.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if not _has_mapped_lists(ivf):
+        return faiss.deserialize_index(faiss.serialize_index(index))
+    writer = faiss.VectorIOWriter()
+    faiss.write_index(index, writer)
+    reader = faiss.VectorIOReader()
+    reader.data = writer.data
+    copy = faiss.read_index(reader, faiss.IO_FLAG_SKIP_IVF_DATA)
+    lists = faiss.ArrayInvertedLists(ivf.nlist, ivf.code_size)
+    for n in range(ivf.nlist):
+        size = ivf.invlists.list_size(n)
+        if size:
+            lists.add_entries(n, size, ivf.invlists.get_ids(n), ivf.invlists.get_codes(n))
+    faiss.extract_index_ivf(copy).replace_invlists(lists, True)
+    lists.this.disown()
+    return copy
+
+
+def write_index(index: faiss.Index, path: str) -> None:
+    """Write *index* to *path*, copying memory-mapped IVF lists into the file.
+
+    ``faiss.write_index`` would only record where the mapped lists live, and
+    that file is removed once a newer generation is saved.
+    """
+    if _has_mapped_lists(faiss.try_extract_index_ivf(index)):
+        index = in_memory(index)
+    faiss.write_index(index, path)
+
+
+def search_parameters(
+    index: faiss.Index,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    selector: Optional[faiss.IDSelector] = None,
+    selectivity: float = 1.0,
+) -> Optional[faiss.SearchParameters]:
+    """Return per-query search parameters for *index*, or ``None`` for defaults.
+
+    Passing parameters per call instead of mutating the index keeps
+    concurrent searches with different settings independent. *selector*
+    restricts the search to matching ids inside the index itself; the caller
+    must keep it alive until the search has finished. *selectivity* is the
+    fraction of stored vectors the selector accepts. ``nprobe`` and
+    ``ef_search`` are divided by it so a filtered query still visits about
+    as many eligible vectors as an unfiltered one.
+    """
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    kwargs: Dict[str, Any] = {}
+    scale = 1.0
+    if selector is not None:
+        kwargs["sel"] = selector
+        scale = 1.0 / max(selectivity, 1e-9)
+    if isinstance(inner, faiss.IndexIVF) and (nprobe or selector is not None):
+        ivf = faiss.extract_index_ivf(inner)
+        kwargs["nprobe"] = min(ivf.nlist, math.ceil((nprobe or ivf.nprobe) * scale))
+        return faiss.SearchParametersIVF(**kwargs)
+    if isinstance(inner, faiss.IndexHNSW) and (ef_search or selector is not None):
+        kwargs["efSearch"] = max(1, min(inner.ntotal, math.ceil((ef_search or inner.hnsw.efSearch) * scale)))
+        return faiss.SearchParametersHNSW(**kwargs)
+    if selector is not None:
+        return faiss.SearchParameters(**kwargs)
+    return None
+
+
+def index_bytes(index: faiss.Index) -> int:
+    """Return the serialized size of *index* in bytes."""
+    return int(faiss.serialize_index(index).size)
+
+
+def recall_report(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    configs: List[Dict[str, Any]],
+    top_k: int = 10,
+) -> List[Dict[str, Any]]:
+    """Compare index configurations against exact search.
+
+    Each entry of *configs* holds an ``index_type`` plus optional build
+    parameters (``nlist``, ``pq_m``, ``pq_bits``, ``hnsw_m``) and query parameters
+    (``nprobe``, ``ef_search``). The result lists recall@k against a flat
+    index, mean query latency in milliseconds and bytes per stored vector.
+    """
+    ids = np.arange(len(vectors), dtype="int64")
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, top_k)
+
+    report = []
+    for config in configs:
+        config = dict(config)
+        index_type = config.pop("index_type")
+        nprobe = config.pop("nprobe", None)
+        ef_search = config.pop("ef_search", None)
+        index = create_index(index_type, vectors, ids, **config)
+        params = search_parameters(index, nprobe=nprobe, ef_search=ef_search)
+        start = time.perf_counter()
+        _, found = index.search(queries, top_k, params=params)
+        elapsed = time.perf_counter() - start
+        hits = sum(len(set(f) & set(t)) for f, t in zip(found.tolist(), truth.tolist()))
+        report.append({
+            "index_type": index_type,
+            "factory": factory_string(index_type, vectors.shape[1], len(vectors), **config),
+            "nprobe": nprobe,
+            "ef_search": ef_search,
+            "recall": hits / (len(queries) * top_k),
+            "latency_ms": elapsed * 1000 / len(queries),
+            "bytes_per_vector": index_bytes(index) / len(vectors),
+        })
+    return report
@@ -0,0 +1,245 @@
+"""In-process BM25 index used for lexical retrieval alongside FAISS."""
+
+import json
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Collection, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Article references (第12条) and ASCII words or codes (ABC-123) stay whole;
+# runs of other characters such as Japanese text are indexed as character
+# bigrams so no morphological analyser is needed.
+_TOKEN_RE = re.compile(
+    r"第[0-9]+(?:条の[0-9]+|[編章節款条項号])"
+    r"|[0-9a-z]+(?:[-_.][0-9a-z]+)*"
+    r"|[^\W0-9a-z_]+"
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Return lexical tokens for *text*."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens: List[str] = []
+    for match in _TOKEN_RE.finditer(text):
+        run = match.group(0)
+        if run.isascii() or len(run) == 1 or run.startswith("第") and run[1].isdigit():
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """Combine ranked id lists with reciprocal-rank fusion.
+
+    Each id scores ``sum(1 / (k + rank))`` over the lists it appears in.
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """Okapi BM25 over an inverted index of :func:`tokenize` terms.
+
+    Postings are stored as compressed sparse rows: the documents containing
+    term id ``t`` are ``_doc_ids[_indptr[t]:_indptr[t + 1]]``, with their
+    term frequencies in ``_tfs`` (6 bytes per posting). A saved index is
+    memory-mapped. Postings of added documents are buffered and merged into
+    the rows once the buffer is as large as the rows; removed documents are
+    only masked out until then. Updates therefore cost time in proportion
+    to the document, not to the index. Document ids must be below 2**31.
+    """
+
+    MERGE_MIN_POSTINGS = 100_000
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self._terms: Dict[str, int] = {}
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._doc_ids = np.empty(0, dtype=np.int32)
+        self._tfs = np.empty(0, dtype=np.uint16)
+        # Postings added since the last merge as ``(doc_id, term_ids, tfs)``,
+        # and the same postings sorted by term once a search needs them.
+        self._pending: List[Tuple[int, np.ndarray, np.ndarray]] = []
+        self._pending_size = 0
+        self._pending_rows: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+        self._pending_lock = threading.Lock()
+        # Token count of every document by id; -1 marks ids not in the index.
+        self._lengths = np.full(0, -1, dtype=np.int32)
+        self._count = 0
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, doc_id: int, text: str) -> None:
+        counts = Counter(tokenize(text))
+        if doc_id >= len(self._lengths):
+            lengths = np.full(max(doc_id + 1, 2 * len(self._lengths), 1024), -1, dtype=np.int32)
+            lengths[: len(self._lengths)] = self._lengths
+            self._lengths = lengths
+        term_ids = np.fromiter(
+            (self._terms.setdefault(term, len(self._terms)) for term in counts), dtype=np.int64, count=len(counts)
+        )
+        tfs = np.fromiter((min(tf, 0xFFFF) for tf in counts.values()), dtype=np.uint16, count=len(counts))
+        self._pending.append((doc_id, term_ids, tfs))
+        self._pending_size += len(term_ids)
+        self._pending_rows = None
+        length = sum(counts.values())
+        self._lengths[doc_id] = length
+        self._count += 1
+        self._total_length += length
+        if self._pending_size >= max(self.MERGE_MIN_POSTINGS, len(self._doc_ids)):
+            self._indptr, self._doc_ids, self._tfs = self._merged()
+            self._pending = []
+            self._pending_size = 0
+            self._pending_rows = None
+
+    def remove(self, doc_id: int) -> None:
+        """Remove *doc_id*; its postings are dropped at the next merge."""
+        if doc_id >= len(self._lengths) or self._lengths[doc_id] < 0:
+            return
+        self._total_length -= int(self._lengths[doc_id])
+        self._lengths[doc_id] = -1
+        self._count -= 1
+
+    def _pending_postings(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the buffered ``(term_ids, doc_ids, tfs)``, sorted by term."""
+        rows = self._pending_rows
+        if rows is None:
+            with self._pending_lock:
+                rows = self._pending_rows
+                if rows is None:
+                    terms = np.concatenate([t for _, t, _ in self._pending] or [np.empty(0, np.int64)])
+                    docs = np.concatenate(
+                        [np.full(len(t), d, dtype=np.int32) for d, t, _ in self._pending] or [np.empty(0, np.int32)]
+                    )
+                    tfs = np.concatenate([f for _, _, f in self._pending] or [np.empty(0, np.uint16)])
+                    order = np.argsort(terms, kind="stable")
+                    rows = self._pending_rows = (terms[order], docs[order], tfs[order])
+        return rows
+
+    def _merged(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return ``(indptr, doc_ids, tfs)`` with the buffer merged in and removed documents dropped."""
+        terms, pending_docs, pending_tfs = self._pending_postings()
+        indptr = self._indptr
+        if len(indptr) <= len(self._terms):
+            indptr = np.concatenate([indptr, np.full(len(self._terms) + 1 - len(indptr), indptr[-1])])
+        # Buffered postings go after the existing ones of the same term.
+        at = indptr[terms + 1]
+        docs = np.insert(self._doc_ids, at, pending_docs)
+        tfs = np.insert(self._tfs, at, pending_tfs)
+        indptr = indptr + np.concatenate([[0], np.cumsum(np.bincount(terms, minlength=len(self._terms)))])
+        live = self._lengths[docs] >= 0
+        if not live.all():
+            kept = np.concatenate([[0], np.cumsum(live, dtype=np.int64)])
+            indptr = kept[indptr]
+            docs = docs[live]
+            tfs = tfs[live]
+        return indptr, docs, tfs
+
+    def search(
+        self, query: str, top_k: int = 5, allowed: Optional[Collection[int]] = None
+    ) -> List[Tuple[int, float]]:
+        """Return up to *top_k* ``(doc_id, score)`` pairs, best first.
+
+        With *allowed* only those ids are scored.
+        """
+        n = self._count
+        if not n:
+            return []
+        if allowed is not None and not isinstance(allowed, np.ndarray):
+            allowed = np.fromiter(allowed, dtype=np.int64, count=len(allowed))
+        avgdl = self._total_length / n
+        pending_terms, pending_docs, pending_tfs = self._pending_postings()
+        matched: List[np.ndarray] = []
+        scores: List[np.ndarray] = []
+        for term in set(tokenize(query)):
+            term_id = self._terms.get(term)
+            if term_id is None:
+                continue
+            lo, hi = np.searchsorted(pending_terms, [term_id, term_id + 1])
+            docs = pending_docs[lo:hi]
+            tfs = pending_tfs[lo:hi]
+            if term_id + 1 < len(self._indptr):
+                start, end = self._indptr[term_id], self._indptr[term_id + 1]
+                docs = np.concatenate([self._doc_ids[start:end], docs])
+                tfs = np.concatenate([self._tfs[start:end], tfs])
+            lengths = self._lengths[docs]
+            live = lengths >= 0
+            df = int(live.sum())
+            if not df:
+                continue
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            if allowed is not None:
+                live &= np.isin(docs, allowed)
+            tfs = tfs[live].astype(np.float64)
+            norm = self.k1 * (1 - self.b + self.b * lengths[live] / avgdl)
+            matched.append(docs[live])
+            scores.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+        if not matched:
+            return []
+        ids, inverse = np.unique(np.concatenate(matched), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(scores))
+        order = np.lexsort((ids, -totals))[:top_k]
+        return [(int(ids[i]), float(totals[i])) for i in order]
+
+    def save(self, path: str) -> None:
+        """Write the index to *path* as a sequence of ``.npy`` arrays."""
+        indptr, docs, tfs = self._merged()
+        meta = json.dumps({"k1": self.k1, "b": self.b}).encode("utf-8")
+        arrays = [
+            np.frombuffer(meta, dtype=np.uint8),
+            np.frombuffer("\n".join(self._terms).encode("utf-8"), dtype=np.uint8),
+            self._lengths,
+            indptr,
+            docs,
+            tfs,
+        ]
+        with open(path, "wb") as f:
+            for array in arrays:
+                np.lib.format.write_array(f, np.ascontiguousarray(array), allow_pickle=False)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """Open an index written by :meth:`save`; its postings stay on disk."""
+        meta, blob, lengths, indptr, docs, tfs = _map_arrays(path, 6)
+        index = cls(**json.loads(bytes(meta)))
+        terms = bytes(blob).decode("utf-8").split("\n") if len(blob) else []
+        index._terms = {term: term_id for term_id, term in enumerate(terms)}
+        # Small enough to keep in RAM, and changed in place by add/remove.
+        index._lengths = np.array(lengths)
+        index._indptr, index._doc_ids, index._tfs = indptr, docs, tfs
+        live = index._lengths[index._lengths >= 0]
+        index._count = len(live)
+        index._total_length = int(live.sum())
+        return index
+
+
+def _map_arrays(path: str, count: int) -> List[np.ndarray]:
+    """Memory-map the first *count* arrays of a file written with ``np.lib.format.write_array``."""
+    arrays = []
+    with open(path, "rb") as f:
+        for _ in range(count):
+            version = np.lib.format.read_magic(f)
+            read_header = (
+                np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+            )
+            shape, fortran_order, dtype = read_header(f)
+            offset = f.tell()
+            size = int(np.prod(shape)) * dtype.itemsize
+            if size:
+                order = "F" if fortran_order else "C"
+                arrays.append(np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape, order=order))
+            else:
+                arrays.append(np.empty(shape, dtype=dtype))
+            f.seek(offset + size)
+    return arrays
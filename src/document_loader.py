@@ -1,12 +1,42 @@
 import logging
-from typing import List, Dict, Any
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 import pypdf
 import docx
 import requests
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+from src.page_cache import PageCache
 
 logger = logging.getLogger(__name__)
 
+# Part of the page cache key; bump the suffix when extraction changes so
+# cached pages are extracted again.
+LOADER_VERSION = f"pypdf-{pypdf.__version__}/1"
+DEFAULT_PAGE_CACHE_MB = 512
+# Extracted pages are written to the cache in groups of this size.
+CACHE_WRITE_PAGES = 16
+
+DEFAULT_URL_TIMEOUT = 30.0
+DEFAULT_URL_MAX_MB = 20
+URL_POOL_SIZE = 16
+DOWNLOAD_CHUNK = 64 * 1024
+
+_page_cache: Optional[PageCache] = None
+_page_cache_lock = threading.Lock()
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+# PDFs that load_pages() keeps open between the page windows of a file,
+# keyed by path, modification time and size. Enough for the files an
+# ingestion pipeline has in flight.
+OPEN_PDF_FILES = 8
+_open_pdfs: "OrderedDict[Tuple[str, int, int], _PdfFile]" = OrderedDict()
+_open_pdfs_lock = threading.Lock()
+
 # Re-implement a simple Document class to avoid langchain_core dependency issues
 class Document:
     def __init__(self, page_content: str, metadata: Dict[str, Any]):
@@ -16,6 +46,273 @@ class Document:
     def __repr__(self):
         return f"Document(page_content='{self.page_content[:50]}...', metadata={self.metadata})"
 
+def page_cache() -> Optional[PageCache]:
+    """Return this process's cache of extracted pages, or ``None`` if disabled.
+
+    The cache is enabled by ``PAGE_CACHE_PATH`` and bounded by
+    ``PAGE_CACHE_MB``.
+    """
+    global _page_cache
+    path = os.getenv("PAGE_CACHE_PATH")
+    if not path:
+        return None
+    with _page_cache_lock:
+        if _page_cache is None or _page_cache.path != path:
+            try:
+                max_mb = int(os.getenv("PAGE_CACHE_MB", DEFAULT_PAGE_CACHE_MB))
+            except ValueError:
+                max_mb = DEFAULT_PAGE_CACHE_MB
+            _page_cache = PageCache(path, max_mb * 1024 * 1024, version=LOADER_VERSION)
+        return _page_cache
+
+
+def _env_number(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(f"Invalid {name}={value!r}, using default {default}")
+        return default
+
+
+def http_session() -> requests.Session:
+    """Return this process's pooled HTTP session for loading URLs.
+
+    Reusing one session keeps connections to the same host alive, so
+    loading many pages of one site does not repeat the TCP and TLS handshakes.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=URL_POOL_SIZE, pool_maxsize=URL_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["User-Agent"] = "Mozilla/5.0"
+            _session = session
+        return _session
+
+
+def _download(url: str, headers: Dict[str, str]) -> Tuple[int, bytes, Dict[str, str]]:
+    """GET *url*, returning the status, the body and the response headers.
+
+    The body is streamed and the download is aborted once it exceeds
+    ``DOCUMENT_URL_MAX_MB``; ``DOCUMENT_URL_TIMEOUT`` bounds connecting and
+    every read.
+    """
+    timeout = _env_number("DOCUMENT_URL_TIMEOUT", DEFAULT_URL_TIMEOUT)
+    max_bytes = int(_env_number("DOCUMENT_URL_MAX_MB", DEFAULT_URL_MAX_MB) * 1024 * 1024)
+    with http_session().get(url, headers=headers, timeout=timeout, stream=True) as response:
+        if response.status_code == 304:
+            return 304, b"", dict(response.headers)
+        response.raise_for_status()  # Raise an exception for bad status codes
+        if int(response.headers.get("Content-Length") or 0) > max_bytes:
+            raise ValueError(f"{url} is larger than {max_bytes} bytes")
+        body = bytearray()
+        for block in response.iter_content(DOWNLOAD_CHUNK):
+            body += block
+            if len(body) > max_bytes:
+                raise ValueError(f"{url} is larger than {max_bytes} bytes")
+        return response.status_code, bytes(body), dict(response.headers)
+
+
+def _html_text(content: bytes) -> str:
+    soup = BeautifulSoup(content, 'html.parser')
+    # Extract text from the body, removing script and style tags
+    for script_or_style in soup(["script", "style"]):
+        script_or_style.decompose()
+    return soup.body.get_text(separator='\n', strip=True)
+
+
+def _url_text(url: str) -> str:
+    """Return the text of the web page *url*.
+
+    With the page cache enabled the request is conditional: when the
+    server answers ``304 Not Modified``, the text extracted last time is
+    returned without downloading or parsing the page.
+    """
+    cache = page_cache()
+    validators = None
+    if cache is not None:
+        try:
+            validators = cache.get_validators(url)
+        except sqlite3.Error as e:
+            logger.warning(f"Page cache lookup failed for {url}: {e}")
+            cache = None
+    headers: Dict[str, str] = {}
+    if validators:
+        if validators["etag"]:
+            headers["If-None-Match"] = validators["etag"]
+        if validators["last_modified"]:
+            headers["If-Modified-Since"] = validators["last_modified"]
+    status, content, response_headers = _download(url, headers)
+    if status == 304:
+        texts = cache.get_pages(validators["key"], 0, 1) if cache is not None and validators else None
+        if texts is not None:
+            logger.info(f"{url} is not modified; using the cached text.")
+            return texts[0]
+        # The cached text was evicted meanwhile.
+        status, content, response_headers = _download(url, {})
+    if cache is None:
+        return _html_text(content)
+    key = cache.content_key(content)
+    try:
+        texts = cache.get_pages(key, 0, 1)
+        text = texts[0] if texts is not None else _html_text(content)
+        if texts is None:
+            cache.put_pages(key, 1, {0: text})
+        cache.put_validators(url, key, response_headers.get("ETag"), response_headers.get("Last-Modified"))
+    except sqlite3.Error as e:
+        logger.warning(f"Could not cache the text of {url}: {e}")
+        text = _html_text(content)
+    return text
+
+
+class _PdfFile:
+    """Lazy page access to a PDF, served from the page cache when possible."""
+
+    def __init__(self, source: str):
+        self.source = source
+        self.cache = page_cache()
+        self.key: Optional[str] = None
+        self._file: Optional[Any] = None
+        self._reader: Optional[pypdf.PdfReader] = None
+        total = None
+        if self.cache is not None:
+            try:
+                self.key = self.cache.file_key(source)
+                total = self.cache.page_count(self.key)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning(f"Page cache unavailable for {source}: {e}")
+                self.cache = None
+        self.total = total if total is not None else len(self._open().pages)
+
+    def _open(self) -> pypdf.PdfReader:
+        if self._reader is None:
+            # Given a path, pypdf reads the whole file into memory; an open
+            # file is read on demand instead.
+            self._file = open(self.source, "rb")
+            self._reader = pypdf.PdfReader(self._file)
+        return self._reader
+
+    def close(self) -> None:
+        self._reader = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def pages(self, start: int = 0, end: Optional[int] = None) -> Iterator[Document]:
+        end = self.total if end is None else min(end, self.total)
+        texts = None
+        if self.cache is not None:
+            try:
+                texts = self.cache.get_pages(self.key, start, end)
+            except sqlite3.Error as e:
+                logger.warning(f"Page cache lookup failed for {self.source}: {e}")
+        for i, text in enumerate(texts if texts is not None else self._extract(start, end), start=start):
+            if text:
+                yield Document(page_content=text, metadata={"source": self.source, "page": i + 1})
+
+    def _extract(self, start: int, end: int) -> Iterator[str]:
+        pending: Dict[int, str] = {}
+        for i in range(start, end):
+            # Pages are parsed on access, so only the current one is decoded.
+            pending[i] = self._open().pages[i].extract_text() or ""
+            text = pending[i]
+            if len(pending) >= CACHE_WRITE_PAGES:
+                self._store(pending)
+                pending = {}
+            yield text
+        self._store(pending)
+
+    def _store(self, texts: Dict[int, str]) -> None:
+        if self.cache is None or not texts:
+            return
+        try:
+            self.cache.put_pages(self.key, self.total, texts)
+        except sqlite3.Error as e:
+            logger.warning(f"Could not cache pages of {self.source}: {e}")
+
+
+def iter_document(source: str, start_page: int = 0, end_page: Optional[int] = None) -> Iterator[Document]:
+    """
+    Yield the documents of a file path or URL one at a time.
+
+    PDF pages are extracted lazily, so a caller that processes each page
+    before asking for the next keeps only one page in memory. When the page
+    cache is enabled, pages of a PDF that was extracted before are read
+    from it instead. Other sources yield a single document; URLs are
+    fetched through :func:`http_session` and revalidated against the cache.
+    Unlike :func:`load_document`, errors are raised.
+
+    Args:
+        source: The file path or URL to load.
+        start_page: First PDF page to yield (0-based).
+        end_page: PDF page to stop before; ``None`` for the last page.
+    """
+    if source.startswith(('http://', 'https://')):
+        # It's a URL
+        if start_page:
+            return
+        yield Document(page_content=_url_text(source), metadata={"source": source})
+
+    elif source.lower().endswith('.pdf'):
+        # It's a PDF file
+        pdf = _PdfFile(source)
+        try:
+            yield from pdf.pages(start_page, end_page)
+        finally:
+            pdf.close()
+
+    elif source.lower().endswith('.docx'):
+        # It's a Word document
+        if start_page:
+            return
+        document = docx.Document(source)
+        text = "\n".join(para.text for para in document.paragraphs)
+        yield Document(page_content=text, metadata={"source": source})
+
+    else:
+        raise ValueError(f"Unsupported source type: {source}")
+
+
+def load_pages(source: str, start: int, count: int) -> Tuple[List[Document], bool]:
+    """
+    Load ``count`` pages of *source* starting at page *start* (0-based).
+
+    Returns the documents and whether more pages follow. Sources without
+    pages are returned whole for ``start == 0``. Errors are raised.
+
+    A PDF stays open until its last window is loaded, so a file read in
+    many windows is opened and its page tree built only once per process.
+    """
+    if source.lower().endswith('.pdf') and not source.startswith(('http://', 'https://')):
+        stat = os.stat(source)
+        key = (os.path.abspath(source), stat.st_mtime_ns, stat.st_size)
+        with _open_pdfs_lock:
+            # Taken out while in use, so a PDF is never read by two threads.
+            pdf = _open_pdfs.pop(key, None)
+        if pdf is None:
+            pdf = _PdfFile(source)
+        try:
+            docs = list(pdf.pages(start, start + count))
+        except BaseException:
+            pdf.close()
+            raise
+        more = start + count < pdf.total
+        if not more:
+            pdf.close()
+            return docs, more
+        with _open_pdfs_lock:
+            _open_pdfs[key] = pdf
+            while len(_open_pdfs) > OPEN_PDF_FILES:
+                _open_pdfs.popitem(last=False)[1].close()
+        return docs, more
+    return list(iter_document(source, start_page=start)), False
+
+
 def load_document(source: str) -> List[Document]:
     """
     Load documents from a file path or URL using basic libraries.
@@ -27,42 +324,8 @@ def load_document(source: str) -> List[Document]:
     Returns:
         A list of Document objects.
     """
-    docs = []
     try:
-        if source.startswith(('http://', 'https://')):
-            # It's a URL
-            response = requests.get(source, headers={'User-Agent': 'Mozilla/5.0'})
-            response.raise_for_status()  # Raise an exception for bad status codes
-            soup = BeautifulSoup(response.content, 'html.parser')
-            # Extract text from the body, removing script and style tags
-            for script_or_style in soup(["script", "style"]):
-                script_or_style.decompose()
-            text = soup.body.get_text(separator='\\n', strip=True)
-            metadata = {"source": source}
-            docs.append(Document(page_content=text, metadata=metadata))
-
-        elif source.lower().endswith('.pdf'):
-            # It's a PDF file
-            reader = pypdf.PdfReader(source)
-            for i, page in enumerate(reader.pages):
-                text = page.extract_text()
-                if text:
-                    metadata = {"source": source, "page": i + 1}
-                    docs.append(Document(page_content=text, metadata=metadata))
-
-        elif source.lower().endswith('.docx'):
-            # It's a Word document
-            document = docx.Document(source)
-            full_text = []
-            for para in document.paragraphs:
-                full_text.append(para.text)
-            text = "\\n".join(full_text)
-            metadata = {"source": source}
-            docs.append(Document(page_content=text, metadata=metadata))
-
-        else:
-            raise ValueError(f"Unsupported source type: {source}")
-
+        docs = list(iter_document(source))
         logger.info(f"Successfully loaded {len(docs)} document(s) from {source}")
         return docs
 
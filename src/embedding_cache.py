@@ -0,0 +1,194 @@
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """SQLite-backed store of embedding vectors.
+
+    Vectors are keyed by ``(model, sha256(text))`` and stored as raw float32
+    blobs, so a 1536-dim embedding takes about 6 KB on disk. Pass
+    ``":memory:"`` as *path* for a cache that lives only in this process.
+    """
+
+    def __init__(self, path: str = ":memory:") -> None:
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, "
+            "text_hash TEXT NOT NULL, "
+            "vector BLOB NOT NULL, "
+            "PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Return cached vectors for *texts*, with ``None`` for misses."""
+        hashes = [self.text_hash(t) for t in texts]
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            unique = list(dict.fromkeys(hashes))
+            # Stay below SQLite's default bound-parameter limit.
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32)
+            results = [found.get(h) for h in hashes]
+            hit_count = sum(r is not None for r in results)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+        return results
+
+    def put_many(self, model: str, texts: List[str], vectors: np.ndarray) -> None:
+        """Store *vectors* for *texts* under *model*."""
+        rows = [
+            (model, self.text_hash(t), np.asarray(v, dtype=np.float32).tobytes())
+            for t, v in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters and the hit rate."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class QueryEmbeddingCache:
+    """Bounded in-memory LRU of query embeddings with a time-to-live.
+
+    Queries are normalized (NFKC, case and whitespace folded) before lookup.
+    Concurrent misses for the same query are coalesced: the first caller
+    computes the embedding and the others wait for its result, so only one
+    request per query is in flight.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600.0) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries: "OrderedDict[str, Tuple[float, np.ndarray]]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        text = unicodedata.normalize("NFKC", text).lower()
+        return re.sub(r"\s+", " ", text).strip()
+
+    def get_or_compute(self, text: str, compute: Callable[[str], np.ndarray]) -> np.ndarray:
+        """Return the embedding of *text*, calling ``compute(normalized)`` on a miss."""
+        return self.get_many([text], lambda keys: [compute(keys[0])])[0]
+
+    def get_many(
+        self, texts: List[str], compute_many: Callable[[List[str]], Sequence[np.ndarray]]
+    ) -> List[np.ndarray]:
+        """Return embeddings for *texts*, computing all misses in one call.
+
+        ``compute_many`` receives the normalized texts that are neither cached
+        nor already being computed by another thread.
+        """
+        keys = [self.normalize(t) for t in texts]
+        results: List[Optional[np.ndarray]] = [None] * len(keys)
+        owned: Dict[str, Future] = {}
+        waiting: Dict[str, Future] = {}
+        with self._lock:
+            now = time.monotonic()
+            for i, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None:
+                    if now - entry[0] <= self.ttl:
+                        self._entries.move_to_end(key)
+                        self.hits += 1
+                        results[i] = entry[1]
+                        continue
+                    del self._entries[key]
+                if key in owned or key in waiting:
+                    self.coalesced += 1
+                elif key in self._inflight:
+                    waiting[key] = self._inflight[key]
+                    self.coalesced += 1
+                else:
+                    owned[key] = self._inflight[key] = Future()
+                    self.misses += 1
+
+        if owned:
+            try:
+                vectors = list(compute_many(list(owned)))
+            except BaseException as exc:
+                with self._lock:
+                    for key in owned:
+                        self._inflight.pop(key, None)
+                for future in owned.values():
+                    future.set_exception(exc)
+                raise
+            with self._lock:
+                now = time.monotonic()
+                for key, vector in zip(owned, vectors):
+                    self._entries[key] = (now, vector)
+                    self._inflight.pop(key, None)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+            for future, vector in zip(owned.values(), vectors):
+                future.set_result(vector)
+
+        for i, key in enumerate(keys):
+            if results[i] is None:
+                results[i] = (owned.get(key) or waiting[key]).result()
+        return results
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit, miss and coalesced counters and the hit rate."""
+        with self._lock:
+            total = self.hits + self.misses + self.coalesced
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "size": len(self._entries),
+                "hit_rate": (self.hits + self.coalesced) / total if total else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,252 @@
+"""Headless bulk ingestion of a document folder into a saved vector store.
+
+Usage::
+
+    python -m src.ingest /share/policies --store vector_store
+
+The first run indexes every matching file below the folder. Later runs
+compare each file's size and mtime, and its SHA-256 when those changed, with
+``sync.json`` in the store directory. Only new and changed files are
+ingested, through :class:`~src.ingestion.IngestionPipeline`, and deleted
+files are removed from the store, so a nightly re-sync touches only what
+changed. Files that fail are left out of ``sync.json`` and retried on the
+next run.
+"""
+
+from __future__ import annotations
+
+import argparse
+import fnmatch
+import hashlib
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Tuple
+
+from dotenv import load_dotenv
+
+from src.ingestion import IngestionPipeline, IngestionStats
+from src.logging_utils import setup_logging
+from src.vector_store_manager import VectorStoreManager
+
+logger = logging.getLogger(__name__)
+
+SYNC_FILE = "sync.json"
+DEFAULT_PATTERNS = ("*.pdf", "*.docx")
+HASH_WORKERS = 8
+
+
+@dataclass
+class SyncPlan:
+    """Differences between a folder and the files recorded in ``sync.json``."""
+
+    added: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    # Files that exist but could not be read; their previous state is kept.
+    unreadable: List[str] = field(default_factory=list)
+    unchanged: int = 0
+    # ``{"size", "mtime_ns", "sha256"}`` of every file currently in the folder.
+    entries: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+    def summary(self) -> str:
+        return (
+            f"{len(self.added)} new, {len(self.changed)} changed, "
+            f"{len(self.removed)} deleted, {self.unchanged} unchanged"
+            + (f", {len(self.unreadable)} unreadable" if self.unreadable else "")
+        )
+
+
+def scan(root: str, patterns: Iterable[str] = DEFAULT_PATTERNS) -> List[str]:
+    """Return the absolute paths below *root* whose names match *patterns*."""
+    patterns = [p.lower() for p in patterns]
+    paths = []
+    for directory, _, names in os.walk(os.path.abspath(root)):
+        for name in names:
+            if any(fnmatch.fnmatch(name.lower(), p) for p in patterns):
+                paths.append(os.path.join(directory, name))
+    return sorted(paths)
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def plan_sync(
+    root: str,
+    previous: Dict[str, Dict[str, Any]],
+    patterns: Iterable[str] = DEFAULT_PATTERNS,
+) -> SyncPlan:
+    """Compare the files below *root* with the *previous* ``sync.json`` entries.
+
+    Files whose size and mtime are unchanged are not read. The others are
+    hashed in parallel, so a file that was only touched or copied back is
+    not ingested again. A file that is listed but cannot be read, e.g.
+    because it is locked, keeps its previous entry and is retried on the
+    next sync instead of being treated as deleted.
+    """
+    plan = SyncPlan()
+    to_hash: List[Tuple[str, Dict[str, Any]]] = []
+    for path in scan(root, patterns):
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            logger.warning(f"Skipping {path}: {e}")
+            plan.unreadable.append(path)
+            continue
+        entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        old = previous.get(path)
+        if old and old.get("size") == entry["size"] and old.get("mtime_ns") == entry["mtime_ns"]:
+            plan.entries[path] = dict(old)
+            plan.unchanged += 1
+        else:
+            to_hash.append((path, entry))
+    with ThreadPoolExecutor(max_workers=HASH_WORKERS) as pool:
+        hashes = list(pool.map(lambda item: _try_hash(item[0]), to_hash))
+    for (path, entry), digest in zip(to_hash, hashes):
+        if digest is None:
+            plan.unreadable.append(path)
+            continue
+        entry["sha256"] = digest
+        plan.entries[path] = entry
+        old = previous.get(path)
+        if old is None:
+            plan.added.append(path)
+        elif old.get("sha256") == digest:
+            plan.unchanged += 1
+        else:
+            plan.changed.append(path)
+    for path in plan.unreadable:
+        if path in previous:
+            plan.entries[path] = dict(previous[path])
+    plan.removed = sorted(set(previous) - set(plan.entries))
+    return plan
+
+
+def _try_hash(path: str) -> str | None:
+    try:
+        return file_hash(path)
+    except OSError as e:
+        logger.warning(f"Skipping {path}: {e}")
+        return None
+
+
+def load_sync_state(store_dir: str) -> Dict[str, Dict[str, Any]]:
+    path = os.path.join(store_dir, SYNC_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("files", {})
+
+
+def save_sync_state(store_dir: str, entries: Dict[str, Dict[str, Any]]) -> None:
+    os.makedirs(store_dir, exist_ok=True)
+    path = os.path.join(store_dir, SYNC_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"files": entries}, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def sync_directory(
+    manager: VectorStoreManager,
+    root: str,
+    store_dir: str,
+    *,
+    patterns: Iterable[str] = DEFAULT_PATTERNS,
+    dry_run: bool = False,
+    **pipeline_options: Any,
+) -> Tuple[SyncPlan, IngestionStats]:
+    """Bring the store in *store_dir* up to date with the files below *root*.
+
+    *manager* should hold the store loaded from *store_dir*; it is saved
+    there afterwards together with the updated ``sync.json``.
+    *pipeline_options* are passed to :class:`IngestionPipeline`.
+    """
+    plan = plan_sync(root, load_sync_state(store_dir), patterns)
+    logger.info(f"Sync plan for {root}: {plan.summary()}.")
+    if dry_run:
+        return plan, IngestionStats()
+
+    for source in plan.removed:
+        removed = manager.remove_source(source)
+        logger.info(f"Removed {removed} chunks of deleted file {source}.")
+    sources = plan.added + plan.changed
+    stats = IngestionStats()
+    if sources:
+        stats = IngestionPipeline(manager, **pipeline_options).run(sources)
+    failed = {source for source, _ in stats.errors}
+    if "index" in failed:
+        # Chunks of any file may be missing, so try them all again next time.
+        failed.update(sources)
+    entries = {path: entry for path, entry in plan.entries.items() if path not in failed}
+    if manager.is_dirty():
+        manager.save(store_dir)
+    save_sync_state(store_dir, entries)
+    return plan, stats
+
+
+def parse_args(args: list[str] | None = None) -> argparse.Namespace:
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Index a folder of documents into a vector store")
+    parser.add_argument("root", help="Folder to ingest, searched recursively")
+    parser.add_argument(
+        "--store",
+        default=os.getenv("VECTOR_STORE_DIR"),
+        help="Vector store directory (defaults to VECTOR_STORE_DIR)",
+    )
+    parser.add_argument(
+        "--pattern",
+        action="append",
+        help="File name pattern to ingest; may be repeated (default: *.pdf and *.docx)",
+    )
+    parser.add_argument("--parse-workers", type=int, help="Processes that extract text (INGEST_PARSE_WORKERS)")
+    parser.add_argument("--embed-workers", type=int, help="Threads that request embeddings")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    parser.add_argument("--log-file", help="Write logs to the specified file (overrides AGENT_LOG_FILE)")
+    parser.add_argument("--verbose", action="store_true", help="Enable debug logging")
+    parsed = parser.parse_args(args)
+    if not parsed.store:
+        parser.error("--store is required when VECTOR_STORE_DIR is not set")
+    return parsed
+
+
+def main(argv: list[str] | None = None) -> int:
+    load_dotenv()
+    args = parse_args(argv)
+    setup_logging(level=logging.DEBUG if args.verbose else None, log_file=args.log_file)
+    manager = VectorStoreManager(openai_api_key=os.getenv("OPENAI_API_KEY"))
+    if os.path.exists(os.path.join(args.store, VectorStoreManager.MANIFEST_FILE)):
+        manager.load(args.store)
+    plan, stats = sync_directory(
+        manager,
+        args.root,
+        args.store,
+        patterns=args.pattern or DEFAULT_PATTERNS,
+        dry_run=args.dry_run,
+        parse_workers=args.parse_workers,
+        embed_workers=args.embed_workers,
+        progress=lambda s: logger.info(s.summary()),
+        progress_interval=5.0,
+    )
+    print(f"Files: {plan.summary()}")
+    if args.dry_run:
+        for label, paths in (("new", plan.added), ("changed", plan.changed), ("deleted", plan.removed)):
+            for path in paths:
+                print(f"  {label}: {path}")
+        return 0
+    print(f"Ingested: {stats.summary()}")
+    for source, message in stats.errors:
+        print(f"Failed: {source}: {message}", file=sys.stderr)
+    return 1 if stats.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,380 @@
+"""Staged ingestion of many documents into a :class:`~src.vector_store_manager.VectorStoreManager`.
+
+Documents flow through four stages connected by bounded queues::
+
+    parse (process pool) -> chunk -> embed (thread pool) -> index
+
+Parsing is CPU-bound and holds the GIL, so it runs in worker processes.
+Each task parses a window of ``pages_per_task`` pages, and the chunk stage
+splits every file incrementally as its windows arrive, so a long PDF never
+sits in memory whole and its first chunks are indexed while later pages are
+still being parsed. Embedding waits on the API and runs on a small thread
+pool. When a later stage falls behind, its full input queue blocks the stage
+before it, so memory stays bounded however many files are queued.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from src.document_loader import load_pages
+from src.vector_store_manager import ChunkStore, VectorStoreManager, _env_int
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+# Sent down a file's feed when one of its page windows could not be parsed.
+_FAILED = object()
+
+
+@dataclass
+class IngestionStats:
+    """Aggregate progress of an :class:`IngestionPipeline` run."""
+
+    files_total: int = 0
+    files_done: int = 0
+    pages: int = 0
+    chunks: int = 0
+    embedded: int = 0
+    indexed: int = 0
+    # ``(source, message)`` for every file or batch that failed.
+    errors: List[Tuple[str, str]] = field(default_factory=list)
+
+    def summary(self) -> str:
+        return (
+            f"ファイル {self.files_done}/{self.files_total}・ページ {self.pages}・"
+            f"チャンク {self.chunks}・埋め込み {self.embedded}・登録 {self.indexed}"
+        )
+
+
+@dataclass
+class _Replacement:
+    """Progress of re-ingesting a source that is already indexed."""
+
+    # Ids of the chunks indexed before, by chunk key.
+    old: Dict[str, int]
+    seen: Set[str] = field(default_factory=set)
+    # Batches forwarded to the embed stage and not indexed yet.
+    outstanding: int = 0
+    chunked: bool = False
+    failed: bool = False
+
+
+class IngestionPipeline:
+    """Load, chunk, embed and index many sources with bounded concurrency.
+
+    *progress* is called with a copy of the :class:`IngestionStats` at most
+    every *progress_interval* seconds and once more when the run finishes.
+    Sources that are already indexed go through the same stages: only new
+    or edited chunks are embedded, unchanged chunks keep their vectors and
+    take the new metadata, and chunks that are gone are removed once every
+    new chunk of the source is indexed. If any of them fails, the old
+    chunks are kept.
+
+    *loader* is called as ``loader(source, start, count)`` in a worker and
+    returns the documents of that page window and whether more pages follow,
+    like :func:`src.document_loader.load_pages`.
+    """
+
+    DEFAULT_QUEUE_SIZE = 8
+    DEFAULT_PAGES_PER_TASK = 16
+    PROGRESS_INTERVAL = 0.2
+
+    def __init__(
+        self,
+        manager: VectorStoreManager,
+        *,
+        parse_workers: Optional[int] = None,
+        embed_workers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        progress: Optional[Callable[[IngestionStats], None]] = None,
+        loader: Callable[[str, int, int], Tuple[List[Any], bool]] = load_pages,
+        use_processes: bool = True,
+        progress_interval: float = PROGRESS_INTERVAL,
+        pages_per_task: Optional[int] = None,
+    ) -> None:
+        self.manager = manager
+        self.parse_workers = parse_workers or _env_int("INGEST_PARSE_WORKERS", min(4, os.cpu_count() or 1))
+        self.embed_workers = embed_workers or manager.max_workers
+        self.queue_size = queue_size or _env_int("INGEST_QUEUE_SIZE", self.DEFAULT_QUEUE_SIZE)
+        self.batch_size = batch_size or manager.batch_size
+        self.pages_per_task = pages_per_task or _env_int("INGEST_PAGES_PER_TASK", self.DEFAULT_PAGES_PER_TASK)
+        self.progress = progress
+        self.loader = loader
+        self.use_processes = use_processes
+        self.progress_interval = progress_interval
+        self.stats = IngestionStats()
+        self._stats_lock = threading.Lock()
+        self._last_report = 0.0
+        self._replacements: Dict[str, _Replacement] = {}
+
+    def _update(self, force: bool = False, **increments: int) -> None:
+        with self._stats_lock:
+            for name, value in increments.items():
+                setattr(self.stats, name, getattr(self.stats, name) + value)
+            now = time.monotonic()
+            if self.progress is None or (not force and now - self._last_report < self.progress_interval):
+                return
+            self._last_report = now
+            snapshot = IngestionStats(**asdict(self.stats))
+        self.progress(snapshot)
+
+    def _error(self, source: str, message: str) -> None:
+        logger.warning(f"Ingestion of {source} failed: {message}")
+        with self._stats_lock:
+            self.stats.errors.append((source, message))
+
+    def run(self, sources: Iterable[str]) -> IngestionStats:
+        """Ingest *sources* and return the final statistics."""
+        sources = list(dict.fromkeys(sources))
+        self.stats = IngestionStats(files_total=len(sources))
+        parsed: "queue.Queue[Any]" = queue.Queue(self.queue_size)
+        chunked: "queue.Queue[Any]" = queue.Queue(self.queue_size)
+        embedded: "queue.Queue[Any]" = queue.Queue(self.queue_size)
+        threads = [
+            threading.Thread(target=self._parse_stage, args=(sources, parsed), name="ingest-parse", daemon=True),
+            threading.Thread(target=self._chunk_stage, args=(parsed, chunked), name="ingest-chunk", daemon=True),
+        ]
+        threads += [
+            threading.Thread(target=self._embed_stage, args=(chunked, embedded), name=f"ingest-embed-{n}", daemon=True)
+            for n in range(self.embed_workers)
+        ]
+        for thread in threads:
+            thread.start()
+        self._index_stage(embedded)
+        for thread in threads:
+            thread.join()
+        self._update(force=True)
+        logger.info(f"Ingestion finished: {self.stats.summary()}, {len(self.stats.errors)} errors.")
+        return self.stats
+
+    def _parse_stage(self, sources: List[str], parsed: queue.Queue) -> None:
+        executor_class = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+        try:
+            with executor_class(max_workers=self.parse_workers) as pool:
+                pending: Set[Future] = set()
+                owners: Dict[Future, Tuple[str, int]] = {}
+                pages: Dict[str, int] = {}
+
+                def submit(source: str, start: int) -> None:
+                    future = pool.submit(self.loader, source, start, self.pages_per_task)
+                    owners[future] = (source, start)
+                    pending.add(future)
+
+                remaining = iter(sources)
+                while True:
+                    # Keep at most two files per worker in flight. The windows
+                    # of one file are parsed in order, one at a time.
+                    while len(pending) < 2 * self.parse_workers:
+                        source = next(remaining, None)
+                        if source is None:
+                            break
+                        pages[source] = 0
+                        submit(source, 0)
+                    if not pending:
+                        break
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        source, start = owners.pop(future)
+                        failed = False
+                        try:
+                            docs, more = future.result()
+                        except Exception as e:
+                            self._error(source, str(e))
+                            docs, more, failed = [], False, True
+                        else:
+                            pages[source] += len(docs)
+                            if not more and not pages[source]:
+                                self._error(source, "テキストを抽出できませんでした。")
+                        if more:
+                            submit(source, start + self.pages_per_task)
+                        else:
+                            del pages[source]
+                        self._update(pages=len(docs))
+                        # Blocks while the chunk stage is behind.
+                        parsed.put((source, docs, not more, failed))
+        except Exception as e:
+            logger.error(f"Parse stage failed: {e}", exc_info=True)
+        finally:
+            parsed.put(_DONE)
+
+    def _chunk_stage(self, parsed: queue.Queue, chunked: queue.Queue) -> None:
+        # Every file is split on its own thread, which reads the file's page
+        # windows from a feed queue as they arrive.
+        feeds: Dict[str, queue.Queue] = {}
+        workers: Dict[str, threading.Thread] = {}
+        fed: List[threading.Thread] = []
+        try:
+            while (item := parsed.get()) is not _DONE:
+                source, docs, last, failed = item
+                feed = feeds.get(source)
+                if feed is None:
+                    if not docs and last:
+                        self._update(files_done=1)
+                        continue
+                    # Fully fed files finish without this thread's help, so
+                    # waiting for them bounds the number of splitter threads.
+                    while len(fed) >= self.parse_workers:
+                        fed.pop(0).join()
+                    feed = feeds[source] = queue.Queue(self.queue_size)
+                    worker = workers[source] = threading.Thread(
+                        target=self._chunk_file, args=(source, feed, chunked), name="ingest-chunk-file", daemon=True
+                    )
+                    worker.start()
+                if docs:
+                    feed.put(docs)
+                if failed:
+                    feed.put(_FAILED)
+                if last:
+                    feed.put(_DONE)
+                    del feeds[source]
+                    fed.append(workers.pop(source))
+        except Exception as e:
+            logger.error(f"Chunk stage failed: {e}", exc_info=True)
+        finally:
+            for feed in feeds.values():
+                feed.put(_DONE)
+            for worker in fed + list(workers.values()):
+                worker.join()
+            for _ in range(self.embed_workers):
+                chunked.put(_DONE)
+
+    def _chunk_file(self, source: str, feed: queue.Queue, chunked: queue.Queue) -> None:
+        parse_failed = False
+
+        def pages() -> Iterator[Any]:
+            nonlocal parse_failed
+            for window in iter(feed.get, _DONE):
+                if window is _FAILED:
+                    parse_failed = True
+                else:
+                    yield from window
+
+        docs = pages()
+        replacement = None
+        try:
+            if source in self.manager.sources():
+                replacement = _Replacement(self.manager.source_keys(source))
+                with self._stats_lock:
+                    self._replacements[source] = replacement
+            batch: List[Any] = []
+            for chunk in self.manager.text_splitter.iter_split_documents(docs):
+                batch.append(chunk)
+                if len(batch) >= self.batch_size:
+                    self._forward_chunks(source, batch, chunked, replacement)
+                    batch = []
+            if batch:
+                self._forward_chunks(source, batch, chunked, replacement)
+        except Exception as e:
+            self._error(source, str(e))
+            if replacement is not None:
+                replacement.failed = True
+            # Drain the feed so the chunk stage never blocks on it.
+            for _ in docs:
+                pass
+        finally:
+            if replacement is not None:
+                with self._stats_lock:
+                    # A file that stopped parsing partway has lost chunks it
+                    # still contains, so its old chunks must stay.
+                    replacement.failed |= parse_failed
+                    replacement.chunked = True
+                self._finish_replacement(source)
+            self._update(files_done=1)
+
+    def _forward_chunks(
+        self, source: str, batch: List[Any], chunked: queue.Queue, replacement: Optional[_Replacement]
+    ) -> None:
+        if replacement is not None:
+            unchanged = {}
+            for chunk in batch:
+                key = ChunkStore.key_for(chunk)
+                replacement.seen.add(key)
+                if key in replacement.old:
+                    unchanged[replacement.old[key]] = chunk
+            if unchanged:
+                self.manager.update_metadata(unchanged)
+        chunks = self.manager.new_chunks(batch)
+        if chunks:
+            self._update(chunks=len(chunks))
+            if replacement is not None:
+                with self._stats_lock:
+                    replacement.outstanding += 1
+            # Blocks while the embed stage is behind.
+            chunked.put((source, chunks))
+
+    def _batch_done(self, source: str, failed: bool = False) -> None:
+        """Record that a forwarded batch of *source* was indexed or dropped."""
+        replacement = self._replacements.get(source)
+        if replacement is not None:
+            with self._stats_lock:
+                replacement.outstanding -= 1
+                replacement.failed |= failed
+            self._finish_replacement(source)
+
+    def _finish_replacement(self, source: str) -> None:
+        """Remove the chunks *source* no longer has once its new chunks are indexed."""
+        with self._stats_lock:
+            replacement = self._replacements.get(source)
+            if replacement is None or not replacement.chunked or replacement.outstanding:
+                return
+            del self._replacements[source]
+        if replacement.failed:
+            logger.warning(f"Keeping the previous chunks of {source} because its ingestion failed.")
+            return
+        stale = [doc_id for key, doc_id in replacement.old.items() if key not in replacement.seen]
+        try:
+            removed = self.manager.remove_chunks(stale)
+        except Exception as e:
+            self._error(source, str(e))
+            return
+        logger.info(f"Removed {removed} chunks that {source} no longer contains.")
+
+    def _embed_stage(self, chunked: queue.Queue, embedded: queue.Queue) -> None:
+        try:
+            while (item := chunked.get()) is not _DONE:
+                source, batch = item
+                try:
+                    vectors = self.manager.embed_chunks(batch)
+                except Exception as e:
+                    self._error(source, f"埋め込みに失敗しました: {e}")
+                    self._batch_done(source, failed=True)
+                    continue
+                self._update(embedded=len(batch))
+                embedded.put((source, batch, vectors))
+        finally:
+            embedded.put(_DONE)
+
+    def _index_stage(self, embedded: queue.Queue) -> None:
+        finished = 0
+        while finished < self.embed_workers:
+            items = [embedded.get()]
+            # Every insert briefly locks out searches, so insert everything
+            # that is already waiting in one step.
+            while True:
+                try:
+                    items.append(embedded.get_nowait())
+                except queue.Empty:
+                    break
+            batches = [item for item in items if item is not _DONE]
+            finished += len(items) - len(batches)
+            if not batches:
+                continue
+            chunks = [chunk for _, batch, _ in batches for chunk in batch]
+            vectors = np.vstack([v for _, _, v in batches])
+            failed = False
+            try:
+                self._update(indexed=self.manager.insert_chunks(chunks, vectors))
+            except Exception as e:
+                self._error("index", str(e))
+                failed = True
+            for source, _, _ in batches:
+                self._batch_done(source, failed)
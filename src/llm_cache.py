@@ -0,0 +1,139 @@
+"""Persistent cache of chat completions for :func:`src.main.create_llm`.
+
+The cache is opt-in and configured with environment variables:
+
+* ``LLM_CACHE_PATH`` – SQLite file holding the responses
+* ``LLM_CACHE_MODE`` – ``readwrite`` (default) or ``replay``; replay only
+  reads the cache and fails on a miss, so offline runs are deterministic
+* ``LLM_CACHE_TTL`` – seconds before an entry expires (default ``0``, never)
+* ``LLM_CACHE_MAX_ENTRIES`` – size cap; the oldest entries are dropped first
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+MODES = ("readwrite", "replay")
+DEFAULT_MAX_ENTRIES = 100_000
+
+
+class CacheMiss(RuntimeError):
+    """Raised in replay mode when a request has no cached response."""
+
+
+class LLMCache:
+    """SQLite-backed store of completion texts keyed by the full request.
+
+    The key is the SHA-256 of the request serialized as canonical JSON, so
+    it covers the endpoint, model, messages and every sampling parameter.
+    Lookups are a single primary-key read and never write, which keeps a hit
+    in the tens of microseconds. A *readonly* cache is opened read-only and
+    ignores *ttl*, so a recorded run replays exactly.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: Optional[float] = None,
+        max_entries: Optional[int] = DEFAULT_MAX_ENTRIES,
+        readonly: bool = False,
+    ) -> None:
+        self.path = path
+        self.ttl = ttl or None
+        self.max_entries = max_entries
+        self.readonly = readonly
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if readonly:
+            self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            return
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, "
+            "response TEXT NOT NULL, "
+            "created REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses (created)")
+        self._conn.commit()
+
+    @staticmethod
+    def request_key(request: Dict[str, Any]) -> str:
+        payload = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for *key*, or ``None``."""
+        with self._lock:
+            row = self._conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and not self.readonly and self.ttl and time.time() - row[1] > self.ttl:
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        if self.readonly:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created) VALUES (?, ?, ?)",
+                (key, response, time.time()),
+            )
+            if self.max_entries:
+                (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+                if count > self.max_entries:
+                    self._conn.execute(
+                        "DELETE FROM responses WHERE key IN "
+                        "(SELECT key FROM responses ORDER BY created LIMIT ?)",
+                        (count - self.max_entries,),
+                    )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters and the hit rate."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def cache_from_env() -> Optional[LLMCache]:
+    """Return the cache configured by ``LLM_CACHE_*``, or ``None`` if disabled."""
+    path = os.getenv("LLM_CACHE_PATH")
+    if not path:
+        return None
+    mode = os.getenv("LLM_CACHE_MODE", "readwrite").lower()
+    if mode not in MODES:
+        logger.warning("Invalid LLM_CACHE_MODE=%s, using readwrite", mode)
+        mode = "readwrite"
+    try:
+        ttl = float(os.getenv("LLM_CACHE_TTL", "0"))
+    except ValueError:
+        logger.warning("Invalid LLM_CACHE_TTL=%s, entries will not expire", os.getenv("LLM_CACHE_TTL"))
+        ttl = 0.0
+    try:
+        max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", str(DEFAULT_MAX_ENTRIES)))
+    except ValueError:
+        logger.warning("Invalid LLM_CACHE_MAX_ENTRIES, using %d", DEFAULT_MAX_ENTRIES)
+        max_entries = DEFAULT_MAX_ENTRIES
+    return LLMCache(path, ttl=ttl, max_entries=max_entries, readonly=mode == "replay")
@@ -4,12 +4,19 @@ import argparse
 import os
 import logging
 import sys
+from contextlib import ExitStack
+from dataclasses import dataclass
+from typing import Iterator
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 from .logging_utils import setup_logging
+from .llm_cache import CacheMiss, LLMCache, cache_from_env
+from .rate_limiter import INTERACTIVE, get_rate_limiter
+from .retry import LatencyTracker, acall_with_retries, call_with_retries
+from .text_splitter import estimate_tokens
 
-from src.agent import ReActAgent, CoTAgent, ToTAgent, PresentationAgent
+from src.agent import ReActAgent, CoTAgent, ToTAgent, PresentationAgent, Delta
 from src.tools import get_default_tools
 from src.memory import ConversationMemory
 from src.vector_memory import VectorMemory
@@ -72,18 +79,94 @@ def read_tot_env() -> tuple[int | None, int | None]:
     return depth_val, breadth_val
 
 
-def create_llm(*, log_usage: bool = False, model: str | None = None) -> callable:
-    """Create an OpenAI completion callable.
+# Request latencies per model, shared by all callables for hedging.
+_LATENCIES: dict[str, LatencyTracker] = {}
 
-    Parameters
-    ----------
-    log_usage: bool
-        If True, token usage and estimated cost from the OpenAI API response
-        will be logged.
+
+def read_retry_env() -> tuple[int, float | None, bool]:
+    """Return retries, deadline and whether to hedge from the environment.
+
+    ``OPENAI_MAX_RETRIES`` (default ``3``), ``OPENAI_DEADLINE`` in seconds
+    (default ``0``, none) and ``OPENAI_HEDGE`` (``1`` to enable). Invalid
+    values are logged and replaced by the defaults.
     """
+    retries_str = os.getenv("OPENAI_MAX_RETRIES", "3")
+    try:
+        max_retries = int(retries_str)
+        if max_retries < 0:
+            raise ValueError
+    except ValueError:
+        logger.warning("Invalid OPENAI_MAX_RETRIES=%s, using default 3", retries_str)
+        max_retries = 3
+    deadline_str = os.getenv("OPENAI_DEADLINE", "0")
+    try:
+        deadline = float(deadline_str) or None
+    except ValueError:
+        logger.warning("Invalid OPENAI_DEADLINE=%s, using no deadline", deadline_str)
+        deadline = None
+    hedge = os.getenv("OPENAI_HEDGE", "0").lower() in ("1", "true", "yes", "on")
+    return max_retries, deadline, hedge
+
+
+@dataclass
+class _LLMSettings:
+    """Configuration shared by :func:`create_llm` and :func:`create_async_llm`."""
+
+    model: str
+    cache: LLMCache | None
+    replay: bool
+    token_price: float
+    timeout: float | None
+    base_url: str | None
+    client_params: dict
+    max_retries: int
+    deadline: float | None
+    tracker: LatencyTracker | None
+
+    def cached(self, prompt: str) -> tuple[dict, str | None, str | None]:
+        """Return the request parameters, cache key and any cached answer."""
+        params = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+        }
+        if self.cache is None:
+            return params, None, None
+        # The timeout does not change the answer, so it is not part of the key.
+        key = self.cache.request_key({"base_url": self.base_url, **params})
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.debug("LLM cache hit for %s", key[:12])
+            return params, key, cached
+        if self.replay:
+            raise CacheMiss(f"No cached response for request {key[:12]} in replay mode")
+        return params, key, None
+
+    def log_usage(self, usage) -> None:
+        try:
+            total = usage.total_tokens
+        except Exception as exc:
+            logger.warning("Failed to read token usage: %s", exc)
+        else:
+            cost = total * self.token_price
+            logger.info("Tokens used: %s | Cost: $%.4f", total, cost)
+
+    def finish(self, resp, key: str | None, log_usage: bool) -> str:
+        """Log usage, store the answer in the cache and return it."""
+        if log_usage and getattr(resp, "usage", None):
+            self.log_usage(resp.usage)
+        content = resp.choices[0].message.content
+        if key is not None and content is not None:
+            self.cache.put(key, content)
+        return content
+
+
+def _llm_settings(model: str | None, cache: LLMCache | None) -> _LLMSettings:
     load_dotenv()
+    if cache is None:
+        cache = cache_from_env()
+    replay = cache is not None and cache.readonly
     api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
+    if not api_key and not replay:
         raise RuntimeError("OPENAI_API_KEY not set")
     model = model or os.getenv("OPENAI_MODEL", "gpt-4.1-mini-2025-04-14")
     token_price = float(os.getenv("OPENAI_TOKEN_PRICE", "0"))
@@ -94,28 +177,170 @@ def create_llm(*, log_usage: bool = False, model: str | None = None) -> callable
         logger.warning("Invalid OPENAI_TIMEOUT=%s, using default", timeout_str)
         timeout = None
     base_url = os.getenv("OPENAI_BASE_URL")
-    client_params = {"api_key": api_key}
+    # Retries belong to call_with_retries: SDK retries would overrun the
+    # deadline and hide 429s from the rate limiter.
+    client_params = {"api_key": api_key, "max_retries": 0}
     if base_url:
         client_params["base_url"] = base_url
-    client = OpenAI(**client_params)
+    max_retries, deadline, hedge = read_retry_env()
+    tracker = _LATENCIES.setdefault(f"{base_url}|{model}", LatencyTracker()) if hedge else None
+    return _LLMSettings(
+        model=model,
+        cache=cache,
+        replay=replay,
+        token_price=token_price,
+        timeout=timeout,
+        base_url=base_url,
+        client_params=client_params,
+        max_retries=max_retries,
+        deadline=deadline,
+        tracker=tracker,
+    )
+
+
+def create_llm(
+    *,
+    log_usage: bool = False,
+    model: str | None = None,
+    cache: LLMCache | None = None,
+    priority: int = INTERACTIVE,
+) -> callable:
+    """Create an OpenAI completion callable.
+
+    Parameters
+    ----------
+    log_usage: bool
+        If True, token usage and estimated cost from the OpenAI API response
+        will be logged.
+    cache: LLMCache, optional
+        Response cache consulted before each request. Defaults to the cache
+        configured by ``LLM_CACHE_PATH``; without it every call goes to the
+        API. A read-only (replay) cache raises :class:`CacheMiss` instead of
+        calling the API and needs no API key.
+    priority: int
+        Queue priority in the process-wide rate limiter shared by all
+        OpenAI calls; use ``rate_limiter.BATCH`` for background work.
+
+    Transient API errors are retried with jittered backoff as configured by
+    :func:`read_retry_env`. ``OPENAI_DEADLINE`` bounds each call including
+    its retries, and with ``OPENAI_HEDGE`` a request slower than the p95
+    latency seen so far is sent a second time and the first answer wins.
+
+    The callable also has a ``stream(prompt)`` method. It yields the
+    completion as text deltas while they arrive, so agents can show partial
+    steps and stop reading early. Closing the iterator aborts the response.
+    Only completely read streams are cached, and a cache hit is yielded as
+    one delta. Failures before the first token are retried, but streams are
+    never hedged.
+    """
+    settings = _llm_settings(model, cache)
+    client = None if settings.replay else OpenAI(**settings.client_params)
 
     def llm(prompt: str) -> str:
-        params = {
-            "model": model,
-            "messages": [{"role": "user", "content": prompt}],
-        }
-        if timeout is not None:
-            params["timeout"] = timeout
-        resp = client.chat.completions.create(**params)
-        if log_usage and getattr(resp, "usage", None):
-            try:
-                total = resp.usage.total_tokens
-            except Exception as exc:
-                logger.warning("Failed to read token usage: %s", exc)
-            else:
-                cost = total * token_price
-                logger.info("Tokens used: %s | Cost: $%.4f", total, cost)
-        return resp.choices[0].message.content
+        params, key, cached = settings.cached(prompt)
+        if cached is not None:
+            return cached
+
+        def request(attempt_timeout: float | None):
+            kwargs = dict(params)
+            if attempt_timeout is not None:
+                kwargs["timeout"] = attempt_timeout
+            with get_rate_limiter().acquire(estimate_tokens(prompt), priority):
+                return client.chat.completions.create(**kwargs)
+
+        resp = call_with_retries(
+            request,
+            max_retries=settings.max_retries,
+            timeout=settings.timeout,
+            deadline=settings.deadline,
+            hedge=settings.tracker,
+        )
+        return settings.finish(resp, key, log_usage)
+
+    def stream(prompt: str) -> Iterator[str]:
+        params, key, cached = settings.cached(prompt)
+        if cached is not None:
+            yield cached
+            return
+        with ExitStack() as stack:
+
+            def request(attempt_timeout: float | None):
+                kwargs = dict(params, stream=True)
+                if log_usage:
+                    kwargs["stream_options"] = {"include_usage": True}
+                if attempt_timeout is not None:
+                    kwargs["timeout"] = attempt_timeout
+                with ExitStack() as attempt:
+                    attempt.enter_context(get_rate_limiter().acquire(estimate_tokens(prompt), priority))
+                    response = client.chat.completions.create(**kwargs)
+                    # Hold the rate limiter slot until the stream is read or closed.
+                    stack.push(attempt.pop_all())
+                    return response
+
+            response = call_with_retries(
+                request,
+                max_retries=settings.max_retries,
+                timeout=settings.timeout,
+                deadline=settings.deadline,
+            )
+            if hasattr(response, "close"):
+                stack.callback(response.close)
+            parts = []
+            for chunk in response:
+                if log_usage and getattr(chunk, "usage", None):
+                    settings.log_usage(chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        if key is not None:
+            settings.cache.put(key, "".join(parts))
+
+    llm.stream = stream
+    return llm
+
+
+def create_async_llm(
+    *,
+    log_usage: bool = False,
+    model: str | None = None,
+    cache: LLMCache | None = None,
+    priority: int = INTERACTIVE,
+) -> callable:
+    """Create an async OpenAI completion callable for ``arun``/``arun_iter``.
+
+    Takes the same options and environment variables as :func:`create_llm`.
+    The returned coroutine function shares one :class:`AsyncOpenAI` client,
+    and with it one HTTP connection pool, across all concurrent calls, so a
+    single event loop can drive many agents. Requests go through the same
+    process-wide rate limiter, response cache and retry policy as the
+    blocking callable; the slower copy of a hedged request is cancelled.
+    """
+    settings = _llm_settings(model, cache)
+    client = None if settings.replay else AsyncOpenAI(**settings.client_params)
+
+    async def llm(prompt: str) -> str:
+        params, key, cached = settings.cached(prompt)
+        if cached is not None:
+            return cached
+
+        async def request(attempt_timeout: float | None):
+            kwargs = dict(params)
+            if attempt_timeout is not None:
+                kwargs["timeout"] = attempt_timeout
+            async with get_rate_limiter().acquire_async(estimate_tokens(prompt), priority):
+                return await client.chat.completions.create(**kwargs)
+
+        resp = await acall_with_retries(
+            request,
+            max_retries=settings.max_retries,
+            timeout=settings.timeout,
+            deadline=settings.deadline,
+            hedge=settings.tracker,
+        )
+        return settings.finish(resp, key, log_usage)
 
     return llm
 
@@ -241,6 +466,8 @@ def main(argv: list[str] | None = None) -> None:
             print(f"{name}: {desc}")
         return
     llm = create_llm(log_usage=True, model=args.model)
+    # With --stream, ReAct and CoT steps are printed token by token.
+    agent_llm = getattr(llm, "stream", llm) if args.stream else llm
     memory = None
     tools = None
     if args.agent == "react":
@@ -253,7 +480,7 @@ def main(argv: list[str] | None = None) -> None:
                     "Failed to load memory file %s: %s", args.memory_file, exc
                 )
         tools = get_default_tools()
-        agent = ReActAgent(llm, tools, memory, verbose=args.verbose)
+        agent = ReActAgent(agent_llm, tools, memory, verbose=args.verbose)
     elif args.agent == "cot":
         memory = VectorMemory() if args.memory == "vector" else ConversationMemory()
         if args.memory_file and os.path.exists(args.memory_file):
@@ -263,7 +490,7 @@ def main(argv: list[str] | None = None) -> None:
                 logger.warning(
                     "Failed to load memory file %s: %s", args.memory_file, exc
                 )
-        agent = CoTAgent(llm, memory, verbose=args.verbose)
+        agent = CoTAgent(agent_llm, memory, verbose=args.verbose)
     elif args.agent == "presentation":
         agent = PresentationAgent(llm)
     else:
@@ -290,7 +517,15 @@ def main(argv: list[str] | None = None) -> None:
         if not question:
             break
         if args.stream:
+            partial = False
             for step in agent.run_iter(question):
+                if isinstance(step, Delta):
+                    print(step, end="", flush=True)
+                    partial = not step.endswith("\n")
+                    continue
+                if partial:
+                    print()
+                    partial = False
                 print(step)
         else:
             answer = agent.run(question)
@@ -0,0 +1,179 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PageCache:
+    """SQLite-backed store of text extracted from document pages.
+
+    Files are keyed by ``(version, sha256(content))``, so a copy of a known
+    file uploaded from another path is recognized, and bumping *version*
+    when extraction changes invalidates old entries. The hash of each path
+    is remembered together with its size and mtime, so unchanged files are
+    not read again. Page texts are stored zlib-compressed; once they exceed
+    *max_bytes*, the least recently used files are dropped.
+
+    For downloaded pages the ``ETag`` and ``Last-Modified`` validators are
+    kept as well, so a page that the server reports as unchanged is served
+    without downloading or parsing it again.
+
+    Every process opens its own connection, so parser worker processes can
+    share one cache file.
+    """
+
+    HASH_CHUNK = 1 << 20
+
+    def __init__(self, path: str, max_bytes: Optional[int] = None, version: str = "1") -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "key TEXT PRIMARY KEY, "
+            "pages INTEGER NOT NULL, "
+            "bytes INTEGER NOT NULL DEFAULT 0, "
+            "used REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "key TEXT NOT NULL, "
+            "page INTEGER NOT NULL, "
+            "text BLOB NOT NULL, "
+            "PRIMARY KEY (key, page));"
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            "path TEXT PRIMARY KEY, "
+            "size INTEGER NOT NULL, "
+            "mtime INTEGER NOT NULL, "
+            "sha256 TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS urls ("
+            "url TEXT PRIMARY KEY, "
+            "key TEXT NOT NULL, "
+            "etag TEXT, "
+            "last_modified TEXT);"
+        )
+        self._conn.commit()
+
+    def file_key(self, path: str) -> str:
+        """Return the cache key of the file at *path*."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sha256 FROM hashes WHERE path = ? AND size = ? AND mtime = ?",
+                (path, stat.st_size, stat.st_mtime_ns),
+            ).fetchone()
+        if row is None:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(self.HASH_CHUNK), b""):
+                    digest.update(block)
+            row = (digest.hexdigest(),)
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO hashes (path, size, mtime, sha256) VALUES (?, ?, ?, ?)",
+                    (path, stat.st_size, stat.st_mtime_ns, row[0]),
+                )
+                self._conn.commit()
+        return f"{self.version}:{row[0]}"
+
+    def content_key(self, content: bytes) -> str:
+        """Return the cache key of a downloaded file with *content*."""
+        return f"{self.version}:{hashlib.sha256(content).hexdigest()}"
+
+    def get_validators(self, url: str) -> Optional[Dict[str, Optional[str]]]:
+        """Return the ``key``, ``etag`` and ``last_modified`` last seen for *url*."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT key, etag, last_modified FROM urls WHERE url = ?", (url,)
+            ).fetchone()
+        return dict(zip(("key", "etag", "last_modified"), row)) if row else None
+
+    def put_validators(self, url: str, key: str, etag: Optional[str], last_modified: Optional[str]) -> None:
+        """Remember the HTTP validators of *url*, whose content has the cache *key*."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO urls (url, key, etag, last_modified) VALUES (?, ?, ?, ?)",
+                (url, key, etag, last_modified),
+            )
+            self._conn.commit()
+
+    def page_count(self, key: str) -> Optional[int]:
+        """Return the number of pages of the file *key*, or ``None`` if unknown."""
+        with self._lock:
+            row = self._conn.execute("SELECT pages FROM files WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def get_pages(self, key: str, start: int, end: int) -> Optional[List[str]]:
+        """Return the texts of pages ``start..end-1``, or ``None`` unless all are cached."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page, text FROM pages WHERE key = ? AND page >= ? AND page < ? ORDER BY page",
+                (key, start, end),
+            ).fetchall()
+            if len(rows) < end - start:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE files SET used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return [zlib.decompress(blob).decode("utf-8") for _, blob in rows]
+
+    def put_pages(self, key: str, total: int, texts: Dict[int, str]) -> None:
+        """Store *texts* by page number for the file *key* of *total* pages."""
+        rows = [(key, page, zlib.compress(text.encode("utf-8"))) for page, text in texts.items()]
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO files (key, pages, bytes, used) VALUES (?, ?, 0, ?)",
+                (key, total, time.time()),
+            )
+            self._conn.executemany("INSERT OR REPLACE INTO pages (key, page, text) VALUES (?, ?, ?)", rows)
+            self._conn.execute(
+                "UPDATE files SET used = ?, bytes = (SELECT COALESCE(SUM(LENGTH(text)), 0) FROM pages WHERE key = ?) "
+                "WHERE key = ?",
+                (time.time(), key, key),
+            )
+            self._evict(keep=key)
+            self._conn.commit()
+
+    def _evict(self, keep: str) -> None:
+        if self.max_bytes is None:
+            return
+        (size,) = self._conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM files").fetchone()
+        if size <= self.max_bytes:
+            return
+        for key, nbytes in self._conn.execute(
+            "SELECT key, bytes FROM files WHERE key != ? ORDER BY used", (keep,)
+        ).fetchall():
+            self._conn.execute("DELETE FROM pages WHERE key = ?", (key,))
+            self._conn.execute("DELETE FROM files WHERE key = ?", (key,))
+            logger.info(f"Evicted cached pages of {key}.")
+            size -= nbytes
+            if size <= self.max_bytes:
+                break
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters, the hit rate and the stored size."""
+        with self._lock:
+            (size,) = self._conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM files").fetchone()
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "bytes": size,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,293 @@
+"""Process-wide governor for OpenAI requests.
+
+Chat completions and embeddings from every client in the process go
+through one :class:`RateLimiter`, which enforces requests per minute,
+tokens per minute and a maximum number of requests in flight. Waiting
+callers are served by priority and then in arrival order, so interactive
+questions overtake queued ingestion batches. A 429 response halves the
+effective limits and pauses new requests for the ``Retry-After`` period;
+every successful request then restores a little of the rate.
+
+Limits are read from ``OPENAI_RPM``, ``OPENAI_TPM`` and
+``OPENAI_MAX_IN_FLIGHT``.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+BATCH = 1
+
+DEFAULT_MAX_IN_FLIGHT = 16
+
+
+class _Bucket:
+    """Token bucket refilled at ``per_minute * scale`` units per minute.
+
+    The bucket holds up to ten seconds of the rate, so an idle process
+    cannot fire a whole minute's budget at once. A request larger than the
+    bucket waits for a full bucket and then takes its whole amount; the
+    level goes negative and later requests wait until the debt is repaid,
+    so the configured rate holds for any request size.
+    """
+
+    BURST_SECONDS = 10.0
+
+    def __init__(self, per_minute: float) -> None:
+        self.per_minute = per_minute
+        self.level = self.capacity(1.0)
+        self.updated = time.monotonic()
+
+    def capacity(self, scale: float) -> float:
+        return max(1.0, self.per_minute * scale * self.BURST_SECONDS / 60.0)
+
+    def _refill(self, now: float, scale: float) -> None:
+        rate = self.per_minute * scale / 60.0
+        self.level = min(self.capacity(scale), self.level + (now - self.updated) * rate)
+        self.updated = now
+
+    def delay(self, amount: float, now: float, scale: float) -> float:
+        """Return how long to wait before *amount* can be taken."""
+        self._refill(now, scale)
+        need = min(amount, self.capacity(scale))
+        if self.level >= need:
+            return 0.0
+        return (need - self.level) / (self.per_minute * scale / 60.0)
+
+    def take(self, amount: float) -> None:
+        self.level -= amount
+
+
+def _is_rate_limit(exc: BaseException) -> bool:
+    return getattr(exc, "status_code", None) == 429 or type(exc).__name__ == "RateLimitError"
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class RateLimiter:
+    """Fair, adaptive limiter for requests to one API account."""
+
+    MIN_SCALE = 0.1
+    # Additive increase per success after a multiplicative decrease on 429.
+    RECOVERY_STEP = 0.05
+    DEFAULT_PAUSE = 1.0
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_in_flight: Optional[int] = DEFAULT_MAX_IN_FLIGHT,
+    ) -> None:
+        self.max_in_flight = max_in_flight
+        self._requests = _Bucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = _Bucket(tokens_per_minute) if tokens_per_minute else None
+        self._cond = threading.Condition()
+        self._waiters: List[Tuple[int, int]] = []
+        # Futures that wake waiting coroutines, keyed by their queue entry.
+        self._wakeups: Dict[Tuple[int, int], Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = {}
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._scale = 1.0
+        self._paused_until = 0.0
+
+    @property
+    def scale(self) -> float:
+        """Current fraction of the configured limits in use."""
+        return self._scale
+
+    def _in_flight_limit(self) -> float:
+        if not self.max_in_flight:
+            return math.inf
+        return max(1, int(self.max_in_flight * self._scale))
+
+    def _delay(self, tokens: int, now: float) -> float:
+        delay = self._paused_until - now
+        if self._requests is not None:
+            delay = max(delay, self._requests.delay(1, now, self._scale))
+        if self._tokens is not None and tokens:
+            delay = max(delay, self._tokens.delay(tokens, now, self._scale))
+        return delay
+
+    def _enqueue(self, priority: int) -> Tuple[int, int]:
+        entry = (priority, next(self._seq))
+        heapq.heappush(self._waiters, entry)
+        return entry
+
+    def _dequeue(self, entry: Tuple[int, int]) -> None:
+        self._waiters.remove(entry)
+        heapq.heapify(self._waiters)
+        self._notify()
+
+    def _notify(self) -> None:
+        """Wake waiting threads and the coroutine at the head of the queue.
+
+        Only the head of the queue can take a slot, so other coroutines stay
+        asleep until they reach it. Called with the lock held.
+        """
+        self._cond.notify_all()
+        if self._waiters:
+            wakeup = self._wakeups.pop(self._waiters[0], None)
+            if wakeup is not None:
+                loop, future = wakeup
+                loop.call_soon_threadsafe(_resolve, future)
+
+    def _try_take(self, entry: Tuple[int, int], tokens: int) -> Optional[float]:
+        """Take a slot for *entry* with the lock held.
+
+        Return ``0`` once the slot is taken, otherwise how long to wait, or
+        ``None`` to wait for another request to finish or leave the queue.
+        """
+        if self._waiters[0] != entry or self._in_flight >= self._in_flight_limit():
+            return None
+        delay = self._delay(tokens, time.monotonic())
+        if delay > 0:
+            return delay
+        heapq.heappop(self._waiters)
+        if self._requests is not None:
+            self._requests.take(1)
+        if self._tokens is not None and tokens:
+            self._tokens.take(tokens)
+        self._in_flight += 1
+        # The next waiter is now at the head of the queue.
+        self._notify()
+        return 0.0
+
+    def _wait_turn(self, tokens: int, priority: int) -> None:
+        with self._cond:
+            entry = self._enqueue(priority)
+            try:
+                while True:
+                    delay = self._try_take(entry, tokens)
+                    if delay == 0:
+                        return
+                    self._cond.wait(delay)
+            except BaseException:
+                self._dequeue(entry)
+                raise
+
+    async def _await_turn(self, tokens: int, priority: int) -> None:
+        # Coroutines cannot block on the condition, so each wait registers a
+        # future that _notify() resolves from whichever thread frees a slot;
+        # they still hold their place in the same priority queue as threads.
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            entry = self._enqueue(priority)
+        try:
+            while True:
+                with self._cond:
+                    delay = self._try_take(entry, tokens)
+                    if delay == 0:
+                        return
+                    wakeup = loop.create_future()
+                    self._wakeups[entry] = (loop, wakeup)
+                try:
+                    await asyncio.wait([wakeup], timeout=delay)
+                finally:
+                    with self._cond:
+                        self._wakeups.pop(entry, None)
+        except BaseException:
+            with self._cond:
+                self._dequeue(entry)
+            raise
+
+    def _release(self) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self._notify()
+
+    @contextmanager
+    def acquire(self, tokens: int = 0, priority: int = BATCH) -> Iterator[None]:
+        """Wait for a slot for a request of about *tokens* tokens and hold it.
+
+        Run the request, including reading a streamed response, inside the
+        block. A rate-limit error raised there is reported automatically.
+        """
+        self._wait_turn(tokens, priority)
+        try:
+            yield
+        except BaseException as exc:
+            self._release()
+            if _is_rate_limit(exc):
+                self.report_rate_limited(_retry_after(exc))
+            raise
+        self._release()
+        self.report_success()
+
+    @asynccontextmanager
+    async def acquire_async(self, tokens: int = 0, priority: int = BATCH) -> AsyncIterator[None]:
+        """Async version of :meth:`acquire` that waits without blocking the event loop."""
+        await self._await_turn(tokens, priority)
+        try:
+            yield
+        except BaseException as exc:
+            self._release()
+            if _is_rate_limit(exc):
+                self.report_rate_limited(_retry_after(exc))
+            raise
+        self._release()
+        self.report_success()
+
+    def report_rate_limited(self, retry_after: Optional[float] = None) -> None:
+        """Shrink the limits and pause new requests after a 429 response."""
+        with self._cond:
+            self._scale = max(self.MIN_SCALE, self._scale / 2)
+            pause = retry_after if retry_after is not None else self.DEFAULT_PAUSE
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            self._notify()
+        logger.warning("Rate limited by the API; pausing %.1fs at %.0f%% of the limits.", pause, self._scale * 100)
+
+    def report_success(self) -> None:
+        if self._scale >= 1.0:
+            return
+        with self._cond:
+            self._scale = min(1.0, self._scale + self.RECOVERY_STEP)
+            self._notify()
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def _env_limit(name: str, default: Optional[int] = None) -> Optional[int]:
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return max(0, int(value)) or None
+    except ValueError:
+        logger.warning("Invalid %s=%s, using default %s", name, value, default)
+        return default
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Return the limiter shared by all OpenAI clients in this process."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(
+                requests_per_minute=_env_limit("OPENAI_RPM"),
+                tokens_per_minute=_env_limit("OPENAI_TPM"),
+                max_in_flight=_env_limit("OPENAI_MAX_IN_FLIGHT", DEFAULT_MAX_IN_FLIGHT),
+            )
+        return _limiter
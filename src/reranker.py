@@ -0,0 +1,170 @@
+"""Second-stage re-rankers for :class:`~src.vector_store_manager.VectorStoreManager`.
+
+The vector and BM25 indexes recall a few dozen candidates cheaply; a
+re-ranker then scores each candidate against the query and keeps the best
+few. Available scorers:
+
+* ``tfidf`` – cosine similarity of character n-gram TF-IDF vectors
+* ``cross_encoder`` – a sentence-transformers cross-encoder, loaded once
+* ``llm`` – one batched chat completion that scores every candidate
+"""
+
+import json
+import logging
+import re
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+RERANKERS = ("none", "tfidf", "cross_encoder", "llm")
+DEFAULT_CROSS_ENCODER = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+
+
+class Reranker(ABC):
+    """Score candidate passages against a query; higher is better."""
+
+    name = "none"
+    # Default for ``RERANK_BUDGET_MS``: how long a search waits for scores.
+    DEFAULT_BUDGET_MS = 1000
+
+    @abstractmethod
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        """Return one score per passage in *texts*."""
+
+
+class TfidfReranker(Reranker):
+    """Cosine similarity of character 2–3-gram TF-IDF vectors.
+
+    Character n-grams need no Japanese tokenizer, and the vocabulary is fit
+    on the query and candidates only, so scoring 50 chunks takes a few
+    milliseconds.
+    """
+
+    name = "tfidf"
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        matrix = TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 3)).fit_transform([query, *texts])
+        # Rows are L2-normalized, so the dot product is the cosine.
+        return (matrix[1:] @ matrix[0].T).toarray().ravel().tolist()
+
+
+class CrossEncoderReranker(Reranker):
+    """Score ``(query, passage)`` pairs with a sentence-transformers cross-encoder.
+
+    Models are loaded on first use and shared by all instances, so only the
+    first query pays the loading time.
+    """
+
+    name = "cross_encoder"
+    _models: Dict[str, Any] = {}
+    _models_lock = threading.Lock()
+
+    def __init__(self, model_name: str = DEFAULT_CROSS_ENCODER) -> None:
+        self.model_name = model_name
+
+    def _model(self) -> Any:
+        with self._models_lock:
+            model = self._models.get(self.model_name)
+            if model is None:
+                from sentence_transformers import CrossEncoder
+
+                logger.info("Loading cross-encoder %s.", self.model_name)
+                model = self._models[self.model_name] = CrossEncoder(self.model_name)
+            return model
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        return [float(s) for s in self._model().predict([(query, t) for t in texts])]
+
+
+class LLMReranker(Reranker):
+    """Score all candidates with a single call to *llm*.
+
+    *llm* takes a prompt and returns the completion text, like the callables
+    returned by :func:`src.main.create_llm`. The model is asked for a JSON
+    array with one 0–10 relevance score per passage.
+    """
+
+    name = "llm"
+    # A chat completion scoring 50 passages takes several seconds.
+    DEFAULT_BUDGET_MS = 10_000
+    PASSAGE_CHARS = 600
+
+    def __init__(self, llm: Callable[[str], str]) -> None:
+        self.llm = llm
+
+    def _prompt(self, query: str, texts: Sequence[str]) -> str:
+        passages = "\n\n".join(f"[{n}] {t[:self.PASSAGE_CHARS]}" for n, t in enumerate(texts, start=1))
+        return (
+            "以下の各文書が質問に答えるためにどれだけ役立つかを0から10で評価してください。\n"
+            f"文書と同じ順番で{len(texts)}個の数値だけを含むJSON配列で答えてください。\n\n"
+            f"質問: {query}\n\n{passages}"
+        )
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        reply = self.llm(self._prompt(query, texts))
+        match = re.search(r"\[[^\[\]]*\]", reply or "")
+        if not match:
+            raise ValueError(f"No score list in re-ranker reply: {reply!r}")
+        scores = [float(s) for s in json.loads(match.group(0))]
+        if len(scores) != len(texts):
+            raise ValueError(f"Expected {len(texts)} scores, got {len(scores)}")
+        return scores
+
+
+def create_reranker(name: str, llm: Optional[Callable[[str], str]] = None, **params: Any) -> Optional[Reranker]:
+    """Return the re-ranker called *name*, or ``None`` for ``"none"``."""
+    if name == "none":
+        return None
+    if name == "tfidf":
+        return TfidfReranker()
+    if name == "cross_encoder":
+        return CrossEncoderReranker(params.get("model") or DEFAULT_CROSS_ENCODER)
+    if name == "llm":
+        if llm is None:
+            raise ValueError("The llm re-ranker needs an llm callable")
+        return LLMReranker(llm)
+    raise ValueError(f"Unknown re-ranker: {name!r} (choose from {', '.join(RERANKERS)})")
+
+
+def rerank(
+    reranker: Reranker,
+    query: str,
+    items: Sequence[Any],
+    top_k: int,
+    budget: Optional[float] = None,
+    text: Callable[[Any], str] = lambda item: item.page_content,
+) -> List[Any]:
+    """Return the *top_k* of *items* ordered by *reranker*.
+
+    Scoring runs on a daemon thread. If it fails or takes longer than
+    *budget* seconds, the first *top_k* items are returned in their original
+    order; a scorer that overran keeps running in the background, so a
+    model that is still loading is ready for the next query.
+    """
+    if len(items) <= 1:
+        return list(items[:top_k])
+    future: Future = Future()
+
+    def run() -> None:
+        try:
+            future.set_result(reranker.score(query, [text(item) for item in items]))
+        except BaseException as exc:
+            future.set_exception(exc)
+
+    threading.Thread(target=run, name=f"rerank-{reranker.name}", daemon=True).start()
+    try:
+        scores = future.result(timeout=budget)
+    except FutureTimeoutError:
+        logger.warning("Re-ranker %s exceeded %.0f ms; using retrieval order.", reranker.name, budget * 1000)
+        return list(items[:top_k])
+    except Exception as exc:
+        logger.warning("Re-ranker %s failed (%s); using retrieval order.", reranker.name, exc)
+        return list(items[:top_k])
+    # Stable sort keeps the retrieval order between equal scores.
+    order = sorted(range(len(items)), key=lambda i: scores[i], reverse=True)
+    return [items[i] for i in order[:top_k]]
@@ -0,0 +1,202 @@
+"""Retries, deadlines and hedged requests for calls to the OpenAI API."""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Awaitable, Callable, Deque, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_hedge_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Return True for rate limits, timeouts, connection problems and 5xx errors."""
+    if type(exc).__name__ in ("RateLimitError", "APIConnectionError", "APITimeoutError"):
+        return True
+    status = getattr(exc, "status_code", None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+
+class LatencyTracker:
+    """Rolling window of request latencies used to decide when to hedge."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20) -> None:
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Return the *q* quantile, or ``None`` until enough samples exist."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _hedged(
+    attempt: Callable[[Optional[float]], T],
+    timeout: Optional[float],
+    tracker: LatencyTracker,
+    quantile: float,
+) -> T:
+    """Run *attempt*, starting a second copy if it is slower than usual."""
+    start = time.monotonic()
+    hedge_after = tracker.quantile(quantile)
+    if hedge_after is None or (timeout is not None and hedge_after >= timeout):
+        result = attempt(timeout)
+        tracker.record(time.monotonic() - start)
+        return result
+    first = _hedge_pool.submit(attempt, timeout)
+    done, _ = wait([first], timeout=hedge_after)
+    if done:
+        result = first.result()
+        tracker.record(time.monotonic() - start)
+        return result
+    logger.info("LLM request exceeded p%.0f latency %.1fs; sending a hedged request.", quantile * 100, hedge_after)
+    remaining = None if timeout is None else max(0.001, timeout - (time.monotonic() - start))
+    pending = {first, _hedge_pool.submit(attempt, remaining)}
+    error: Optional[BaseException] = None
+    while pending:
+        # The loser keeps running in the background; its result is dropped.
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                tracker.record(time.monotonic() - start)
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+async def _ahedged(
+    attempt: Callable[[Optional[float]], Awaitable[T]],
+    timeout: Optional[float],
+    tracker: LatencyTracker,
+    quantile: float,
+) -> T:
+    """Async version of :func:`_hedged`; the slower request is cancelled."""
+    start = time.monotonic()
+    hedge_after = tracker.quantile(quantile)
+    if hedge_after is None or (timeout is not None and hedge_after >= timeout):
+        result = await attempt(timeout)
+        tracker.record(time.monotonic() - start)
+        return result
+    first = asyncio.ensure_future(attempt(timeout))
+    pending = {first}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=hedge_after)
+        if not done:
+            logger.info(
+                "LLM request exceeded p%.0f latency %.1fs; sending a hedged request.", quantile * 100, hedge_after
+            )
+            remaining = None if timeout is None else max(0.001, timeout - (time.monotonic() - start))
+            pending.add(asyncio.ensure_future(attempt(remaining)))
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    tracker.record(time.monotonic() - start)
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def _backoff(attempt_no: int, base_delay: float, max_delay: float) -> float:
+    return min(max_delay, base_delay * (2 ** attempt_no)) * (0.5 + random.random())
+
+
+def call_with_retries(
+    attempt: Callable[[Optional[float]], T],
+    *,
+    max_retries: int = 3,
+    timeout: Optional[float] = None,
+    deadline: Optional[float] = None,
+    hedge: Optional[LatencyTracker] = None,
+    hedge_quantile: float = 0.95,
+    base_delay: float = 0.5,
+    max_delay: float = 20.0,
+) -> T:
+    """Call ``attempt(timeout)`` until it succeeds or retrying is pointless.
+
+    Transient failures (see :func:`is_retryable`) are retried up to
+    *max_retries* times with jittered exponential backoff. *deadline* is a
+    budget in seconds for the whole call: every attempt gets at most the
+    time that is left as its *timeout*, and no retry is started once it is
+    spent. With *hedge*, an attempt slower than the tracked
+    *hedge_quantile* latency is duplicated and the first answer wins.
+    """
+    start = time.monotonic()
+    errors: List[BaseException] = []
+    for attempt_no in range(max_retries + 1):
+        attempt_timeout = timeout
+        if deadline is not None:
+            remaining = deadline - (time.monotonic() - start)
+            if remaining <= 0:
+                break
+            attempt_timeout = remaining if timeout is None else min(timeout, remaining)
+        try:
+            if hedge is not None:
+                return _hedged(attempt, attempt_timeout, hedge, hedge_quantile)
+            return attempt(attempt_timeout)
+        except Exception as exc:
+            errors.append(exc)
+            if attempt_no >= max_retries or not is_retryable(exc):
+                raise
+            delay = _backoff(attempt_no, base_delay, max_delay)
+            if deadline is not None:
+                delay = min(delay, max(0.0, deadline - (time.monotonic() - start)))
+            logger.warning("LLM request failed (%s), retrying in %.1fs", exc, delay)
+            time.sleep(delay)
+    raise TimeoutError(f"LLM call exceeded its deadline of {deadline}s") from (errors[-1] if errors else None)
+
+
+async def acall_with_retries(
+    attempt: Callable[[Optional[float]], Awaitable[T]],
+    *,
+    max_retries: int = 3,
+    timeout: Optional[float] = None,
+    deadline: Optional[float] = None,
+    hedge: Optional[LatencyTracker] = None,
+    hedge_quantile: float = 0.95,
+    base_delay: float = 0.5,
+    max_delay: float = 20.0,
+) -> T:
+    """Async version of :func:`call_with_retries` for coroutine *attempt* functions."""
+    start = time.monotonic()
+    errors: List[BaseException] = []
+    for attempt_no in range(max_retries + 1):
+        attempt_timeout = timeout
+        if deadline is not None:
+            remaining = deadline - (time.monotonic() - start)
+            if remaining <= 0:
+                break
+            attempt_timeout = remaining if timeout is None else min(timeout, remaining)
+        try:
+            if hedge is not None:
+                return await _ahedged(attempt, attempt_timeout, hedge, hedge_quantile)
+            return await attempt(attempt_timeout)
+        except Exception as exc:
+            errors.append(exc)
+            if attempt_no >= max_retries or not is_retryable(exc):
+                raise
+            delay = _backoff(attempt_no, base_delay, max_delay)
+            if deadline is not None:
+                delay = min(delay, max(0.0, deadline - (time.monotonic() - start)))
+            logger.warning("LLM request failed (%s), retrying in %.1fs", exc, delay)
+            await asyncio.sleep(delay)
+    raise TimeoutError(f"LLM call exceeded its deadline of {deadline}s") from (errors[-1] if errors else None)
@@ -0,0 +1,358 @@
+"""Text splitters used by :class:`~src.vector_store_manager.VectorStoreManager`.
+
+Splitters accept any document object with ``page_content`` and ``metadata``
+attributes and return chunks of the same class, so they work with the
+``Document`` classes of both the loader and the vector store.
+"""
+
+import re
+from itertools import chain, groupby
+from typing import Any, Iterable, Iterator, List, Sequence, Tuple
+
+# Pieces are split at the coarsest boundary that brings them under the token
+# budget. Each level pairs a pattern with the string used to join its pieces
+# back together. Sentence and clause patterns split after the delimiter so
+# the punctuation stays with its sentence.
+SEPARATORS: Sequence[Tuple["re.Pattern[str]", str]] = (
+    (re.compile(r"\n[ \t　]*\n\s*"), "\n\n"),
+    (re.compile(r"\n"), "\n"),
+    (re.compile(r"(?<=[。！？!?])(?![」』）)])|(?<=\.)\s+"), ""),
+    (re.compile(r"(?<=[、，,;；])"), ""),
+    (re.compile(r"\s+"), " "),
+)
+
+# Lines that open a new section or list item: Markdown headings, 第N章/条,
+# bullets, bracketed titles and numbered items such as "1." "(2)" "③".
+HEADING_RE = re.compile(
+    r"^[ \t　]*(?:"
+    r"#{1,6}\s"
+    r"|第[0-9０-９一二三四五六七八九十百千]+[編章節款条項号]"
+    r"|[■□◆◇●○◎・【]"
+    r"|[-*]\s"
+    r"|[（(]?[0-9０-９]{1,3}[)）.．]"
+    r"|[①-⑳]"
+    r")"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of *text*.
+
+    Japanese characters are counted as about one token each and ASCII text as
+    about four characters per token, which matches ``cl100k``-style
+    tokenizers closely enough for chunk budgeting.
+    """
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+class RecursiveTextSplitter:
+    """Split documents into chunks of about ``chunk_size`` tokens.
+
+    Text is split recursively by paragraphs, lines, sentences (including the
+    Japanese terminators 。！？), clauses and finally whitespace, and the
+    pieces are merged greedily up to the budget. Consecutive chunks share up
+    to ``chunk_overlap`` tokens, and headings and list items start a new chunk
+    once the current one is reasonably full.
+    """
+
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive")
+        if not 0 <= chunk_overlap < chunk_size:
+            raise ValueError("chunk_overlap must be between 0 and chunk_size")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+    def _hard_split(self, text: str) -> List[str]:
+        # Last resort for text without any usable boundary: cut by
+        # characters, assuming the worst case of one token per character.
+        return [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+
+    def _split(self, text: str, level: int = 0) -> List[Tuple[str, str]]:
+        """Return ``(joiner, piece)`` pairs each within the token budget."""
+        if estimate_tokens(text) <= self.chunk_size:
+            return [("", text)]
+        if level >= len(SEPARATORS):
+            return [("", piece) for piece in self._hard_split(text)]
+        pattern, joiner = SEPARATORS[level]
+        parts = [p for p in pattern.split(text) if p.strip()]
+        if len(parts) <= 1:
+            return self._split(text, level + 1)
+        pieces: List[Tuple[str, str]] = []
+        for part in parts:
+            sub = self._split(part, level + 1)
+            pieces.append((joiner, sub[0][1]))
+            pieces.extend(sub[1:])
+        return pieces
+
+    @staticmethod
+    def _is_heading(joiner: str, piece: str) -> bool:
+        return joiner.startswith("\n") and HEADING_RE.match(piece) is not None
+
+    @staticmethod
+    def _render(pieces: List[Tuple[str, str, int, int]]) -> str:
+        text = pieces[0][1]
+        for joiner, piece, *_ in pieces[1:]:
+            text += joiner + piece
+        return text.strip()
+
+    def split_text(self, text: str) -> List[str]:
+        """Split *text* into chunk strings."""
+        if not text.strip():
+            return []
+
+        def tokens(other: int, ascii_chars: int) -> int:
+            # estimate_tokens() of the joined chunk; rounding per piece
+            # would overcount short ASCII words several times over.
+            return other + (ascii_chars + 3) // 4
+
+        chunks: List[str] = []
+        # (joiner, piece, non-ASCII chars, ASCII chars) with the joiner
+        # counted, so the budget covers the separators between pieces.
+        current: List[Tuple[str, str, int, int]] = []
+        other = ascii_chars = 0
+        for joiner, piece in self._split(text):
+            piece_ascii = len((joiner + piece).encode("ascii", "ignore"))
+            piece_other = len(joiner) + len(piece) - piece_ascii
+            heading = self._is_heading(joiner, piece)
+            if current and (
+                tokens(other + piece_other, ascii_chars + piece_ascii) > self.chunk_size
+                or (heading and tokens(other, ascii_chars) >= self.chunk_size // 4)
+            ):
+                chunks.append(self._render(current))
+                if heading:
+                    # Do not drag the previous section into the next one.
+                    current, other, ascii_chars = [], 0, 0
+                else:
+                    while current and (
+                        tokens(other, ascii_chars) > self.chunk_overlap
+                        or tokens(other + piece_other, ascii_chars + piece_ascii) > self.chunk_size
+                    ):
+                        _, _, dropped_other, dropped_ascii = current.pop(0)
+                        other -= dropped_other
+                        ascii_chars -= dropped_ascii
+            current.append((joiner, piece, piece_other, piece_ascii))
+            other += piece_other
+            ascii_chars += piece_ascii
+        if current:
+            chunks.append(self._render(current))
+        return [c for c in chunks if c]
+
+    def iter_split_documents(self, docs: Iterable[Any]) -> Iterator[Any]:
+        """Yield the chunks of *docs*, consuming one document at a time."""
+        for doc in docs:
+            for text in self.split_text(doc.page_content):
+                yield type(doc)(page_content=text, metadata=dict(doc.metadata))
+
+    def split_documents(self, docs: List[Any]) -> List[Any]:
+        return list(self.iter_split_documents(docs))
+
+
+# Kept for backward compatibility; the splitter now honours its arguments.
+SimpleTextSplitter = RecursiveTextSplitter
+
+
+_NUMERAL = "[0-9０-９一二三四五六七八九十百千]+"
+CHAPTER_RE = re.compile(rf"^[ \t　]*(第{_NUMERAL}[編章節])(?=[ \t　]|$)")
+ARTICLE_RE = re.compile(
+    rf"^[ \t　]*(第{_NUMERAL}条(?:の[0-9０-９一二三四五六七八九十]+)?)(?=[ \t　（(]|$)"
+)
+# Article captions such as "（保険金を支払う場合）" precede the article.
+CAPTION_RE = re.compile(r"^[ \t　]*[（(][^）)]{1,40}[）)][ \t　]*$")
+# Paragraphs (項) after the first are numbered "２　..." at the line start.
+PARAGRAPH_RE = re.compile(r"^[ \t　]*([0-9０-９]{1,2})[ \t　]")
+_FULLWIDTH_DIGITS = str.maketrans("０１２３４５６７８９", "0123456789")
+
+
+def _normalize(label: str) -> str:
+    return re.sub(r"[ \t　]+", " ", label.strip()).translate(_FULLWIDTH_DIGITS)
+
+
+def format_citation(metadata: dict) -> str:
+    """Return an article reference such as ``第12条第2項`` for *metadata*."""
+    article = metadata.get("article")
+    if not article:
+        return ""
+    return article + (metadata.get("paragraph") or "")
+
+
+class ClauseTextSplitter:
+    """Structure-aware splitter for Japanese policy wordings (約款).
+
+    Each article (第N条) becomes one chunk together with its caption line.
+    Articles over ``chunk_size`` tokens are split at paragraph (項)
+    boundaries, and only oversize paragraphs are split further. Chunks record
+    ``chapter``, ``article``, ``paragraph`` (for split articles) and the
+    ``page`` they start on. Sources without article headings fall back to
+    :class:`RecursiveTextSplitter`.
+    """
+
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+        self.chunk_size = chunk_size
+        self.fallback = RecursiveTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    @staticmethod
+    def _carry_start(lines: List[Tuple[Any, int, str]]) -> int:
+        """Return where the trailing caption and chapter lines of *lines* begin."""
+        start = len(lines)
+        while start and (CAPTION_RE.match(lines[start - 1][2]) or CHAPTER_RE.match(lines[start - 1][2])):
+            start -= 1
+        return start
+
+    def _iter_sections(self, lines: Iterable[Tuple[Any, str]]) -> Iterator[dict]:
+        """Group ``(page, line)`` pairs into chapter preambles and articles.
+
+        Sections are yielded as soon as the next one starts. Preambles are
+        split per page anyway, so their finished pages are yielded when a
+        new page begins; only lines that may turn out to be the caption of
+        the next article are held back.
+        """
+        chapter = None
+        current = {"chapter": None, "article": None, "lines": []}
+        last_page = None
+        for page, line in lines:
+            if page != last_page and not current["article"]:
+                start = self._carry_start(current["lines"])
+                if start:
+                    yield {"chapter": current["chapter"], "article": None, "lines": current["lines"][:start]}
+                    del current["lines"][:start]
+            last_page = page
+            chapter_match = CHAPTER_RE.match(line)
+            article_match = ARTICLE_RE.match(line)
+            if chapter_match:
+                chapter = _normalize(line)
+                yield current
+                current = {"chapter": chapter, "article": None, "lines": []}
+            elif article_match:
+                # Carry the caption and chapter heading over to the article.
+                start = self._carry_start(current["lines"])
+                carry = current["lines"][start:]
+                del current["lines"][start:]
+                yield current
+                current = {
+                    "chapter": chapter,
+                    "article": _normalize(article_match.group(1)),
+                    "lines": [(p, 1, text) for p, _, text in carry],
+                }
+            paragraph = current["lines"][-1][1] if current["lines"] else 1
+            if current["article"] and not article_match:
+                paragraph_match = PARAGRAPH_RE.match(line)
+                if paragraph_match and int(_normalize(paragraph_match.group(1))) == paragraph + 1:
+                    paragraph += 1
+            current["lines"].append((page, paragraph, line))
+        yield current
+
+    def _sections(self, lines: Iterable[Tuple[Any, str]]) -> List[dict]:
+        return [s for s in self._iter_sections(lines) if any(text.strip() for _, _, text in s["lines"])]
+
+    def _metadata(self, base: dict, section: dict, page: Any, paragraph: Any = None) -> dict:
+        metadata = dict(base)
+        if section["chapter"]:
+            metadata["chapter"] = section["chapter"]
+        if section["article"]:
+            metadata["article"] = section["article"]
+        if paragraph is not None:
+            metadata["paragraph"] = f"第{paragraph}項"
+        if page is not None:
+            metadata["page"] = page
+        return metadata
+
+    def _split_preamble(self, section: dict, base: dict) -> List[Tuple[str, dict]]:
+        chunks = []
+        by_page: dict = {}
+        for page, _, text in section["lines"]:
+            by_page.setdefault(page, []).append(text)
+        for page, texts in by_page.items():
+            for text in self.fallback.split_text("\n".join(texts)):
+                chunks.append((text, self._metadata(base, section, page)))
+        return chunks
+
+    def _split_article(self, section: dict, base: dict) -> List[Tuple[str, dict]]:
+        lines = section["lines"]
+        text = "\n".join(t for _, _, t in lines).strip()
+        if estimate_tokens(text) <= self.chunk_size:
+            return [(text, self._metadata(base, section, lines[0][0]))]
+
+        # Group lines into paragraphs, then pack whole paragraphs per chunk.
+        blocks: List[List[Tuple[Any, int, str]]] = []
+        for line in lines:
+            if blocks and blocks[-1][-1][1] == line[1]:
+                blocks[-1].append(line)
+            else:
+                blocks.append([line])
+        header = section["article"] + "\n"
+        budget = self.chunk_size - estimate_tokens(header)
+        chunks: List[Tuple[str, dict]] = []
+        current: List[Tuple[Any, int, str]] = []
+        for block in blocks:
+            block_text = "\n".join(t for _, _, t in block)
+            if estimate_tokens(block_text) > budget:
+                if current:
+                    chunks.append(self._pack(current, section, base, header))
+                    current = []
+                for piece in RecursiveTextSplitter(budget, 0).split_text(block_text):
+                    chunks.append(self._pack([(block[0][0], block[0][1], piece)], section, base, header))
+                continue
+            candidate = current + block
+            if current and estimate_tokens("\n".join(t for _, _, t in candidate)) > budget:
+                chunks.append(self._pack(current, section, base, header))
+                candidate = block
+            current = candidate
+        if current:
+            chunks.append(self._pack(current, section, base, header))
+        return chunks
+
+    def _pack(self, lines, section: dict, base: dict, header: str) -> Tuple[str, dict]:
+        text = "\n".join(t for _, _, t in lines).strip()
+        if not ARTICLE_RE.match(text) and not CAPTION_RE.match(text.split("\n", 1)[0]):
+            # Continuation chunks repeat the article number for retrieval.
+            text = header + text
+        return text, self._metadata(base, section, lines[0][0], lines[0][1])
+
+    def split_documents(self, docs: List[Any]) -> List[Any]:
+        # Articles can span pages, so pages of one source are processed together.
+        by_source: dict = {}
+        for doc in docs:
+            by_source.setdefault(doc.metadata.get("source"), []).append(doc)
+        chunks = []
+        for source_docs in by_source.values():
+            lines = [
+                (doc.metadata.get("page"), line)
+                for doc in source_docs
+                for line in doc.page_content.split("\n")
+            ]
+            if not any(ARTICLE_RE.match(line) for _, line in lines):
+                chunks.extend(self.fallback.split_documents(source_docs))
+                continue
+            chunks.extend(self._split_sections(self._sections(lines), source_docs[0]))
+        return chunks
+
+    def _split_sections(self, sections: Iterable[dict], first: Any) -> Iterator[Any]:
+        cls = type(first)
+        base = {k: v for k, v in first.metadata.items() if k != "page"}
+        for section in sections:
+            if section["article"]:
+                pieces = self._split_article(section, base)
+            else:
+                pieces = self._split_preamble(section, base)
+            yield from (cls(page_content=text, metadata=metadata) for text, metadata in pieces)
+
+    def iter_split_documents(self, docs: Iterable[Any]) -> Iterator[Any]:
+        """Yield the chunks of *docs* as soon as each section is complete.
+
+        Pages are consumed one at a time, so only the section in progress is
+        held in memory; pages of one source must arrive together and in
+        order, as :func:`src.document_loader.iter_document` yields them.
+        Sources without article headings give the same chunks as the
+        fallback splitter, page by page.
+        """
+        for _, source_docs in groupby(docs, key=lambda doc: doc.metadata.get("source")):
+            first = next(source_docs)
+            lines = (
+                (doc.metadata.get("page"), line)
+                for doc in chain([first], source_docs)
+                for line in doc.page_content.split("\n")
+            )
+            sections = (s for s in self._iter_sections(lines) if any(t.strip() for _, _, t in s["lines"]))
+            yield from self._split_sections(sections, first)
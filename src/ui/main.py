@@ -8,6 +8,7 @@ import re
 import shutil
 import threading
 import functools
+from contextlib import ExitStack
 
 import customtkinter as ctk
 import tkinter
@@ -16,7 +17,10 @@ from PIL import Image
 from dotenv import load_dotenv
 from openai import OpenAI
 
-from src.document_loader import load_document
+from src.ingestion import IngestionPipeline
+from src.rate_limiter import INTERACTIVE, get_rate_limiter
+from src.retry import call_with_retries
+from src.text_splitter import estimate_tokens, format_citation
 from src.vector_store_manager import VectorStoreManager
 
 
@@ -41,6 +45,7 @@ def get_font_family(preferred: str = "Meiryo") -> str:
 # --- Constants ---
 load_dotenv()
 CONV_DIR = os.getenv("CONVERSATION_DIR", "conversations")
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR")
 FONT_FAMILY = get_font_family()
 
 # --- Logging Setup ---
@@ -67,13 +72,13 @@ class ChatGPTClient:
             messagebox.showerror("エラー", "環境変数 OPENAI_API_KEY が設定されていません")
             self.window.destroy()
             return
-        self.client = OpenAI(api_key=api_key)
-
-        self.vector_store_manager = VectorStoreManager(openai_api_key=api_key)
+        # Retries go through call_with_retries so the rate limiter sees every 429.
+        self.client = OpenAI(api_key=api_key, max_retries=0)
 
         self.model_var = ctk.StringVar(value="gpt-4.1-mini")
         self.messages = []
         self.uploaded_sources = []
+        self.vector_store_manager = self._create_vector_store(api_key)
         self.response_queue = queue.Queue()
 
         self.setup_ui()
@@ -152,21 +157,42 @@ class ChatGPTClient:
         self.status_label = ctk.CTkLabel(input_frame, text="準備完了", font=(FONT_FAMILY, 12), text_color="gray")
         self.status_label.grid(row=1, column=0, columnspan=2, sticky="w", pady=(5,0))
 
-    def _load_and_index_documents(self, source_path):
+    @staticmethod
+    def _source_label(source_path):
+        return os.path.basename(source_path) if not source_path.startswith('http') else source_path
+
+    def _create_vector_store(self, api_key):
+        """Return a vector store, restored from ``VECTOR_STORE_DIR`` when saved."""
+        manager = VectorStoreManager(openai_api_key=api_key)
+        if VECTOR_STORE_DIR and os.path.exists(os.path.join(VECTOR_STORE_DIR, VectorStoreManager.MANIFEST_FILE)):
+            try:
+                manager.load(VECTOR_STORE_DIR)
+                self.uploaded_sources = [self._source_label(s) for s in manager.sources()]
+            except Exception as e:
+                logging.warning(f"Failed to load vector store from {VECTOR_STORE_DIR}: {e}")
+        return manager
+
+    def _load_and_index_documents(self, source_paths):
         try:
-            self.response_queue.put(("status", "ドキュメントを読み込み中..."))
-            docs = load_document(source_path)
-            if not docs:
-                self.response_queue.put(("error", f"{os.path.basename(source_path)}からテキストを抽出できませんでした。"))
-                return
-
-            self.response_queue.put(("status", "ベクトル化中..."))
-            self.vector_store_manager.build_from_documents(docs)
-
-            source_name = os.path.basename(source_path) if not source_path.startswith('http') else source_path
-            self.uploaded_sources.append(source_name)
+            pipeline = IngestionPipeline(
+                self.vector_store_manager,
+                progress=lambda stats: self.response_queue.put(("status", f"取り込み中: {stats.summary()}")),
+            )
+            stats = pipeline.run(source_paths)
+            if VECTOR_STORE_DIR and stats.indexed:
+                self.vector_store_manager.save(VECTOR_STORE_DIR)
+
+            failed = {source for source, _ in stats.errors}
+            for source_path in source_paths:
+                source_name = self._source_label(source_path)
+                if source_path not in failed and source_name not in self.uploaded_sources:
+                    self.uploaded_sources.append(source_name)
             self.response_queue.put(("update_source_list", None))
-            self.response_queue.put(("status", "準備完了"))
+            if stats.errors:
+                details = "\n".join(f"{self._source_label(s)}: {m}" for s, m in stats.errors)
+                self.response_queue.put(("error", f"一部の取り込みに失敗しました。\n{details}"))
+            else:
+                self.response_queue.put(("status", "準備完了"))
         except Exception as e:
             self.response_queue.put(("error", f"処理中にエラーが発生しました: {e}"))
 
@@ -176,13 +202,14 @@ class ChatGPTClient:
             filetypes=[("Document Files", "*.pdf *.docx"), ("All files", "*.*")]
         )
         if file_paths:
-            for file_path in file_paths:
-                threading.Thread(target=self._load_and_index_documents, args=(file_path,), daemon=True).start()
+            # One pipeline for the whole selection bounds parsing and
+            # embedding concurrency however many files were chosen.
+            threading.Thread(target=self._load_and_index_documents, args=(list(file_paths),), daemon=True).start()
 
     def load_from_url(self):
         url = self.url_entry.get().strip()
         if url and url.startswith(('http://', 'https://')):
-            threading.Thread(target=self._load_and_index_documents, args=(url,), daemon=True).start()
+            threading.Thread(target=self._load_and_index_documents, args=([url],), daemon=True).start()
             self.url_entry.delete(0, "end")
         else:
             messagebox.showwarning("警告", "有効なURLを入力してください。")
@@ -236,7 +263,7 @@ class ChatGPTClient:
         context = "\n\n".join([doc.page_content for doc in retrieved_docs])
 
         if retrieved_docs:
-            citation_text = "\n\n---\n\n".join([f"Source: {doc.metadata.get('source', 'N/A')}, Page: {doc.metadata.get('page', 'N/A')}\n\n{doc.page_content}" for doc in retrieved_docs])
+            citation_text = "\n\n---\n\n".join([self._citation_entry(doc) for doc in retrieved_docs])
             self.response_queue.put(("citation", citation_text))
         else:
             self.response_queue.put(("citation", "関連する引用元は見つかりませんでした。"))
@@ -254,14 +281,26 @@ class ChatGPTClient:
         try:
             self.response_queue.put(("status", "応答を生成中..."))
             self.response_queue.put(("assistant_chunk", "Assistant: "))
-            stream = self.client.chat.completions.create(
-                model=self.model_var.get(), messages=prompt_messages, stream=True
-            )
             full_response = ""
-            for chunk in stream:
-                content = chunk.choices[0].delta.content or ""
-                full_response += content
-                self.response_queue.put(("assistant_chunk", content))
+            tokens = sum(estimate_tokens(m["content"]) for m in prompt_messages)
+            model = self.model_var.get()
+            with ExitStack() as slot:
+
+                def request(attempt_timeout):
+                    with ExitStack() as attempt:
+                        attempt.enter_context(get_rate_limiter().acquire(tokens, INTERACTIVE))
+                        response = self.client.chat.completions.create(
+                            model=model, messages=prompt_messages, stream=True
+                        )
+                        # The slot is held until the stream is read to the end.
+                        slot.push(attempt.pop_all())
+                        return response
+
+                stream = call_with_retries(request)
+                for chunk in stream:
+                    content = chunk.choices[0].delta.content or ""
+                    full_response += content
+                    self.response_queue.put(("assistant_chunk", content))
 
             self.messages.append({"role": "user", "content": user_message})
             self.messages.append({"role": "assistant", "content": full_response})
@@ -270,6 +309,14 @@ class ChatGPTClient:
         except Exception as e:
             self.response_queue.put(("error", f"API呼び出しエラー: {e}"))
 
+    @staticmethod
+    def _citation_entry(doc):
+        header = f"Source: {doc.metadata.get('source', 'N/A')}, Page: {doc.metadata.get('page', 'N/A')}"
+        article = format_citation(doc.metadata)
+        if article:
+            header += f", {article}"
+        return f"{header}\n\n{doc.page_content}"
+
     def display_message(self, text, tag):
         self.chat_display.configure(state="normal")
         self.chat_display.insert("end", text, (tag,))
@@ -279,7 +326,7 @@ class ChatGPTClient:
     def new_chat(self):
         self.messages = []
         self.uploaded_sources = []
-        self.vector_store_manager = VectorStoreManager(openai_api_key=os.getenv("OPENAI_API_KEY"))
+        self.vector_store_manager = self._create_vector_store(os.getenv("OPENAI_API_KEY"))
         self.chat_display.configure(state="normal")
         self.chat_display.delete("1.0", "end")
         self.chat_display.configure(state="disabled")
@@ -1,11 +1,75 @@
+import hashlib
+import json
 import logging
-from typing import List, Optional, Dict, Any
+import mmap
+import os
+import random
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 import faiss
 import numpy as np
 from openai import OpenAI
 
+from src import ann_index
+from src.bm25 import BM25Index, reciprocal_rank_fusion
+from src.embedding_cache import EmbeddingCache, QueryEmbeddingCache
+from src.rate_limiter import BATCH, INTERACTIVE, get_rate_limiter
+from src.retry import is_retryable
+from src.reranker import RERANKERS, Reranker, create_reranker, rerank as rerank_items
+from src.text_splitter import ClauseTextSplitter, RecursiveTextSplitter, SimpleTextSplitter  # noqa: F401
+
 logger = logging.getLogger(__name__)
 
+_NUMERAL = "[0-9一二三四五六七八九十百千]+"
+# Query terms only a lexical match can resolve: article numbers such as
+# "第5条の2第3項", and codes such as "EQ-100" (checked for a digit or capitals).
+_ARTICLE_TERM_RE = re.compile(rf"第{_NUMERAL}[編章節款条項号](?:の{_NUMERAL})?(?:第{_NUMERAL}[項号])*")
+_CODE_TERM_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9._/-]*")
+
+
+def _env_int(name: str, default: int, minimum: int = 1) -> int:
+    """Return an integer of at least *minimum* from the environment or *default*."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    try:
+        parsed = int(value)
+        if parsed < minimum:
+            raise ValueError
+        return parsed
+    except ValueError:
+        logger.warning("Invalid %s=%s, using default %s", name, value, default)
+        return default
+
+
+def _env_float(name: str, default: float, minimum: float = 0.0) -> float:
+    """Return a float of at least *minimum* from the environment or *default*."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    try:
+        parsed = float(value)
+        if parsed < minimum:
+            raise ValueError
+        return parsed
+    except ValueError:
+        logger.warning("Invalid %s=%s, using default %s", name, value, default)
+        return default
+
+
+def _env_optional_int(name: str) -> Optional[int]:
+    """Return a positive integer from the environment or ``None``."""
+    if os.getenv(name) is None:
+        return None
+    value = _env_int(name, 0)
+    return value or None
+
 # Re-implement a simple Document class to avoid langchain_core dependency issues
 class Document:
     def __init__(self, page_content: str, metadata: Dict[str, Any]):
@@ -14,78 +78,1280 @@ class Document:
     def __repr__(self):
         return f"Document(page_content='{self.page_content[:50]}...', metadata={self.metadata})"
 
-class SimpleTextSplitter:
-    """A basic text splitter that splits by paragraphs."""
-    def __init__(self, chunk_size=1000, chunk_overlap=200):
-        # These parameters are kept for API compatibility but are not used in this simple version.
-        pass
-
-    def split_documents(self, docs: List[Document]) -> List[Document]:
-        chunks = []
-        for doc in docs:
-            # Simple split by double newline, a common paragraph separator
-            paragraphs = doc.page_content.split('\\n\\n')
-            for para in paragraphs:
-                if para.strip(): # Avoid empty chunks
-                    chunks.append(Document(page_content=para, metadata=doc.metadata))
-        return chunks
+@dataclass
+class SearchFilter:
+    """Restrict a search to chunks whose metadata matches every given field.
+
+    *sources* is a collection of source paths or URLs and *pages* an
+    inclusive ``(first, last)`` page range where either end may be ``None``;
+    chunks without a page, such as DOCX files and web pages, are outside
+    every range. Both are resolved from the chunk table without decoding chunks.
+    *predicate* receives the metadata of each chunk that passed the other
+    fields and returns whether to keep it.
+    """
+
+    sources: Optional[Iterable[str]] = None
+    pages: Optional[Tuple[Optional[int], Optional[int]]] = None
+    predicate: Optional[Callable[[Dict[str, Any]], bool]] = None
+
+
+class ChunkStore:
+    """Chunk documents keyed by their FAISS id.
+
+    Chunks added during this session are kept in a dict. Chunks loaded with
+    :meth:`open` stay in a memory-mapped JSON Lines file together with an
+    ``(id, offset, length, source, page)`` table, and are decoded only when
+    requested, so opening a large store does not create a Python object per
+    chunk. The source and page columns let :meth:`select_ids` filter chunks
+    without decoding them.
+    """
+
+    def __init__(self) -> None:
+        self._docs: Dict[int, Document] = {}
+        self._keys: set[str] = set()
+        # Source names and their position, used as the table's source column,
+        # and the number of chunks of each so sources() needs no scan.
+        self._source_names: List[str] = []
+        self._source_ids: Dict[str, int] = {}
+        self._source_counts: List[int] = []
+        # ``(id, source, page)`` rows of the chunks in ``_docs``: row
+        # ``_mem_rows[id]`` of ``_mem_table``, which grows by doubling.
+        self._mem_table = np.empty((0, 3), dtype=np.int64)
+        self._mem_rows: Dict[int, int] = {}
+        self._file = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._disk_offsets = np.empty((0, 5), dtype=np.int64)
+        self._disk_keys = np.empty(0, dtype="S64")
+        self._disk_keys_loaded = True
+
+    @staticmethod
+    def key_for(doc: Document) -> str:
+        """Return a key identifying a chunk by its source and text."""
+        source = str(doc.metadata.get("source", ""))
+        return hashlib.sha256(f"{source}\0{doc.page_content}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _page_of(metadata: Dict[str, Any]) -> int:
+        try:
+            return int(metadata.get("page", -1))
+        except (TypeError, ValueError):
+            return -1
+
+    def _source_id(self, source: Optional[str]) -> int:
+        if source is None:
+            return -1
+        if source not in self._source_ids:
+            self._source_ids[source] = len(self._source_names)
+            self._source_names.append(source)
+            self._source_counts.append(0)
+        return self._source_ids[source]
+
+    def _count_sources(self, source_ids: np.ndarray, sign: int) -> None:
+        values, counts = np.unique(source_ids[source_ids >= 0], return_counts=True)
+        for source_id, count in zip(values.tolist(), counts.tolist()):
+            self._source_counts[source_id] += sign * count
+
+    @classmethod
+    def open(cls, chunks_path: str, offsets_path: str, keys_path: str, sources: List[str]) -> "ChunkStore":
+        """Open a store previously written by :meth:`save`."""
+        store = cls()
+        store._disk_offsets = np.load(offsets_path, mmap_mode="r")
+        if len(store._disk_offsets):
+            store._file = open(chunks_path, "rb")
+            store._mmap = mmap.mmap(store._file.fileno(), 0, access=mmap.ACCESS_READ)
+            # Mapped now rather than on first use: a later save() to the
+            # same directory deletes this generation's files.
+            store._disk_keys = np.load(keys_path, mmap_mode="r")
+        store._disk_keys_loaded = False
+        for source in sources:
+            store._source_id(source)
+        store._count_sources(store._disk_offsets[:, 3], 1)
+        return store
+
+    def _disk_position(self, doc_id: int) -> Optional[int]:
+        ids = self._disk_offsets[:, 0]
+        pos = int(np.searchsorted(ids, doc_id))
+        if pos < len(ids) and ids[pos] == doc_id:
+            return pos
+        return None
+
+    def _read_raw(self, pos: int) -> bytes:
+        offset, length = self._disk_offsets[pos, 1:3]
+        return self._mmap[int(offset):int(offset) + int(length)]
+
+    def _disk_key_rows(self) -> np.ndarray:
+        """Return the keys of on-disk chunks, aligned with the offset table."""
+        return self._disk_keys
+
+    def _ensure_keys(self) -> None:
+        # Keys of on-disk chunks are only needed for de-duplication when new
+        # documents are added, so a read-only store never loads them.
+        if not self._disk_keys_loaded:
+            self._keys.update(k.decode("ascii") for k in self._disk_key_rows().tolist())
+            self._disk_keys_loaded = True
+
+    def get(self, doc_id: int) -> Optional[Document]:
+        doc = self._docs.get(doc_id)
+        if doc is not None:
+            return doc
+        pos = self._disk_position(doc_id)
+        if pos is None:
+            return None
+        data = json.loads(self._read_raw(pos))
+        return Document(page_content=data["page_content"], metadata=data["metadata"])
+
+    def __getitem__(self, doc_id: int) -> Document:
+        doc = self.get(doc_id)
+        if doc is None:
+            raise KeyError(doc_id)
+        return doc
+
+    def __contains__(self, doc_id: object) -> bool:
+        return doc_id in self._docs or (
+            isinstance(doc_id, (int, np.integer)) and self._disk_position(int(doc_id)) is not None
+        )
+
+    def __len__(self) -> int:
+        return len(self._docs) + len(self._disk_offsets)
+
+    def __iter__(self) -> Iterator[int]:
+        # Replaced chunks move from disk to memory under the same id, so the
+        # two parts interleave.
+        yield from sorted(self._disk_offsets[:, 0].tolist() + list(self._docs))
+
+    def items(self) -> Iterator[Tuple[int, Document]]:
+        for doc_id in self:
+            yield doc_id, self[doc_id]
+
+    def values(self) -> Iterator[Document]:
+        for _, doc in self.items():
+            yield doc
+
+    def has_key(self, key: str) -> bool:
+        self._ensure_keys()
+        return key in self._keys
+
+    def add(self, doc_id: int, doc: Document) -> None:
+        self._ensure_keys()
+        self._docs[doc_id] = doc
+        self._keys.add(self.key_for(doc))
+        source = doc.metadata.get("source")
+        source_id = self._source_id(None if source is None else str(source))
+        row = len(self._mem_rows)
+        if row == len(self._mem_table):
+            table = np.empty((max(1024, 2 * row), 3), dtype=np.int64)
+            table[:row] = self._mem_table
+            self._mem_table = table
+        self._mem_table[row] = (doc_id, source_id, self._page_of(doc.metadata))
+        self._mem_rows[doc_id] = row
+        if source_id >= 0:
+            self._source_counts[source_id] += 1
+
+    def remove(self, ids: Iterable[int]) -> None:
+        """Drop the chunks with *ids*; unknown ids are ignored."""
+        ids = set(int(i) for i in ids)
+        self._ensure_keys()
+        for doc_id in ids & self._docs.keys():
+            self._keys.discard(self.key_for(self._docs.pop(doc_id)))
+            # Move the last row into the freed one.
+            row = self._mem_rows.pop(doc_id)
+            last = len(self._mem_rows)
+            self._count_sources(self._mem_table[row, 1:2], -1)
+            if row != last:
+                self._mem_table[row] = self._mem_table[last]
+                self._mem_rows[int(self._mem_table[row, 0])] = row
+        mask = np.isin(self._disk_offsets[:, 0], list(ids))
+        if mask.any():
+            self._count_sources(self._disk_offsets[mask, 3], -1)
+            disk_keys = self._disk_key_rows()
+            self._keys.difference_update(k.decode("ascii") for k in disk_keys[mask].tolist())
+            # Copies the surviving rows out of the memory-mapped table.
+            self._disk_offsets = self._disk_offsets[~mask]
+            self._disk_keys = disk_keys[~mask]
+
+    def replace(self, doc_id: int, doc: Document) -> None:
+        """Store *doc* under the existing *doc_id*."""
+        self.remove([doc_id])
+        self.add(doc_id, doc)
+
+    def sources(self) -> List[str]:
+        return sorted(name for name, count in zip(self._source_names, self._source_counts) if count > 0)
+
+    def _columns(self) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """Yield ``(id, source, page)`` column views of the on-disk and in-memory chunks."""
+        disk = self._disk_offsets
+        yield disk[:, 0], disk[:, 3], disk[:, 4]
+        mem = self._mem_table[: len(self._mem_rows)]
+        yield mem[:, 0], mem[:, 1], mem[:, 2]
+
+    def select_ids(
+        self,
+        sources: Optional[Iterable[str]] = None,
+        pages: Optional[Tuple[Optional[int], Optional[int]]] = None,
+    ) -> np.ndarray:
+        """Return the ids of chunks from *sources* within the inclusive *pages* range.
+
+        Chunks without a page number never match a page range.
+        """
+        wanted = None if sources is None else [self._source_ids[s] for s in sources if s in self._source_ids]
+        selected = []
+        for ids, source_ids, page_numbers in self._columns():
+            mask = np.ones(len(ids), dtype=bool)
+            if wanted is not None:
+                mask &= np.isin(source_ids, wanted)
+            if pages is not None:
+                low, high = pages
+                # Pageless chunks (DOCX, URLs) are stored with page -1.
+                mask &= page_numbers >= 0
+                if low is not None:
+                    mask &= page_numbers >= low
+                if high is not None:
+                    mask &= page_numbers <= high
+            selected.append(ids[mask])
+        return np.concatenate(selected)
+
+    def save(self, chunks_path: str, offsets_path: str, keys_path: str) -> None:
+        """Write every chunk to *chunks_path* with its offset table and keys."""
+        rows = []
+        keys = []
+        offset = 0
+        disk_keys = self._disk_key_rows()
+        # Source columns are written against the sorted names that end up
+        # in the manifest.
+        order = {name: n for n, name in enumerate(self.sources())}
+        remap = {i: order.get(name, -1) for i, name in enumerate(self._source_names)}
+        remap[-1] = -1
+        with open(chunks_path, "wb") as f:
+            for doc_id in self:
+                doc = self._docs.get(doc_id)
+                if doc is None:
+                    # Copy on-disk chunks verbatim without decoding them.
+                    pos = self._disk_position(doc_id)
+                    line = self._read_raw(pos)
+                    keys.append(bytes(disk_keys[pos]))
+                    source_id, page = (int(v) for v in self._disk_offsets[pos, 3:5])
+                else:
+                    line = json.dumps(
+                        {"page_content": doc.page_content, "metadata": doc.metadata},
+                        ensure_ascii=False,
+                    ).encode("utf-8")
+                    keys.append(self.key_for(doc).encode("ascii"))
+                    _, source_id, page = self._mem_table[self._mem_rows[doc_id]].tolist()
+                f.write(line + b"\n")
+                rows.append((doc_id, offset, len(line), remap[source_id], page))
+                offset += len(line) + 1
+        np.save(offsets_path, np.array(rows, dtype=np.int64).reshape(-1, 5))
+        np.save(keys_path, np.array(keys, dtype="S64"))
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class _ReadWriteLock:
+    """Lock shared by searches and held exclusively while the index changes.
+
+    Waiting writers go first so a steady stream of searches cannot starve
+    them. The lock is not reentrant.
+    """
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        with self._cond:
+            while self._writing or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+class Snapshot:
+    """The searchable state of a :class:`VectorStoreManager`.
+
+    Writers change the index, chunks and lexical index in place while they
+    hold the manager's lock exclusively; searches share it. Compaction,
+    rebuilds and :meth:`VectorStoreManager.load` prepare a new index or
+    snapshot without the lock and only swap it in under it. Only a missing
+    lexical index is built lazily from the chunks, under its own lock.
+    """
+
+    def __init__(
+        self,
+        index: Optional[faiss.IndexIDMap] = None,
+        documents: Optional[ChunkStore] = None,
+        lexical_index: Optional[BM25Index] = None,
+        tombstones: Iterable[int] = (),
+        next_id: int = 0,
+        index_type: str = "flat",
+        mapped: bool = False,
+        delta: Optional[faiss.IndexIDMap] = None,
+    ) -> None:
+        self.index = index
+        self.index_type = index_type
+        # A memory-mapped index is read-only. Vectors added after loading it
+        # go to ``delta``, an exact in-RAM index searched alongside it, until
+        # compaction merges the two.
+        self.mapped = mapped
+        self.delta = delta
+        # Chunks keyed by their FAISS id. Ids are assigned monotonically and
+        # never reused so they stay stable across appends.
+        self.documents = documents if documents is not None else ChunkStore()
+        # ``None`` until first use, so read-only vector search stays cheap.
+        self.lexical_index = lexical_index
+        # Ids removed from ``documents`` whose vectors are still in the index.
+        self.tombstones: set[int] = set(tombstones)
+        self.next_id = next_id
+        self._lexical_lock = threading.Lock()
+
+    @property
+    def ntotal(self) -> int:
+        """Number of vectors in the index and its write segment."""
+        if self.index is None:
+            return 0
+        return self.index.ntotal + (self.delta.ntotal if self.delta is not None else 0)
+
+    def segments(self) -> List[faiss.IndexIDMap]:
+        if self.index is None:
+            return []
+        return [self.index] if self.delta is None else [self.index, self.delta]
+
+    def add(self, embeddings: np.ndarray, ids: np.ndarray) -> None:
+        if self.mapped and self.delta is None:
+            self.delta = faiss.IndexIDMap(faiss.IndexFlat(self.index.d, self.index.metric_type))
+        (self.delta if self.delta is not None else self.index).add_with_ids(embeddings, ids)
+
+    def search(
+        self, vectors: np.ndarray, k: int, params: Optional[faiss.SearchParameters]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Search the index and its write segment, merging the results by distance."""
+        distances, indices = self.index.search(vectors, k, params=params)
+        if self.delta is None or not self.delta.ntotal:
+            return distances, indices
+        sel = params.sel if params is not None else None
+        delta_distances, delta_indices = self.delta.search(
+            vectors, k, params=faiss.SearchParameters(sel=sel) if sel is not None else None
+        )
+        distances = np.hstack([distances, delta_distances])
+        indices = np.hstack([indices, delta_indices])
+        # Missing results are padded with -1 ids; keep them last.
+        distances = np.where(indices == -1, np.inf, distances)
+        order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(distances, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+    def lexical(self) -> BM25Index:
+        """Return the lexical index, building it on first use."""
+        if self.lexical_index is None:
+            with self._lexical_lock:
+                if self.lexical_index is None:
+                    lexical_index = BM25Index()
+                    for doc_id, doc in self.documents.items():
+                        lexical_index.add(doc_id, doc.page_content)
+                    self.lexical_index = lexical_index
+        return self.lexical_index
+
 
 class VectorStoreManager:
-    def __init__(self, openai_api_key: Optional[str] = None):
-        self.text_splitter = SimpleTextSplitter()
-        self.client = OpenAI(api_key=openai_api_key)
-        self.index: Optional[faiss.IndexIDMap] = None
-        self.documents: List[Document] = []
+    EMBEDDING_MODEL = "text-embedding-3-small"
+    DEFAULT_CHUNK_SIZE = 500
+    DEFAULT_QUERY_CACHE_SIZE = 1024
+    DEFAULT_QUERY_CACHE_TTL = 3600
+    DEFAULT_CHUNK_OVERLAP = 50
+    TEXT_SPLITTERS = {"clause": ClauseTextSplitter, "recursive": RecursiveTextSplitter}
+    # The API accepts at most 2048 inputs and 300k tokens per request; stay
+    # well below both so a single batch never fails outright.
+    DEFAULT_BATCH_SIZE = 256
+    DEFAULT_BATCH_TOKENS = 100_000
+    DEFAULT_MAX_WORKERS = 4
+    DEFAULT_MAX_RETRIES = 5
+    RETRY_BASE_DELAY = 1.0
+    MANIFEST_FILE = "manifest.json"
+    DEFAULT_TRAIN_MIN = 10_000
+    # Removed vectors stay in the index as tombstones until they make up
+    # this fraction of it.
+    DEFAULT_COMPACT_FRACTION = 0.2
+    SEARCH_MODES = ("hybrid", "vector", "lexical")
+    # Each retriever contributes this many candidates per requested result
+    # before reciprocal-rank fusion.
+    HYBRID_CANDIDATES = 4
+    # Candidates recalled for the re-ranker.
+    DEFAULT_RERANK_CANDIDATES = 50
+
+    def __init__(
+        self,
+        openai_api_key: Optional[str] = None,
+        *,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        index_type: Optional[str] = None,
+        index_params: Optional[Dict[str, int]] = None,
+        reranker: Optional[Reranker] = None,
+    ):
+        splitter_name = os.getenv("TEXT_SPLITTER", "clause")
+        if splitter_name not in self.TEXT_SPLITTERS:
+            logger.warning("Invalid TEXT_SPLITTER=%s, using clause", splitter_name)
+            splitter_name = "clause"
+        self.text_splitter = self.TEXT_SPLITTERS[splitter_name](
+            chunk_size=_env_int("CHUNK_SIZE", self.DEFAULT_CHUNK_SIZE),
+            chunk_overlap=_env_int("CHUNK_OVERLAP", self.DEFAULT_CHUNK_OVERLAP, minimum=0),
+        )
+        # The SDK must not retry on its own: _embed_batch retries, and every
+        # 429 has to reach the rate limiter.
+        self.client = OpenAI(api_key=openai_api_key, max_retries=0)
+        if embedding_cache is None:
+            embedding_cache = EmbeddingCache(os.getenv("EMBEDDING_CACHE_PATH", ":memory:"))
+        self.embedding_cache = embedding_cache
+        self.query_cache = QueryEmbeddingCache(
+            max_size=_env_int("QUERY_CACHE_SIZE", self.DEFAULT_QUERY_CACHE_SIZE),
+            ttl=_env_int("QUERY_CACHE_TTL", self.DEFAULT_QUERY_CACHE_TTL),
+        )
+        self.batch_size = _env_int("EMBEDDING_BATCH_SIZE", self.DEFAULT_BATCH_SIZE)
+        self.batch_tokens = _env_int("EMBEDDING_BATCH_TOKENS", self.DEFAULT_BATCH_TOKENS)
+        self.max_workers = _env_int("EMBEDDING_MAX_WORKERS", self.DEFAULT_MAX_WORKERS)
+        self.max_retries = _env_int("EMBEDDING_MAX_RETRIES", self.DEFAULT_MAX_RETRIES)
+        self.index_type = index_type or os.getenv("VECTOR_INDEX_TYPE", "flat")
+        if self.index_type not in ann_index.INDEX_TYPES:
+            raise ValueError(f"Unknown index type: {self.index_type!r}")
+        if index_params is None:
+            index_params = {
+                "nlist": _env_optional_int("VECTOR_NLIST"),
+                "pq_m": _env_optional_int("VECTOR_PQ_M"),
+                "pq_bits": _env_optional_int("VECTOR_PQ_BITS"),
+                "hnsw_m": _env_optional_int("VECTOR_HNSW_M"),
+            }
+        self.index_params = {k: v for k, v in index_params.items() if v}
+        self.nprobe = _env_optional_int("VECTOR_NPROBE")
+        self.ef_search = _env_optional_int("VECTOR_EF_SEARCH")
+        # Trained index types start as an exact index and are converted once
+        # enough vectors are available to train their quantizers.
+        self.train_min = _env_int("VECTOR_TRAIN_MIN", self.DEFAULT_TRAIN_MIN)
+        self.compact_fraction = _env_float("VECTOR_COMPACT_FRACTION", self.DEFAULT_COMPACT_FRACTION)
+        self.search_mode = os.getenv("SEARCH_MODE", "hybrid")
+        if self.search_mode not in self.SEARCH_MODES:
+            logger.warning("Invalid SEARCH_MODE=%s, using hybrid", self.search_mode)
+            self.search_mode = "hybrid"
+        if reranker is None:
+            reranker_name = os.getenv("RERANKER", "tfidf")
+            if reranker_name not in RERANKERS:
+                logger.warning("Invalid RERANKER=%s, using tfidf", reranker_name)
+                reranker_name = "tfidf"
+            reranker = create_reranker(reranker_name, llm=self._complete, model=os.getenv("RERANK_MODEL"))
+        self.reranker = reranker
+        self.rerank_candidates = _env_int("RERANK_CANDIDATES", self.DEFAULT_RERANK_CANDIDATES)
+        # Each re-ranker has its own default; the llm one needs far longer.
+        default_budget = (reranker or Reranker).DEFAULT_BUDGET_MS
+        self.rerank_budget = _env_int("RERANK_BUDGET_MS", default_budget) / 1000
+        # Writers serialize on ``_write_lock`` and change the snapshot in
+        # place while holding ``_rw`` exclusively; searches share ``_rw``.
+        self._snapshot = Snapshot()
+        self._write_lock = threading.Lock()
+        self._rw = _ReadWriteLock()
+        self._compaction: Optional[threading.Thread] = None
+        # Set by every change and cleared by save() and load().
+        self._dirty = False
+
+    @property
+    def index(self) -> Optional[faiss.IndexIDMap]:
+        return self._snapshot.index
+
+    @property
+    def documents(self) -> ChunkStore:
+        return self._snapshot.documents
+
+    def _complete(self, prompt: str) -> str:
+        """Return a chat completion for *prompt*; used by the ``llm`` re-ranker.
+
+        The search stops waiting for the scores after ``rerank_budget``, so
+        the request is skipped if no rate-limiter slot frees up by then and
+        is otherwise aborted at that deadline instead of holding its slot
+        and spending tokens on a result nobody reads.
+        """
+        deadline = time.monotonic() + self.rerank_budget
+        with get_rate_limiter().acquire(self._estimate_tokens(prompt), INTERACTIVE):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("re-ranking budget spent waiting for the rate limiter")
+            resp = self.client.chat.completions.create(
+                model=os.getenv("RERANK_MODEL") or os.getenv("OPENAI_MODEL", "gpt-4.1-mini-2025-04-14"),
+                messages=[{"role": "user", "content": prompt}],
+                timeout=remaining,
+            )
+        return resp.choices[0].message.content
+
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        # Japanese text is close to one token per character and English is
+        # about four characters per token, so the length is a safe ceiling.
+        return max(1, len(text))
+
+    def _make_batches(self, texts: List[str]) -> List[List[str]]:
+        """Split *texts* into batches bounded by item count and token estimate."""
+        batches: List[List[str]] = []
+        current: List[str] = []
+        current_tokens = 0
+        for text in texts:
+            tokens = self._estimate_tokens(text)
+            if current and (
+                len(current) >= self.batch_size
+                or current_tokens + tokens > self.batch_tokens
+            ):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(text)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def _embed_batch(self, texts: List[str], priority: int = BATCH) -> np.ndarray:
+        """Embed one batch, retrying transient failures with backoff.
+
+        Requests go through the process-wide rate limiter, which also learns
+        from rate-limit errors.
+        """
+        tokens = sum(self._estimate_tokens(t) for t in texts)
+        for attempt in range(self.max_retries + 1):
+            try:
+                with get_rate_limiter().acquire(tokens, priority):
+                    response = self.client.embeddings.create(input=texts, model=self.EMBEDDING_MODEL)
+                return np.array([item.embedding for item in response.data], dtype=np.float32)
+            except Exception as exc:
+                if attempt >= self.max_retries or not is_retryable(exc):
+                    raise
+                delay = self.RETRY_BASE_DELAY * (2 ** attempt) * (0.5 + random.random())
+                logger.warning(
+                    "Embedding request failed (%s), retrying in %.1fs", exc, delay
+                )
+                time.sleep(delay)
+
+    def _request_embeddings(self, texts: List[str], priority: int = BATCH) -> np.ndarray:
+        """Embed *texts* in concurrent batches and return vectors in order."""
+        batches = self._make_batches(texts)
+        if len(batches) == 1:
+            return self._embed_batch(batches[0], priority)
+        logger.info(f"Embedding {len(texts)} texts in {len(batches)} batches.")
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as pool:
+            results = list(pool.map(lambda batch: self._embed_batch(batch, priority), batches))
+        return np.vstack(results)
 
     def _embed_documents(self, texts: List[str]) -> np.ndarray:
-        response = self.client.embeddings.create(input=texts, model="text-embedding-3-small")
-        return np.array([item.embedding for item in response.data], dtype=np.float32)
+        """Embed *texts*, sending only cache misses to the API."""
+        cached = self.embedding_cache.get_many(self.EMBEDDING_MODEL, texts)
+        missing = [i for i, vec in enumerate(cached) if vec is None]
+        if missing:
+            # Identical texts within one call are embedded once.
+            unique = list(dict.fromkeys(texts[i] for i in missing))
+            fresh = self._request_embeddings(unique)
+            self.embedding_cache.put_many(self.EMBEDDING_MODEL, unique, fresh)
+            by_text = dict(zip(unique, fresh))
+            for i in missing:
+                cached[i] = by_text[texts[i]]
+        logger.info(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} misses.")
+        return np.vstack(cached).astype(np.float32)
+
+    def _embed_queries(self, texts: List[str]) -> np.ndarray:
+        """Embed *texts* through the query LRU.
+
+        All misses are sent in one batched request and concurrent requests
+        for the same query are coalesced.
+        """
+        vectors = self.query_cache.get_many(texts, lambda keys: list(self._request_embeddings(keys, INTERACTIVE)))
+        return np.vstack(vectors).astype(np.float32)
 
     def _embed_query(self, text: str) -> np.ndarray:
-        response = self.client.embeddings.create(input=[text], model="text-embedding-3-small")
-        return np.array([response.data[0].embedding], dtype=np.float32)
+        return self._embed_queries([text])
+
+    def new_chunks(self, chunks: List[Document]) -> List[Document]:
+        """Drop chunks that are already indexed or repeated within ``chunks``."""
+        seen = set()
+        fresh = []
+        with self._write_lock:
+            for chunk in chunks:
+                key = ChunkStore.key_for(chunk)
+                if key not in seen and not self.documents.has_key(key):
+                    seen.add(key)
+                    fresh.append(chunk)
+        return fresh
+
+    def embed_chunks(self, chunks: List[Document]) -> np.ndarray:
+        """Return the embeddings of *chunks*, using the embedding cache."""
+        return self._embed_documents([c.page_content for c in chunks])
+
+    def insert_chunks(self, chunks: List[Document], embeddings: np.ndarray) -> int:
+        """Index *chunks* with precomputed *embeddings* and publish them.
+
+        Chunks indexed by another thread in the meantime are skipped.
+        Returns the number of chunks that were added.
+        """
+        with self._writing() as snapshot:
+            added = self._insert(snapshot, chunks, embeddings)
+        self._maybe_train()
+        return added
+
+    @contextmanager
+    def _writing(self) -> Iterator[Snapshot]:
+        """Yield the current snapshot for changing it in place.
+
+        Writers are serialized. Searches wait while the block runs, so it
+        should only update the index, chunks and lexical index in memory.
+        """
+        with self._write_lock:
+            # Build a missing lexical index before searches are locked out.
+            self._snapshot.lexical()
+            with self._rw.write():
+                yield self._snapshot
+
+    def add_documents(self, docs: List[Document]) -> int:
+        """Append ``docs`` to the existing index.
+
+        Only chunks that are not indexed yet are embedded. The method is safe
+        to call from several threads at once; embedding runs before the
+        write lock is taken, so parallel uploads overlap their API calls and
+        searches are never blocked.
+
+        Returns the number of chunks that were added.
+        """
+        chunks = self.text_splitter.split_documents(docs)
+        logger.info(f"Split documents into {len(chunks)} chunks.")
+        chunks = self.new_chunks(chunks)
+        if not chunks:
+            logger.info("No new chunks to index.")
+            return 0
+
+        embeddings = self.embed_chunks(chunks)
+        logger.info(f"Created {len(embeddings)} embeddings.")
+        return self.insert_chunks(chunks, embeddings)
+
+    def add_document_stream(self, docs: Iterable[Document], batch_chunks: Optional[int] = None) -> int:
+        """Index *docs* while they are still being produced.
+
+        *docs* is consumed lazily, e.g. from
+        :func:`src.document_loader.iter_document`, and every *batch_chunks*
+        chunks (one embedding request per worker by default) are embedded
+        and published before the next page is read. Memory therefore stays
+        bounded by the batch size, and the first pages of a long PDF are
+        searchable while the rest is still being parsed.
+
+        Returns the number of chunks that were added.
+        """
+        batch_chunks = batch_chunks or self.batch_size * self.max_workers
+        added = 0
+        batch: List[Document] = []
+        for chunk in self.text_splitter.iter_split_documents(docs):
+            batch.append(chunk)
+            if len(batch) >= batch_chunks:
+                added += self._add_batch(batch)
+                batch = []
+        if batch:
+            added += self._add_batch(batch)
+        return added
+
+    def _add_batch(self, chunks: List[Document]) -> int:
+        chunks = self.new_chunks(chunks)
+        if not chunks:
+            return 0
+        return self.insert_chunks(chunks, self.embed_chunks(chunks))
+
+    def _insert(self, snapshot: Snapshot, chunks: List[Document], embeddings: np.ndarray) -> int:
+        """Index *chunks* with their precomputed *embeddings* in *snapshot*."""
+        # Another thread may have indexed the same chunks meanwhile.
+        keep = [i for i, c in enumerate(chunks) if not snapshot.documents.has_key(ChunkStore.key_for(c))]
+        if not keep:
+            return 0
+        chunks = [chunks[i] for i in keep]
+        embeddings = embeddings[keep]
+        ids = np.arange(snapshot.next_id, snapshot.next_id + len(chunks), dtype="int64")
+        if snapshot.index is None:
+            # Index types without a training step are used right away.
+            index_type = "flat" if self.index_type in ann_index.TRAINED_TYPES else self.index_type
+            snapshot.index = ann_index.create_index(index_type, embeddings, ids, **self.index_params)
+            snapshot.index_type = index_type
+        else:
+            snapshot.add(embeddings, ids)
+        lexical_index = snapshot.lexical()
+        for doc_id, chunk in zip(ids.tolist(), chunks):
+            snapshot.documents.add(doc_id, chunk)
+            lexical_index.add(doc_id, chunk.page_content)
+        snapshot.next_id += len(chunks)
+        self._dirty = True
+        if snapshot.delta is not None and snapshot.delta.ntotal >= self.compact_fraction * snapshot.ntotal:
+            self._schedule_compaction()
+        logger.info(f"Added {len(chunks)} vectors; index now holds {snapshot.ntotal}.")
+        return len(chunks)
+
+    def remove_source(self, source: str) -> int:
+        """Remove every chunk of *source* and return how many were removed."""
+        with self._writing() as snapshot:
+            ids = snapshot.documents.select_ids([source]).tolist()
+            self._remove_ids(snapshot, ids)
+        logger.info(f"Removed {len(ids)} chunks of {source}.")
+        return len(ids)
+
+    def replace_source(self, source: str, docs: List[Document]) -> Dict[str, int]:
+        """Replace the indexed chunks of *source* with the chunks of *docs*.
+
+        Chunks whose text is unchanged keep their vectors and ids (their
+        metadata, e.g. a shifted page number, is updated in place); only new
+        or edited chunks are embedded. Searches see either the old or the
+        new version of the source, never a mix. Returns the number of
+        chunks ``added``, ``removed`` and ``updated``.
+        """
+        new: Dict[str, Document] = {}
+        for chunk in self.text_splitter.split_documents(docs):
+            chunk.metadata.setdefault("source", source)
+            new.setdefault(ChunkStore.key_for(chunk), chunk)
+        with self._write_lock:
+            fresh = [c for key, c in new.items() if not self.documents.has_key(key)]
+        embeddings = self._embed_documents([c.page_content for c in fresh]) if fresh else None
+
+        with self._writing() as snapshot:
+            old = self._source_keys(snapshot, source)
+            stale = [doc_id for key, doc_id in old.items() if key not in new]
+            updated = self._update_metadata(snapshot, {doc_id: new[key] for key, doc_id in old.items() if key in new})
+            self._remove_ids(snapshot, stale)
+            added = self._insert(snapshot, fresh, embeddings) if fresh else 0
+        self._maybe_train()
+        logger.info(f"Replaced {source}: {added} added, {len(stale)} removed, {updated} updated.")
+        return {"added": added, "removed": len(stale), "updated": updated}
+
+    def source_keys(self, source: str) -> Dict[str, int]:
+        """Return the ids of the indexed chunks of *source* by :meth:`ChunkStore.key_for`.
+
+        With :meth:`update_metadata`, :meth:`insert_chunks` and
+        :meth:`remove_chunks` this replaces a source piece by piece, e.g.
+        while it is still being parsed. Unlike :meth:`replace_source`,
+        searches then see a mix of both versions until it is done.
+        """
+        with self._rw.read():
+            return self._source_keys(self._snapshot, source)
+
+    @staticmethod
+    def _source_keys(snapshot: Snapshot, source: str) -> Dict[str, int]:
+        documents = snapshot.documents
+        return {ChunkStore.key_for(documents[i]): i for i in documents.select_ids([source]).tolist()}
+
+    def update_metadata(self, chunks: Dict[int, Document]) -> int:
+        """Store *chunks* under their ids where only their metadata changed.
+
+        Returns the number of chunks that were updated.
+        """
+        with self._writing() as snapshot:
+            return self._update_metadata(snapshot, chunks)
+
+    def _update_metadata(self, snapshot: Snapshot, chunks: Dict[int, Document]) -> int:
+        documents = snapshot.documents
+        updated = 0
+        for doc_id, chunk in chunks.items():
+            current = documents.get(doc_id)
+            if current is not None and current.metadata != chunk.metadata:
+                documents.replace(doc_id, chunk)
+                self._dirty = True
+                updated += 1
+        return updated
+
+    def remove_chunks(self, ids: Iterable[int]) -> int:
+        """Remove the chunks with *ids* and return how many were indexed."""
+        with self._writing() as snapshot:
+            ids = [doc_id for doc_id in ids if doc_id in snapshot.documents]
+            self._remove_ids(snapshot, ids)
+        return len(ids)
+
+    def _remove_ids(self, snapshot: Snapshot, ids: List[int]) -> None:
+        if not ids:
+            return
+        lexical_index = snapshot.lexical()
+        for doc_id in ids:
+            lexical_index.remove(doc_id)
+        snapshot.documents.remove(ids)
+        self._dirty = True
+        # Vectors are only marked as removed here: remove_ids shifts the
+        # whole index (and HNSW does not support it), so removals are
+        # batched into a background compaction.
+        snapshot.tombstones.update(ids)
+        if len(snapshot.tombstones) >= self.compact_fraction * snapshot.ntotal:
+            self._schedule_compaction()
+
+    def _schedule_compaction(self) -> None:
+        if not (self._compaction and self._compaction.is_alive()):
+            self._compaction = threading.Thread(target=self.compact, name="vector-compaction", daemon=True)
+            self._compaction.start()
+
+    def compact(self) -> None:
+        """Drop the vectors of removed chunks and merge the write segment into the index."""
+        with self._write_lock:
+            snapshot = self._snapshot
+            if snapshot.index is None or not (snapshot.tombstones or snapshot.delta is not None):
+                return
+            removed = len(snapshot.tombstones)
+            selector = faiss.IDSelectorBatch(np.array(sorted(snapshot.tombstones), dtype="int64"))
+            try:
+                if snapshot.mapped:
+                    # Searches keep using the mapped index while it is copied.
+                    index = ann_index.in_memory(snapshot.index)
+                    if snapshot.delta is not None:
+                        index.add_with_ids(
+                            snapshot.delta.index.reconstruct_n(0, snapshot.delta.ntotal),
+                            faiss.vector_to_array(snapshot.delta.id_map),
+                        )
+                    index.remove_ids(selector)
+                    with self._rw.write():
+                        snapshot.index, snapshot.delta, snapshot.mapped = index, None, False
+                        snapshot.tombstones.clear()
+                else:
+                    with self._rw.write():
+                        snapshot.index.remove_ids(selector)
+                        snapshot.tombstones.clear()
+            except RuntimeError:
+                # Graph indexes cannot remove vectors; rebuild without them.
+                self._rebuild(snapshot, snapshot.index_type, self.index_params)
+        logger.info(f"Compacted {removed} removed vectors; index now holds {snapshot.ntotal}.")
+
+    def reset(self) -> None:
+        """Remove every indexed chunk."""
+        with self._write_lock:
+            self._snapshot = Snapshot()
+            self._dirty = True
+
+    def _maybe_train(self) -> None:
+        """Convert the exact staging index once the target type can be trained."""
+        if self.index_type not in ann_index.TRAINED_TYPES:
+            return
+        with self._write_lock:
+            snapshot = self._snapshot
+            if snapshot.index_type != "flat" or snapshot.index is None:
+                return
+            needed = max(self.train_min, ann_index.min_training_points(self.index_type, **self.index_params))
+            if snapshot.ntotal >= needed:
+                self._rebuild(snapshot, self.index_type, self.index_params)
+
+    def _stored_vectors(self, snapshot: Snapshot) -> Tuple[np.ndarray, np.ndarray]:
+        """Return ``(vectors, ids)`` of every chunk in the index of *snapshot*."""
+        all_vectors, all_ids = [], []
+        for index in snapshot.segments():
+            ids = faiss.vector_to_array(index.id_map).astype("int64")
+            live = ~np.isin(ids, list(snapshot.tombstones))
+            try:
+                vectors = index.index.reconstruct_n(0, index.ntotal)[live]
+            except RuntimeError:
+                # Lossy or non-reconstructible index: fetch the originals from
+                # the embedding cache, which only calls the API for misses.
+                texts = [snapshot.documents[int(i)].page_content for i in ids[live]]
+                vectors = self._embed_documents(texts) if texts else np.empty((0, index.d))
+            all_vectors.append(np.asarray(vectors, dtype=np.float32))
+            all_ids.append(ids[live])
+        return np.ascontiguousarray(np.vstack(all_vectors)), np.concatenate(all_ids)
+
+    def _rebuild(self, snapshot: Snapshot, index_type: str, params: Dict[str, int]) -> None:
+        """Build *snapshot*'s index anew as *index_type* and swap it in.
+
+        The caller holds ``_write_lock``, so nothing changes while searches
+        keep using the current index.
+        """
+        vectors, ids = self._stored_vectors(snapshot)
+        logger.info(f"Rebuilding {len(ids)} vectors as a {index_type} index.")
+        index = ann_index.create_index(index_type, vectors, ids, **params)
+        with self._rw.write():
+            snapshot.index, snapshot.delta, snapshot.mapped = index, None, False
+            snapshot.index_type = index_type
+            snapshot.tombstones.clear()
+
+    def rebuild_index(self, index_type: Optional[str] = None, **params: int) -> None:
+        """Re-create the index as *index_type*, training it on the stored vectors.
+
+        Parameters default to the values the manager was configured with.
+        Searches keep using the current index until the new one is ready.
+        """
+        with self._write_lock:
+            if index_type is not None:
+                self.index_type = index_type
+            if params:
+                self.index_params = {k: v for k, v in params.items() if v}
+            if self._snapshot.index is not None:
+                self._rebuild(self._snapshot, self.index_type, self.index_params)
+
+    def index_report(
+        self,
+        configs: List[Dict[str, Any]],
+        num_queries: int = 100,
+        top_k: int = 10,
+    ) -> List[Dict[str, Any]]:
+        """Return a recall-vs-latency report for *configs* on the stored vectors.
+
+        Queries are sampled from the indexed vectors themselves. See
+        :func:`src.ann_index.recall_report` for the format of *configs*.
+        """
+        vectors, _ids = self._stored_vectors(self._snapshot)
+        rng = np.random.default_rng(0)
+        sample = rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False)
+        return ann_index.recall_report(vectors, vectors[sample], configs, top_k=top_k)
 
     def build_from_documents(self, docs: List[Document]):
+        """Replace the current index with one built from ``docs``."""
         try:
             logger.info(f"Starting to build vector store from {len(docs)} documents.")
-            chunks = self.text_splitter.split_documents(docs)
-            logger.info(f"Split documents into {len(chunks)} chunks.")
-
-            if not chunks:
+            self.reset()
+            self.add_documents(docs)
+            index = self.index
+            if index is None:
                 logger.warning("No chunks to index.")
                 return
+            logger.info(f"Successfully built FAISS index with {index.ntotal} vectors.")
+        except Exception as e:
+            logger.error(f"Failed to build vector store: {e}", exc_info=True)
+            self.reset()
 
-            texts = [c.page_content for c in chunks]
-            text_embeddings_np = self._embed_documents(texts)
+    @staticmethod
+    def _is_keyword_query(query: str) -> bool:
+        """Return True for lookups of codes and article numbers, e.g. "AB-123 第5条".
 
-            logger.info(f"Created {len(text_embeddings_np)} embeddings.")
+        They are answered from the lexical index alone. Anything else, even
+        a short question such as 「解約したらお金は戻る」, needs semantic search.
+        """
+        terms = unicodedata.normalize("NFKC", query).split()
+        return bool(terms) and all(
+            _ARTICLE_TERM_RE.fullmatch(term)
+            or (_CODE_TERM_RE.fullmatch(term) and (any(c.isdigit() for c in term) or term.isupper()))
+            for term in terms
+        )
 
-            d = text_embeddings_np.shape[1]
-            self.index = faiss.IndexIDMap(faiss.IndexFlatL2(d))
-            ids = np.arange(len(chunks)).astype('int64')
-            self.index.add_with_ids(text_embeddings_np, ids)
+    @staticmethod
+    def _documents_for(snapshot: Snapshot, ids: List[int]) -> List[Document]:
+        documents = snapshot.documents
+        return [doc for doc in (documents.get(int(i)) for i in ids if i != -1) if doc is not None]
 
-            self.documents = chunks
-            logger.info(f"Successfully built FAISS index with {self.index.ntotal} vectors.")
-        except Exception as e:
-            logger.error(f"Failed to build vector store: {e}", exc_info=True)
-            self.index = None
-            self.documents = []
+    @staticmethod
+    def _allowed_ids(snapshot: Snapshot, filters: SearchFilter) -> np.ndarray:
+        """Return the sorted ids of chunks in *snapshot* matching *filters*."""
+        documents = snapshot.documents
+        ids = documents.select_ids(filters.sources, filters.pages)
+        if filters.predicate is not None:
+            ids = np.array([i for i in ids.tolist() if filters.predicate(documents[i].metadata)], dtype=np.int64)
+        return np.sort(ids)
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 5,
+        *,
+        mode: Optional[str] = None,
+        max_distance: Optional[float] = None,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filters: Optional[SearchFilter] = None,
+        rerank: bool = True,
+    ) -> List[Document]:
+        """Return the *top_k* chunks most relevant to *query*.
 
-    def search(self, query: str, top_k: int = 5) -> List[Document]:
-        if not self.is_ready():
+        *mode* is ``"hybrid"`` (default, BM25 and vector results combined
+        with reciprocal-rank fusion), ``"vector"`` or ``"lexical"``. In hybrid
+        mode short keyword queries that the lexical index can answer skip the
+        embedding call entirely. With *max_distance* (squared L2) only chunks
+        within that vector distance are returned, in every mode that has
+        one: hybrid results are fused and then limited to such chunks, and
+        lexical mode rejects it. *nprobe* (IVF indexes) and *ef_search*
+        (HNSW) override the configured speed/recall trade-off for this query
+        only. *filters* restricts the results to matching chunks; the
+        restriction is applied inside the index, so only matching chunks are
+        ranked. Unless *rerank* is false, ``RERANK_CANDIDATES`` chunks are
+        recalled and the configured re-ranker picks the best *top_k* of them
+        within ``RERANK_BUDGET_MS``.
+        """
+        results = self.search_many(
+            [query],
+            top_k,
+            mode=mode,
+            max_distance=max_distance,
+            nprobe=nprobe,
+            ef_search=ef_search,
+            filters=filters,
+            rerank=rerank,
+        )[0]
+        logger.info(f"Search found {len(results)} relevant chunks.")
+        return results
+
+    def search_many(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        *,
+        mode: Optional[str] = None,
+        max_distance: Optional[float] = None,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filters: Optional[SearchFilter] = None,
+        rerank: bool = True,
+    ) -> List[List[Document]]:
+        """Run :meth:`search` for every query in *queries*.
+
+        Embeddings of all queries that need vector search are requested in
+        as few batched calls as possible, and the index is searched once with
+        the whole query matrix. *filters* applies to every query. Returns one
+        result list per query.
+        """
+        # The index and chunks are only read under the shared lock, which
+        # writers hold briefly; the embedding and re-ranking calls run
+        # without it. A store replaced by load() or reset() stays usable.
+        snapshot = self._snapshot
+        if snapshot.index is None or not snapshot.documents:
             logger.warning("Vector store is not built yet.")
-            return []
+            return [[] for _ in queries]
 
+        mode = mode or self.search_mode
+        if max_distance is not None and mode == "lexical":
+            raise ValueError("max_distance needs vector distances and cannot be used in lexical mode")
+        reranker = self.reranker if rerank else None
+        # With a re-ranker the first stage only has to recall, so it returns
+        # more results than requested.
+        recall = max(top_k, self.rerank_candidates) if reranker else top_k
+        candidates = recall if mode == "vector" else recall * self.HYBRID_CANDIDATES
         try:
-            query_embedding_np = self._embed_query(query)
-            distances, indices = self.index.search(query_embedding_np, top_k)
-            results = [self.documents[i] for i in indices[0] if i < len(self.documents)]
-            logger.info(f"Search found {len(results)} relevant chunks.")
+            allowed = selector = removed = None
+            selectivity = 1.0
+            lexical: List[List[int]] = [[] for _ in queries]
+            resolved: Dict[int, List[int]] = {}
+            with self._rw.read():
+                if filters is not None:
+                    allowed = self._allowed_ids(snapshot, filters)
+                    selectivity = len(allowed) / max(snapshot.ntotal, 1)
+                elif snapshot.tombstones:
+                    removed = faiss.IDSelectorBatch(np.array(sorted(snapshot.tombstones), dtype="int64"))
+                    selectivity = 1 - len(snapshot.tombstones) / max(snapshot.ntotal, 1)
+                if allowed is not None:
+                    if not len(allowed):
+                        return [[] for _ in queries]
+                    selector = faiss.IDSelectorBatch(allowed)
+                elif removed is not None:
+                    # ``removed`` must outlive the search that uses ``selector``.
+                    selector = faiss.IDSelectorNot(removed)
+
+                if mode != "vector":
+                    lexical_index = snapshot.lexical()
+                    lexical = [[i for i, _ in lexical_index.search(q, candidates, allowed=allowed)] for q in queries]
+                    for n, query in enumerate(queries):
+                        if mode == "lexical" or (
+                            # A distance threshold needs the query embedding.
+                            lexical[n] and max_distance is None and self._is_keyword_query(query)
+                        ):
+                            resolved[n] = lexical[n][:recall]
+
+            pending = [n for n in range(len(queries)) if n not in resolved]
+            query_vectors = self._embed_queries([queries[n] for n in pending]) if pending else None
+            with self._rw.read():
+                if pending:
+                    params = ann_index.search_parameters(
+                        snapshot.index,
+                        nprobe=nprobe or self.nprobe,
+                        ef_search=ef_search or self.ef_search,
+                        selector=selector,
+                        selectivity=selectivity,
+                    )
+                    distances, indices = snapshot.search(query_vectors, candidates, params)
+                    for row, n in enumerate(pending):
+                        vector_ids = [
+                            int(i)
+                            for i, d in zip(indices[row], distances[row])
+                            if i != -1 and (max_distance is None or d <= max_distance)
+                        ]
+                        if mode == "hybrid":
+                            fused = [i for i, _ in reciprocal_rank_fusion([vector_ids, lexical[n]])]
+                            # Lexical hits only count towards the ranking of
+                            # chunks within the threshold.
+                            close = set(vector_ids) if max_distance is not None else None
+                            vector_ids = [i for i in fused if close is None or i in close]
+                        resolved[n] = vector_ids[:recall]
+
+                # Chunks removed since the first lookup are skipped.
+                results = [self._documents_for(snapshot, resolved[n]) for n in range(len(queries))]
+            if reranker is not None:
+                results = [
+                    rerank_items(reranker, query, docs, top_k, budget=self.rerank_budget)
+                    for query, docs in zip(queries, results)
+                ]
             return results
         except Exception as e:
             logger.error(f"Failed to search vector store: {e}", exc_info=True)
-            return []
+            return [[] for _ in queries]
+
+    def save(self, directory: str) -> None:
+        """Persist the index and chunks to *directory*.
+
+        Files are written under a new generation number and ``manifest.json``
+        is replaced last, so a crash never leaves a half-written store and
+        files still memory-mapped by a reader are not overwritten.
+        """
+        os.makedirs(directory, exist_ok=True)
+        manifest_path = os.path.join(directory, self.MANIFEST_FILE)
+        compaction = self._compaction
+        if compaction is not None and compaction.is_alive():
+            # Save the compacted index rather than its tombstones.
+            compaction.join()
+        with self._write_lock:
+            snapshot = self._snapshot
+            generation = 0
+            if os.path.exists(manifest_path):
+                with open(manifest_path, "r", encoding="utf-8") as f:
+                    generation = json.load(f).get("generation", -1) + 1
+            names = {
+                "index_file": f"index-{generation}.faiss",
+                "chunks_file": f"chunks-{generation}.jsonl",
+                "offsets_file": f"offsets-{generation}.npy",
+                "keys_file": f"keys-{generation}.npy",
+                "lexical_file": f"lexical-{generation}.bm25",
+                "delta_file": f"delta-{generation}.faiss",
+            }
+            paths = {k: os.path.join(directory, v) for k, v in names.items()}
+            if snapshot.index is not None:
+                ann_index.write_index(snapshot.index, paths["index_file"])
+            else:
+                names["index_file"] = None
+            if snapshot.delta is not None:
+                # Kept apart so the saved index can be mapped again.
+                faiss.write_index(snapshot.delta, paths["delta_file"])
+            else:
+                names["delta_file"] = None
+            snapshot.documents.save(paths["chunks_file"], paths["offsets_file"], paths["keys_file"])
+            snapshot.lexical().save(paths["lexical_file"])
+            manifest = {
+                "version": 1,
+                "generation": generation,
+                "embedding_model": self.EMBEDDING_MODEL,
+                "index_type": snapshot.index_type,
+                "next_id": snapshot.next_id,
+                "sources": snapshot.documents.sources(),
+                "tombstones": sorted(snapshot.tombstones),
+                **names,
+            }
+            tmp_path = manifest_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, manifest_path)
+            self._dirty = False
+            self._remove_stale_files(directory, set(v for v in names.values() if v))
+        logger.info(f"Saved vector store with {len(snapshot.documents)} chunks to {directory}.")
+
+    @staticmethod
+    def _remove_stale_files(directory: str, keep: set) -> None:
+        for name in os.listdir(directory):
+            if name == VectorStoreManager.MANIFEST_FILE or name in keep:
+                continue
+            if name.split("-", 1)[0] in ("index", "delta", "chunks", "offsets", "keys", "lexical"):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    # Still mapped by a reader (e.g. on Windows); retry next save.
+                    pass
+
+    def load(self, directory: str, mmap: bool = True) -> None:
+        """Replace the current state with the store saved in *directory*.
+
+        With *mmap* the FAISS index is memory-mapped instead of read into
+        RAM: IVF inverted lists with ``IO_FLAG_MMAP``, flat, HNSW and SQ codes
+        with ``IO_FLAG_MMAP_IFC`` where FAISS provides it (otherwise a warning
+        is logged and the index is read). Chunk texts are always fetched
+        lazily from disk.
+        """
+        with open(os.path.join(directory, self.MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("embedding_model") != self.EMBEDDING_MODEL:
+            raise ValueError(
+                f"Vector store in {directory} uses {manifest.get('embedding_model')}, "
+                f"expected {self.EMBEDDING_MODEL}"
+            )
+        index = None
+        mapped = False
+        if manifest.get("index_file"):
+            index_path = os.path.join(directory, manifest["index_file"])
+            flag = ann_index.mmap_flag(manifest.get("index_type", "flat")) if mmap else None
+            if mmap and flag is None:
+                logger.warning(
+                    f"FAISS {faiss.__version__} cannot memory-map a {manifest.get('index_type')} index; "
+                    f"reading {index_path} into RAM."
+                )
+            if flag is not None:
+                try:
+                    index = faiss.read_index(index_path, flag)
+                    mapped = True
+                except RuntimeError as e:
+                    logger.warning(f"Memory-mapping {index_path} failed ({e}); reading it instead.")
+            if index is None:
+                index = faiss.read_index(index_path)
+        delta = None
+        if manifest.get("delta_file"):
+            delta = faiss.read_index(os.path.join(directory, manifest["delta_file"]))
+            if not mapped:
+                index.add_with_ids(delta.index.reconstruct_n(0, delta.ntotal), faiss.vector_to_array(delta.id_map))
+                delta = None
+        documents = ChunkStore.open(
+            os.path.join(directory, manifest["chunks_file"]),
+            os.path.join(directory, manifest["offsets_file"]),
+            os.path.join(directory, manifest["keys_file"]),
+            manifest.get("sources", []),
+        )
+        # Opened here like the chunks, since a later save() to the same
+        # directory deletes this generation's files; its postings stay mapped.
+        lexical_index = None
+        if manifest.get("lexical_file"):
+            lexical_index = BM25Index.load(os.path.join(directory, manifest["lexical_file"]))
+        snapshot = Snapshot(
+            index=index,
+            documents=documents,
+            lexical_index=lexical_index,
+            tombstones=manifest.get("tombstones", []),
+            next_id=manifest["next_id"],
+            index_type=manifest.get("index_type", "flat"),
+            mapped=mapped,
+            delta=delta,
+        )
+        with self._write_lock:
+            self._snapshot = snapshot
+            self._dirty = False
+        logger.info(f"Loaded vector store with {len(documents)} chunks from {directory}.")
+
+    def sources(self) -> List[str]:
+        """Return the sources of all indexed chunks."""
+        with self._rw.read():
+            return self.documents.sources()
+
+    def cache_stats(self) -> Dict[str, float]:
+        """Return hit/miss counters of the embedding cache."""
+        return self.embedding_cache.stats()
+
+    def query_cache_stats(self) -> Dict[str, float]:
+        """Return hit-rate statistics of the query embedding cache."""
+        return self.query_cache.stats()
+
+    def is_dirty(self) -> bool:
+        """Return True if the store changed since it was last saved or loaded."""
+        return self._dirty
 
     def is_ready(self) -> bool:
-        return self.index is not None and self.documents
+        snapshot = self._snapshot
+        return snapshot.index is not None and bool(snapshot.documents)
@@ -0,0 +1,166 @@
+"""Named vector stores for deployments that serve several corpora."""
+
+import gc
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from src.embedding_cache import EmbeddingCache
+from src.vector_store_manager import VectorStoreManager, _env_optional_int
+
+logger = logging.getLogger(__name__)
+
+_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+
+
+def _rss_bytes() -> Optional[int]:
+    """Return the resident set size of this process, or ``None`` if unknown."""
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class VectorStoreRegistry:
+    """Vector stores keyed by tenant name, each saved under ``root/<name>``.
+
+    Stores are loaded on first use and kept in least-recently-used order.
+    When the process RSS exceeds *memory_budget_mb* (``VECTOR_STORE_MEMORY_MB``
+    by default), the least recently used stores are saved if they changed
+    and dropped until it fits again. Every store has its own lock, so
+    queries to different tenants do not wait for each other; the registry
+    lock only guards its bookkeeping and is never held while a store loads
+    or saves. Loading and evicting one store are serialized by a lock per
+    name, so a store is never read from disk while its eviction is saving.
+
+    Evicted stores are reloaded by the next :meth:`get`, so callers should
+    look a store up for every request instead of keeping a reference.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        openai_api_key: Optional[str] = None,
+        *,
+        memory_budget_mb: Optional[int] = None,
+        embedding_cache: Optional[EmbeddingCache] = None,
+    ) -> None:
+        self.root = root
+        self.openai_api_key = openai_api_key
+        if memory_budget_mb is None:
+            memory_budget_mb = _env_optional_int("VECTOR_STORE_MEMORY_MB")
+        self.memory_budget = memory_budget_mb * 1024 * 1024 if memory_budget_mb else None
+        # Embeddings depend only on the text, so tenants share one cache.
+        if embedding_cache is None:
+            embedding_cache = EmbeddingCache(os.getenv("EMBEDDING_CACHE_PATH", ":memory:"))
+        self.embedding_cache = embedding_cache
+        self._stores: "OrderedDict[str, VectorStoreManager]" = OrderedDict()
+        # Serializes loading and evicting each store.
+        self._store_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def path_for(self, name: str) -> str:
+        """Return the directory of the store *name*."""
+        if not _NAME_RE.match(name):
+            raise ValueError(f"Invalid vector store name: {name!r}")
+        return os.path.join(self.root, name)
+
+    def get(self, name: str) -> VectorStoreManager:
+        """Return the store *name*, loading it from disk or creating it."""
+        directory = self.path_for(name)
+        with self._lock:
+            manager = self._stores.get(name)
+            if manager is not None:
+                self._stores.move_to_end(name)
+                return manager
+            store_lock = self._store_locks.setdefault(name, threading.Lock())
+        # Only threads asking for the same store wait for it to load.
+        with store_lock:
+            with self._lock:
+                manager = self._stores.get(name)
+            if manager is None:
+                manager = VectorStoreManager(self.openai_api_key, embedding_cache=self.embedding_cache)
+                if os.path.exists(os.path.join(directory, VectorStoreManager.MANIFEST_FILE)):
+                    manager.load(directory)
+                with self._lock:
+                    self._stores[name] = manager
+        self._enforce_budget(keep=name)
+        return manager
+
+    def names(self) -> List[str]:
+        """Return the names of the loaded stores, least recently used first."""
+        with self._lock:
+            return list(self._stores)
+
+    def available(self) -> List[str]:
+        """Return the names of all stores saved under the root directory."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name
+            for name in os.listdir(self.root)
+            if _NAME_RE.match(name)
+            and os.path.exists(os.path.join(self.root, name, VectorStoreManager.MANIFEST_FILE))
+        )
+
+    def save(self, name: str) -> None:
+        """Save the store *name* if it is loaded and has unsaved changes."""
+        with self._lock:
+            manager = self._stores.get(name)
+        if manager is not None and manager.is_dirty():
+            manager.save(self.path_for(name))
+
+    def save_all(self) -> None:
+        for name in self.names():
+            self.save(name)
+
+    def evict(self, name: str) -> bool:
+        """Save and unload the store *name*. Returns False if it was not loaded."""
+        with self._lock:
+            if name not in self._stores:
+                return False
+            store_lock = self._store_locks.setdefault(name, threading.Lock())
+        # Held until the store is gone, so get() cannot load the generation
+        # that this save replaces.
+        with store_lock:
+            with self._lock:
+                manager = self._stores.get(name)
+            if manager is None:
+                return False
+            if manager.is_dirty():
+                manager.save(self.path_for(name))
+            with self._lock:
+                self._stores.pop(name, None)
+            # Writes that raced with the save are saved too; later writes to
+            # a kept reference are lost.
+            if manager.is_dirty():
+                manager.save(self.path_for(name))
+        logger.info(f"Evicted vector store {name}.")
+        return True
+
+    def _enforce_budget(self, keep: str) -> None:
+        if self.memory_budget is None:
+            return
+        while True:
+            rss = _rss_bytes()
+            if rss is None or rss <= self.memory_budget:
+                return
+            with self._lock:
+                victims = [n for n in self._stores if n != keep]
+            if not victims:
+                logger.warning(
+                    f"RSS {rss >> 20} MB exceeds VECTOR_STORE_MEMORY_MB but only {keep} is loaded."
+                )
+                return
+            self.evict(victims[0])
+            gc.collect()
@@ -0,0 +1,98 @@
+import faiss
+import numpy as np
+import pytest
+
+from src import ann_index
+
+
+def _data(n=2000, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.random((n, dim), dtype=np.float32)
+
+
+@pytest.mark.parametrize("index_type", ann_index.INDEX_TYPES)
+def test_create_index_searches(index_type):
+    vectors = _data(300)
+    ids = np.arange(100, 100 + len(vectors), dtype="int64")
+    index = ann_index.create_index(index_type, vectors, ids, nlist=4, pq_m=4, pq_bits=4)
+    assert index.ntotal == len(vectors)
+    params = ann_index.search_parameters(index, nprobe=4, ef_search=128)
+    _, found = index.search(vectors[:5], 1, params=params)
+    assert found[:, 0].tolist() == ids[:5].tolist()
+
+
+def test_factory_string_pq_divides_dimension():
+    assert ann_index.factory_string("ivf_pq", 1536, 100_000, nlist=256) == "IVF256,PQ64"
+    assert ann_index.factory_string("ivf_pq", 10, 100_000, nlist=8, pq_m=4) == "IVF8,PQ2"
+    assert ann_index.factory_string("ivf_pq", 16, 100_000, nlist=8, pq_m=4, pq_bits=4) == "IVF8,PQ4x4"
+
+
+def test_factory_string_rejects_unknown_type():
+    with pytest.raises(ValueError):
+        ann_index.factory_string("annoy", 8, 10)
+
+
+def test_search_parameters():
+    vectors = _data(500)
+    ids = np.arange(len(vectors), dtype="int64")
+    ivf = ann_index.create_index("ivf_flat", vectors, ids, nlist=8)
+    assert isinstance(ann_index.search_parameters(ivf, nprobe=4), faiss.SearchParametersIVF)
+    hnsw = ann_index.create_index("hnsw", vectors, ids)
+    assert isinstance(ann_index.search_parameters(hnsw, ef_search=64), faiss.SearchParametersHNSW)
+    flat = ann_index.create_index("flat", vectors, ids)
+    assert ann_index.search_parameters(flat, nprobe=4) is None
+
+
+def test_search_parameters_selector():
+    vectors = _data(500)
+    ids = np.arange(1000, 1000 + len(vectors), dtype="int64")
+    allowed = np.array([1003, 1250, 1499], dtype="int64")
+    for index_type in ("flat", "ivf_flat", "hnsw"):
+        index = ann_index.create_index(index_type, vectors, ids, nlist=8)
+        selector = faiss.IDSelectorBatch(allowed)
+        params = ann_index.search_parameters(index, selector=selector, selectivity=len(allowed) / len(ids))
+        _, found = index.search(vectors[:2], 3, params=params)
+        assert [sorted(row) for row in found.tolist()] == [allowed.tolist()] * 2
+    params = ann_index.search_parameters(index, ef_search=16, selector=selector, selectivity=0.5)
+    assert params.efSearch == 32
+
+
+def test_recall_report():
+    vectors = _data()
+    report = ann_index.recall_report(
+        vectors,
+        vectors[:20],
+        [
+            {"index_type": "flat"},
+            {"index_type": "ivf_flat", "nlist": 16, "nprobe": 16},
+            {"index_type": "sq8"},
+        ],
+        top_k=5,
+    )
+    assert [r["index_type"] for r in report] == ["flat", "ivf_flat", "sq8"]
+    assert report[0]["recall"] == 1.0
+    assert report[1]["recall"] == 1.0
+    assert report[2]["bytes_per_vector"] < report[0]["bytes_per_vector"]
+
+
+def test_mmap_flag_matches_index_layout():
+    assert ann_index.mmap_flag("ivf_pq") == faiss.IO_FLAG_MMAP
+    # IO_FLAG_MMAP leaves flat, HNSW and SQ codes in RAM.
+    for index_type in ("flat", "hnsw", "sq8"):
+        assert ann_index.mmap_flag(index_type) == getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat"])
+def test_in_memory_copies_mapped_index(index_type, tmp_path):
+    vectors = _data(300)
+    index = ann_index.create_index(index_type, vectors, np.arange(300, dtype="int64"), nlist=4)
+    path = str(tmp_path / "index.faiss")
+    faiss.write_index(index, path)
+    mapped = faiss.read_index(path, ann_index.mmap_flag(index_type))
+
+    copy = ann_index.in_memory(mapped)
+    copy.add_with_ids(vectors[:1], np.array([300], dtype="int64"))
+    assert (copy.ntotal, mapped.ntotal) == (301, 300)
+    ann_index.write_index(mapped, path + ".copy")
+    (tmp_path / "index.faiss").unlink()
+    assert faiss.read_index(path + ".copy").ntotal == 300
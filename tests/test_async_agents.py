@@ -0,0 +1,108 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from src.agent import CoTAgent, PresentationAgent, ReActAgent, ToTAgent
+from src.tools.web_scraper import get_tool
+
+
+def test_react_arun_with_async_llm(monkeypatch):
+    responses = [
+        "思考: 検索します\n行動: web_scraper: http://example.com",
+        "最終的な答え: ok",
+    ]
+
+    async def fake_llm(prompt: str) -> str:
+        await asyncio.sleep(0)
+        return responses.pop(0)
+
+    monkeypatch.setattr(
+        "src.tools.web_scraper.scrape_website_content", lambda url, max_chars=1000: "dummy"
+    )
+    agent = ReActAgent(fake_llm, [get_tool()])
+
+    async def collect():
+        return [step async for step in agent.arun_iter("質問")]
+
+    steps = asyncio.run(collect())
+    assert steps[1] == "観察: dummy"
+    assert steps[-1] == "ok"
+
+
+def test_cot_arun_and_sync_llm():
+    responses = ["思考: step", "最終的な答え: done"]
+
+    def fake_llm(prompt: str) -> str:
+        return responses.pop(0)
+
+    # Blocking callables also work; they run in a worker thread.
+    assert asyncio.run(CoTAgent(fake_llm).arun("q")) == "done"
+
+
+def test_tot_arun_with_async_evaluator():
+    async def llm(prompt: str) -> str:
+        return "- A\n- B" if "箇条書き" in prompt else "最終的な答え: done"
+
+    async def evaluate(history: str) -> float:
+        return 1.0 if "B" in history else 0.0
+
+    agent = ToTAgent(llm, evaluate, max_depth=1, breadth=2)
+    assert asyncio.run(agent.arun("q")) == "done"
+
+
+def test_presentation_arun():
+    async def llm(prompt: str) -> str:
+        return '[{"title": "T", "body": "B"}]'
+
+    result = asyncio.run(PresentationAgent(llm).arun("2枚"))
+    path = result.split(": ", 1)[1]
+    try:
+        assert "<h1>T</h1>" in open(path, encoding="utf-8").read()
+    finally:
+        os.remove(path)
+
+
+def test_conversations_share_one_event_loop():
+    async def slow_llm(prompt: str) -> str:
+        await asyncio.sleep(0.05)
+        return "最終的な答え: ok"
+
+    async def many():
+        return await asyncio.gather(*(CoTAgent(slow_llm).arun(str(i)) for i in range(50)))
+
+    start = time.monotonic()
+    assert asyncio.run(many()) == ["ok"] * 50
+    assert time.monotonic() - start < 1
+
+
+def test_sync_run_rejects_async_llm():
+    async def llm(prompt: str) -> str:
+        return "最終的な答え: ok"
+
+    with pytest.raises(TypeError, match="arun"):
+        CoTAgent(llm).run("q")
+
+
+def test_arun_with_async_stream():
+    async def stream_llm(prompt: str):
+        for chunk in ["思考: a\n", "最終的な答え: ", "ok\n", "extra"]:
+            await asyncio.sleep(0)
+            yield chunk
+
+    async def collect():
+        return [s async for s in CoTAgent(stream_llm).arun_iter("q")]
+
+    steps = asyncio.run(collect())
+    assert "".join(steps[:-1]) == "思考: a\n最終的な答え: ok\n"
+    assert steps[-1] == "ok"
+
+
+def test_arun_with_stream_returns_full_answer():
+    async def stream_llm(prompt: str):
+        yield "最終的な答え: 東"
+        yield "京です"
+
+    assert asyncio.run(ReActAgent(stream_llm, []).arun("q")) == "東京です"
+    assert asyncio.run(CoTAgent(stream_llm).arun("q")) == "東京です"
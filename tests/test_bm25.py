@@ -0,0 +1,75 @@
+import numpy as np
+
+from src.bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_mixes_bigrams_and_codes():
+    assert tokenize("第１２条の特約ＡＢ-123") == ["第12条", "の特", "特約", "ab-123"]
+
+
+def test_bm25_ranks_exact_terms_first():
+    index = BM25Index()
+    index.add(0, "火災保険の補償範囲について")
+    index.add(1, "地震保険特約の補償範囲について")
+    index.add(2, "自動車保険の免責事項")
+    results = index.search("地震保険特約", top_k=2)
+    assert results[0][0] == 1
+    assert len(results) == 2
+
+
+def test_bm25_save_and_load(tmp_path):
+    index = BM25Index()
+    index.add(7, "特約コード AB-123")
+    path = tmp_path / "lexical.bm25"
+    index.save(str(path))
+    loaded = BM25Index.load(str(path))
+    assert loaded.search("ab-123") == index.search("ab-123")
+    assert len(loaded) == 1
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=60)
+    assert [doc_id for doc_id, _ in fused] == [1, 3, 2]
+
+
+def test_search_restricted_to_allowed_ids():
+    index = BM25Index()
+    index.add(0, "火災保険の補償")
+    index.add(1, "火災保険の免責")
+    index.add(2, "自動車保険")
+    assert [i for i, _ in index.search("火災", allowed={1, 2})] == [1]
+
+
+def test_remove():
+    index = BM25Index()
+    index.add(0, "火災保険の補償")
+    index.add(1, "自動車保険")
+    index.remove(0)
+    assert len(index) == 1
+    assert index.search("火災") == []
+    assert [i for i, _ in index.search("保険")] == [1]
+
+
+def test_buffered_and_merged_postings_score_alike(monkeypatch, tmp_path):
+    texts = {i: f"火災保険の補償 第{i}条 特約 AB-{i % 3}" for i in range(20)}
+    buffered = BM25Index()
+    for doc_id, text in texts.items():
+        buffered.add(doc_id, text)
+    monkeypatch.setattr(BM25Index, "MERGE_MIN_POSTINGS", 8)
+    merged = BM25Index()
+    for doc_id, text in texts.items():
+        merged.add(doc_id, text)
+    for index in (buffered, merged):
+        index.remove(4)
+    assert len(merged._pending) < len(texts)
+    assert merged.search("火災 ab-1", top_k=20) == buffered.search("火災 ab-1", top_k=20)
+
+    path = str(tmp_path / "lexical.bm25")
+    merged.save(path)
+    loaded = BM25Index.load(path)
+    assert isinstance(loaded._doc_ids, np.memmap)
+    loaded.add(20, "火災保険の免責 AB-1")
+    loaded.remove(7)
+    buffered.add(20, "火災保険の免責 AB-1")
+    buffered.remove(7)
+    assert loaded.search("火災 ab-1", top_k=20) == buffered.search("火災 ab-1", top_k=20)
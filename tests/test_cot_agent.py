@@ -1,4 +1,4 @@
-from src.agent import CoTAgent
+from src.agent import CoTAgent, Delta
 
 
 def test_cot_agent_returns_final_answer():
@@ -29,3 +29,28 @@ def test_cot_run_iter_yields_steps():
     assert steps[0].startswith("思考")
     assert steps[1].startswith("最終的な答え")
     assert steps[2] == "ok"
+
+
+def test_cot_stream_stops_after_final_answer():
+    closed = []
+
+    def stream_llm(prompt: str):
+        try:
+            yield "最終的な答え:"
+            yield " done\n"
+            yield "余分な説明"
+        finally:
+            closed.append(True)
+
+    steps = list(CoTAgent(stream_llm).run_iter("q"))
+    assert steps == ["最終的な答え:", " done\n", "done"]
+    assert isinstance(steps[0], Delta)
+    assert closed == [True]
+
+
+def test_cot_run_with_streaming_llm_returns_full_answer():
+    def stream_llm(prompt: str):
+        yield "最終的な答え: 東"
+        yield "京です"
+
+    assert CoTAgent(stream_llm).run("q") == "東京です"
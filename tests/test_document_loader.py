@@ -7,6 +7,8 @@ from pathlib import Path
 project_root = Path(__file__).resolve().parent.parent
 sys.path.insert(0, str(project_root))
 
+import pytest
+
 from src.document_loader import load_document
 
 def test_load_document():
@@ -81,3 +83,168 @@ def test_load_document():
 if __name__ == "__main__":
     test_load_document()
     print("All document loader tests passed!")
+
+
+class _FakePage:
+    def __init__(self, text, extracted):
+        self.text = text
+        self.extracted = extracted
+
+    def extract_text(self):
+        self.extracted.append(self.text)
+        return self.text
+
+
+def _fake_pdf(monkeypatch, texts):
+    import src.document_loader as loader
+
+    extracted = []
+    pages = [_FakePage(text, extracted) for text in texts]
+    monkeypatch.setattr(loader.pypdf, "PdfReader", lambda source: type("Reader", (), {"pages": pages})())
+    return extracted
+
+
+def test_iter_document_extracts_pages_lazily(monkeypatch, tmp_path):
+    from src.document_loader import iter_document
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "policy.pdf").write_bytes(b"%PDF fake")
+    extracted = _fake_pdf(monkeypatch, ["一", "", "三", "四"])
+    pages = iter_document("policy.pdf")
+    first = next(pages)
+    assert (first.page_content, first.metadata) == ("一", {"source": "policy.pdf", "page": 1})
+    assert extracted == ["一"]
+    # Pages without text are skipped.
+    assert [d.metadata["page"] for d in pages] == [3, 4]
+
+
+def test_load_pages_returns_windows(monkeypatch, tmp_path):
+    from src.document_loader import load_document, load_pages
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "policy.pdf").write_bytes(b"%PDF fake")
+    _fake_pdf(monkeypatch, ["一", "二", "三"])
+    docs, more = load_pages("policy.pdf", 0, 2)
+    assert [d.page_content for d in docs] == ["一", "二"] and more
+    docs, more = load_pages("policy.pdf", 2, 2)
+    assert [d.metadata["page"] for d in docs] == [3] and not more
+    assert len(load_document("policy.pdf")) == 3
+    assert load_document("notes.txt") == []
+
+
+def test_load_pages_opens_each_pdf_once(monkeypatch, tmp_path):
+    import src.document_loader as loader
+
+    _fake_pdf(monkeypatch, [str(n) for n in range(10)])
+    opened = []
+    fake_reader = loader.pypdf.PdfReader
+    monkeypatch.setattr(loader.pypdf, "PdfReader", lambda source: opened.append(source) or fake_reader(source))
+    pdf = tmp_path / "policy.pdf"
+    pdf.write_bytes(b"%PDF fake")
+
+    pages = []
+    for start in range(0, 10, 3):
+        docs, more = loader.load_pages(str(pdf), start, 3)
+        pages += [d.page_content for d in docs]
+    assert pages == [str(n) for n in range(10)] and not more
+    assert len(opened) == 1
+    # The last window closes the file.
+    assert opened[0].closed and not loader._open_pdfs
+
+
+def test_page_cache_skips_parsing_unchanged_files(monkeypatch, tmp_path):
+    import src.document_loader as loader
+
+    extracted = _fake_pdf(monkeypatch, ["一", "", "三"])
+    opened = []
+    fake_reader = loader.pypdf.PdfReader
+    monkeypatch.setattr(loader.pypdf, "PdfReader", lambda source: opened.append(source) or fake_reader(source))
+    monkeypatch.setenv("PAGE_CACHE_PATH", str(tmp_path / "pages.db"))
+    pdf = tmp_path / "policy.pdf"
+    pdf.write_bytes(b"%PDF fake")
+
+    first = [(d.page_content, d.metadata["page"]) for d in loader.iter_document(str(pdf))]
+    assert first == [("一", 1), ("三", 3)]
+    copy = tmp_path / "copy.pdf"
+    copy.write_bytes(pdf.read_bytes())
+    opened.clear()
+    docs, more = loader.load_pages(str(copy), 0, 2)
+    assert [d.page_content for d in docs] == ["一"] and more
+    assert [d.metadata["source"] for d in docs] == [str(copy)]
+    assert loader.load_pages(str(copy), 2, 2)[0][0].page_content == "三"
+    # The copy is served from the cache without opening the PDF.
+    assert opened == []
+    assert extracted == ["一", "", "三"]
+
+
+class _FakeResponse:
+    def __init__(self, status, body=b"", headers=None):
+        self.status_code = status
+        self.body = body
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+    def iter_content(self, size):
+        for i in range(0, len(self.body), size):
+            yield self.body[i:i + size]
+
+
+class _FakeSession:
+    def __init__(self, body, etag='"v1"'):
+        self.body = body
+        self.etag = etag
+        self.requests = []
+
+    def get(self, url, headers=None, timeout=None, stream=False):
+        self.requests.append(dict(headers or {}))
+        assert timeout and stream
+        if headers and headers.get("If-None-Match") == self.etag:
+            return _FakeResponse(304)
+        return _FakeResponse(200, self.body, {"ETag": self.etag, "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"})
+
+
+def test_url_revalidation_skips_download_and_parsing(monkeypatch, tmp_path):
+    import src.document_loader as loader
+
+    session = _FakeSession("<html><body><p>約款の改定について</p><script>x()</script></body></html>".encode())
+    monkeypatch.setattr(loader, "http_session", lambda: session)
+    monkeypatch.setenv("PAGE_CACHE_PATH", str(tmp_path / "pages.db"))
+    url = "https://example.com/notice"
+
+    assert load_document(url)[0].page_content == "約款の改定について"
+    parsed = []
+    monkeypatch.setattr(loader, "_html_text", lambda content: parsed.append(content) or "")
+    docs = loader.load_document(url)
+    assert docs[0].page_content == "約款の改定について"
+    assert session.requests[1] == {
+        "If-None-Match": '"v1"',
+        "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT",
+    }
+    assert parsed == []
+
+    # A changed page is downloaded and parsed again.
+    session.etag = '"v2"'
+    session.body = b"<html><body>new</body></html>"
+    loader.load_document(url)
+    assert parsed == [session.body]
+
+
+def test_url_download_is_capped(monkeypatch):
+    import src.document_loader as loader
+
+    session = _FakeSession(b"<html><body>" + b"a" * 3 * 1024 * 1024 + b"</body></html>")
+    monkeypatch.setattr(loader, "http_session", lambda: session)
+    monkeypatch.setenv("DOCUMENT_URL_MAX_MB", "1")
+    monkeypatch.delenv("PAGE_CACHE_PATH", raising=False)
+    with pytest.raises(ValueError):
+        list(loader.iter_document("https://example.com/huge"))
+    assert load_document("https://example.com/huge") == []
@@ -0,0 +1,104 @@
+import os
+
+from src import ingest
+from src.ingest import load_sync_state, plan_sync, sync_directory
+from src.vector_store_manager import Document
+from tests.test_vector_store_manager import make_manager
+
+
+def fake_loader(source, start, count):
+    with open(source, encoding="utf-8") as f:
+        text = f.read()
+    if not text:
+        return [], False
+    return [Document(text, {"source": source, "page": 1})], False
+
+
+def _write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+
+
+def _sync(manager, root, store):
+    return sync_directory(manager, str(root), str(store), loader=fake_loader, use_processes=False)
+
+
+def test_plan_sync_detects_changes(tmp_path):
+    root = tmp_path / "docs"
+    _write(root / "a.pdf", "火災保険")
+    _write(root / "sub" / "b.DOCX", "自動車保険")
+    _write(root / "notes.txt", "無視")
+    plan = plan_sync(str(root), {})
+    assert plan.added == [str(root / "a.pdf"), str(root / "sub" / "b.DOCX")]
+
+    a = str(root / "a.pdf")
+    _write(root / "a.pdf", "火災保険")  # touched, same content
+    previous = dict(plan.entries)
+    previous[a] = dict(previous[a], mtime_ns=0)
+    os.remove(root / "sub" / "b.DOCX")
+    plan = plan_sync(str(root), previous)
+    assert (plan.added, plan.changed, plan.unchanged) == ([], [], 1)
+    assert plan.removed == [str(root / "sub" / "b.DOCX")]
+
+
+def test_unreadable_files_are_not_treated_as_deleted(monkeypatch, tmp_path):
+    root = tmp_path / "docs"
+    _write(root / "a.pdf", "火災保険")
+    a = str(root / "a.pdf")
+    previous = plan_sync(str(root), {}).entries
+    _write(root / "a.pdf", "火災保険 改定")
+
+    def locked(path):
+        raise PermissionError("locked")
+
+    monkeypatch.setattr(ingest, "file_hash", locked)
+    plan = plan_sync(str(root), previous)
+    assert plan.removed == [] and plan.changed == []
+    assert plan.unreadable == [a]
+    assert plan.entries[a] == previous[a]
+
+
+def test_sync_directory_is_incremental(monkeypatch, tmp_path):
+    root, store = tmp_path / "docs", tmp_path / "store"
+    for name in ("a", "b", "c"):
+        _write(root / f"{name}.pdf", f"{name} の保険約款の本文です。")
+    manager = make_manager(monkeypatch)
+    plan, stats = _sync(manager, root, store)
+    assert len(plan.added) == 3 and stats.indexed == 3
+    assert len(load_sync_state(str(store))) == 3
+
+    calls = len(manager.client.embeddings.calls)
+    plan, stats = _sync(manager, root, store)
+    assert plan.unchanged == 3 and stats.files_total == 0
+    assert len(manager.client.embeddings.calls) == calls
+
+    _write(root / "b.pdf", "b の改定後の約款です。")
+    os.remove(root / "c.pdf")
+    plan, stats = _sync(manager, root, store)
+    assert (len(plan.changed), len(plan.removed), stats.files_total) == (1, 1, 1)
+    assert sorted(os.path.basename(s) for s in manager.sources()) == ["a.pdf", "b.pdf"]
+
+    reloaded = make_manager(monkeypatch)
+    reloaded.load(str(store))
+    assert reloaded.index.ntotal == 2
+
+
+def test_failed_files_are_retried(monkeypatch, tmp_path):
+    root, store = tmp_path / "docs", tmp_path / "store"
+    _write(root / "a.pdf", "a の本文")
+    _write(root / "empty.pdf", "")
+    manager = make_manager(monkeypatch)
+    _, stats = _sync(manager, root, store)
+    assert [os.path.basename(s) for s, _ in stats.errors] == ["empty.pdf"]
+    assert list(load_sync_state(str(store))) == [str(root / "a.pdf")]
+    plan, _ = _sync(manager, root, store)
+    assert plan.added == [str(root / "empty.pdf")]
+
+
+def test_dry_run_changes_nothing(monkeypatch, tmp_path, capsys):
+    root, store = tmp_path / "docs", tmp_path / "store"
+    _write(root / "a.pdf", "a の本文")
+    make_manager(monkeypatch)  # patches the OpenAI client
+    assert ingest.main([str(root), "--store", str(store), "--dry-run"]) == 0
+    assert "new: " + str(root / "a.pdf") in capsys.readouterr().out
+    assert not store.exists()
@@ -0,0 +1,169 @@
+import threading
+import time
+
+from src.ingestion import IngestionPipeline
+from src.vector_store_manager import Document
+from tests.test_vector_store_manager import make_manager
+
+
+def fake_loader(source, start, count):
+    if source.startswith("empty"):
+        return [], False
+    if source.startswith("broken"):
+        raise RuntimeError("corrupt file")
+    total = 10 if source.startswith("long") else 2
+    pages = range(start + 1, min(start + count, total) + 1)
+    docs = [Document(f"{source} の {page} ページ目の本文です。", {"source": source, "page": page}) for page in pages]
+    return docs, start + count < total
+
+
+def _pipeline(manager, **kwargs):
+    kwargs.setdefault("use_processes", False)
+    kwargs.setdefault("parse_workers", 2)
+    kwargs.setdefault("embed_workers", 2)
+    kwargs.setdefault("batch_size", 3)
+    kwargs.setdefault("loader", fake_loader)
+    return IngestionPipeline(manager, **kwargs)
+
+
+def test_pipeline_indexes_all_sources(monkeypatch):
+    manager = make_manager(monkeypatch)
+    reports = []
+    stats = _pipeline(manager, progress=reports.append).run([f"{n}.pdf" for n in range(10)])
+    assert (stats.files_done, stats.pages, stats.chunks, stats.embedded, stats.indexed) == (10, 20, 20, 20, 20)
+    assert stats.errors == []
+    assert manager.index.ntotal == 20
+    assert len(manager.sources()) == 10
+    assert reports[-1].indexed == 20
+    # Embedding requests are bounded by the batch size.
+    assert max(len(call) for call in manager.client.embeddings.calls) <= 3
+
+
+def test_pipeline_reports_failures(monkeypatch):
+    manager = make_manager(monkeypatch)
+    stats = _pipeline(manager).run(["a.pdf", "empty.pdf", "broken.pdf"])
+    assert stats.files_done == 3
+    assert sorted(source for source, _ in stats.errors) == ["broken.pdf", "empty.pdf"]
+    assert manager.sources() == ["a.pdf"]
+
+
+def test_pipeline_replaces_known_sources(monkeypatch):
+    manager = make_manager(monkeypatch)
+    _pipeline(manager).run(["a.pdf"])
+    before = len(manager.client.embeddings.calls)
+    stats = _pipeline(manager).run(["a.pdf"])
+    assert stats.indexed == 0
+    assert len(manager.client.embeddings.calls) == before
+    assert manager.index.ntotal == 2
+
+
+def _revised_loader(source, start, count):
+    # Page 1 is unchanged but moves to page 2; page 2 is replaced.
+    docs = [
+        Document("表紙", {"source": source, "page": 1}),
+        Document(f"{source} の 1 ページ目の本文です。", {"source": source, "page": 2}),
+        Document("改定後の第2条です。", {"source": source, "page": 3}),
+    ]
+    return docs, False
+
+
+def test_pipeline_streams_replaced_sources(monkeypatch):
+    monkeypatch.setenv("VECTOR_COMPACT_FRACTION", "0.9")
+    manager = make_manager(monkeypatch)
+    _pipeline(manager).run(["a.pdf"])
+    monkeypatch.setattr(manager, "replace_source", None)
+    stats = IngestionPipeline(manager, loader=_revised_loader, use_processes=False, batch_size=1).run(["a.pdf"])
+    assert (stats.chunks, stats.embedded, stats.indexed) == (2, 2, 2)
+    assert sorted((d.metadata["page"], d.page_content) for d in manager.documents.values()) == [
+        (1, "表紙"), (2, "a.pdf の 1 ページ目の本文です。"), (3, "改定後の第2条です。"),
+    ]
+    assert manager._snapshot.tombstones == {1}
+
+
+def test_failed_replacement_keeps_previous_chunks(monkeypatch):
+    manager = make_manager(monkeypatch)
+    _pipeline(manager).run(["a.pdf"])
+
+    def broken_embed(chunks):
+        raise RuntimeError("API down")
+
+    monkeypatch.setattr(manager, "embed_chunks", broken_embed)
+    stats = IngestionPipeline(manager, loader=_revised_loader, use_processes=False).run(["a.pdf"])
+    assert [source for source, _ in stats.errors] == ["a.pdf"]
+    assert "a.pdf の 2 ページ目の本文です。" in [d.page_content for d in manager.documents.values()]
+
+
+def test_parse_failure_keeps_previous_chunks(monkeypatch):
+    manager = make_manager(monkeypatch)
+    _pipeline(manager).run(["long.pdf"])
+
+    def truncated_loader(source, start, count):
+        if start:
+            raise RuntimeError("corrupt page")
+        return fake_loader(source, start, count)
+
+    stats = _pipeline(manager, loader=truncated_loader, pages_per_task=2).run(["long.pdf"])
+    assert [source for source, _ in stats.errors] == ["long.pdf"]
+    assert sorted(d.metadata["page"] for d in manager.documents.values()) == list(range(1, 11))
+
+
+def test_queues_apply_backpressure(monkeypatch):
+    manager = make_manager(monkeypatch)
+    release = threading.Event()
+    embed = manager.embed_chunks
+
+    def slow_embed(chunks):
+        release.wait(5)
+        return embed(chunks)
+
+    monkeypatch.setattr(manager, "embed_chunks", slow_embed)
+    parsed = []
+
+    def counting_loader(source, start, count):
+        parsed.append(source)
+        return fake_loader(source, start, count)
+
+    pipeline = IngestionPipeline(
+        manager, loader=counting_loader, use_processes=False,
+        parse_workers=1, embed_workers=1, queue_size=1, batch_size=2,
+    )
+    runner = threading.Thread(target=pipeline.run, args=([f"{n}.pdf" for n in range(50)],))
+    runner.start()
+    runner.join(timeout=1)
+    # Parsing stalls while embedding is blocked instead of loading every file.
+    assert len(parsed) < 10
+    release.set()
+    runner.join(timeout=10)
+    assert manager.index.ntotal == 100
+
+
+def test_pipeline_uses_process_pool(monkeypatch):
+    manager = make_manager(monkeypatch)
+    stats = _pipeline(manager, use_processes=True).run(["a.pdf", "b.pdf"])
+    assert stats.indexed == 4
+
+
+def test_pipeline_parses_long_files_in_windows(monkeypatch):
+    manager = make_manager(monkeypatch)
+    windows = []
+    searchable = []
+
+    def windowed_loader(source, start, count):
+        windows.append((source, start))
+        if start == 9:
+            # The first pages become searchable before the last is parsed.
+            deadline = time.monotonic() + 5
+            while manager.index is None and time.monotonic() < deadline:
+                time.sleep(0.01)
+            searchable.append(manager.index is not None)
+        return fake_loader(source, start, count)
+
+    pipeline = IngestionPipeline(
+        manager, loader=windowed_loader, use_processes=False,
+        parse_workers=1, embed_workers=1, batch_size=2, pages_per_task=3,
+    )
+    stats = pipeline.run(["long.pdf"])
+    assert windows == [("long.pdf", start) for start in (0, 3, 6, 9)]
+    assert (stats.files_done, stats.pages, stats.indexed) == (1, 10, 10)
+    assert [d.metadata["page"] for _, d in sorted(manager.documents.items())] == list(range(1, 11))
+    assert searchable == [True]
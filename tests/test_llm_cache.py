@@ -0,0 +1,31 @@
+import time
+
+from src.llm_cache import LLMCache, cache_from_env
+
+
+def test_ttl_and_size_cap(tmp_path):
+    cache = LLMCache(str(tmp_path / "llm.db"), ttl=60, max_entries=2)
+    for n in range(3):
+        cache.put(f"k{n}", f"v{n}")
+    assert cache.get("k0") is None
+    assert cache.get("k2") == "v2"
+    cache.ttl = 1e-9
+    time.sleep(0.01)
+    assert cache.get("k2") is None
+
+
+def test_cache_from_env(monkeypatch, tmp_path):
+    monkeypatch.delenv("LLM_CACHE_PATH", raising=False)
+    assert cache_from_env() is None
+    path = str(tmp_path / "llm.db")
+    monkeypatch.setenv("LLM_CACHE_PATH", path)
+    monkeypatch.setenv("LLM_CACHE_MODE", "bogus")
+    monkeypatch.setenv("LLM_CACHE_TTL", "oops")
+    cache = cache_from_env()
+    assert not cache.readonly and cache.ttl is None
+    cache.put("k", "v")
+    monkeypatch.setenv("LLM_CACHE_MODE", "replay")
+    replay = cache_from_env()
+    assert replay.readonly and replay.get("k") == "v"
+    replay.put("k2", "v2")
+    assert replay.get("k2") is None
@@ -428,6 +428,42 @@ def test_main_stream(monkeypatch):
     assert 'step2' in printed
 
 
+def test_main_stream_prints_deltas(monkeypatch):
+    printed = []
+    captured = {}
+
+    def llm(prompt):
+        return 'x'
+
+    def stream(prompt):
+        yield 'x'
+
+    llm.stream = stream
+
+    class DummyAgent:
+        def __init__(self, llm, tools, memory, verbose=False):
+            captured['llm'] = llm
+
+        def run_iter(self, q):
+            yield src_main.Delta("思考: ")
+            yield src_main.Delta("考え中")
+            yield "観察: done"
+
+    monkeypatch.setattr(src_main, 'ReActAgent', DummyAgent)
+    monkeypatch.setattr(src_main, 'create_llm', lambda log_usage=True, model=None: llm)
+    monkeypatch.setattr(src_main, 'setup_logging', lambda **k: None)
+    monkeypatch.setattr(src_main, 'get_default_tools', lambda: [None, None])
+
+    inputs = iter(["hi", ""])
+    monkeypatch.setattr('builtins.input', lambda prompt='': next(inputs))
+    monkeypatch.setattr('builtins.print', lambda *a, **k: printed.append((' '.join(map(str, a)), k.get('end', '\n'))))
+
+    src_main.main(['--stream'])
+
+    assert captured['llm'] is stream
+    assert printed[1:5] == [("思考: ", ""), ("考え中", ""), ("", "\n"), ("観察: done", "\n")]
+
+
 def test_main_list_tools(monkeypatch):
     out = []
     monkeypatch.setattr('builtins.print', lambda *a, **k: out.append(' '.join(map(str, a))))
@@ -0,0 +1,46 @@
+import os
+
+from src.page_cache import PageCache
+
+
+def test_pages_round_trip(tmp_path):
+    cache = PageCache(str(tmp_path / "pages.db"))
+    cache.put_pages("k", 3, {0: "一ページ目", 1: "", 2: "三ページ目"})
+    assert cache.page_count("k") == 3
+    assert cache.get_pages("k", 0, 3) == ["一ページ目", "", "三ページ目"]
+    assert cache.get_pages("k", 1, 2) == [""]
+    assert cache.get_pages("missing", 0, 1) is None
+    assert cache.stats()["hits"] == 2
+
+
+def test_partial_window_is_a_miss(tmp_path):
+    cache = PageCache(str(tmp_path / "pages.db"))
+    cache.put_pages("k", 4, {0: "a", 1: "b"})
+    assert cache.get_pages("k", 0, 2) == ["a", "b"]
+    assert cache.get_pages("k", 0, 4) is None
+
+
+def test_file_key_uses_content_and_version(tmp_path):
+    cache = PageCache(str(tmp_path / "pages.db"), version="v1")
+    first, copy = tmp_path / "a.pdf", tmp_path / "b.pdf"
+    first.write_bytes(b"%PDF same")
+    copy.write_bytes(b"%PDF same")
+    assert cache.file_key(str(first)) == cache.file_key(str(copy))
+    assert cache.file_key(str(first)).startswith("v1:")
+    assert PageCache(str(tmp_path / "pages.db"), version="v2").file_key(str(first)) != cache.file_key(str(first))
+    first.write_bytes(b"%PDF edited")
+    os.utime(first, ns=(0, 10**9))
+    assert cache.file_key(str(first)) != cache.file_key(str(copy))
+
+
+def test_least_recently_used_files_are_evicted(tmp_path):
+    cache = PageCache(str(tmp_path / "pages.db"))
+    cache.put_pages("old", 1, {0: os.urandom(500).hex()})
+    cache.put_pages("recent", 1, {0: os.urandom(500).hex()})
+    cache.max_bytes = cache.stats()["bytes"]
+    assert cache.get_pages("old", 0, 1) is not None
+    cache.put_pages("new", 1, {0: os.urandom(10).hex()})
+    assert cache.page_count("recent") is None
+    assert cache.page_count("old") == 1
+    assert cache.page_count("new") == 1
+    assert cache.stats()["bytes"] <= cache.max_bytes
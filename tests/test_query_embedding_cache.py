@@ -0,0 +1,81 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from src.embedding_cache import QueryEmbeddingCache
+
+
+def test_normalized_queries_share_entry():
+    cache = QueryEmbeddingCache()
+    calls = []
+
+    def compute(text):
+        calls.append(text)
+        return np.ones((1, 2), dtype=np.float32)
+
+    cache.get_or_compute("免責金額  ＡＢＣ", compute)
+    cache.get_or_compute(" 免責金額 abc", compute)
+    assert calls == ["免責金額 abc"]
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["hit_rate"] == 0.5
+
+
+def test_lru_eviction_and_ttl(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    cache = QueryEmbeddingCache(max_size=2, ttl=10)
+    compute = lambda text: np.zeros((1, 2), dtype=np.float32)
+    cache.get_or_compute("a", compute)
+    cache.get_or_compute("b", compute)
+    cache.get_or_compute("a", compute)
+    cache.get_or_compute("c", compute)  # evicts "b"
+    assert cache.stats()["size"] == 2
+    cache.get_or_compute("b", compute)
+    assert cache.stats()["misses"] == 4
+    now[0] = 11
+    cache.get_or_compute("b", compute)
+    assert cache.stats()["misses"] == 5
+
+
+def test_concurrent_lookups_are_coalesced():
+    cache = QueryEmbeddingCache()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute(text):
+        calls.append(text)
+        started.set()
+        release.wait(5)
+        return np.ones((1, 2), dtype=np.float32)
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_compute("質問", compute)))
+        for _ in range(5)
+    ]
+    threads[0].start()
+    started.wait(5)
+    for t in threads[1:]:
+        t.start()
+    while cache.stats()["coalesced"] < 4:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+    assert calls == ["質問"]
+    assert len(results) == 5
+
+
+def test_errors_are_not_cached():
+    cache = QueryEmbeddingCache()
+
+    def fail(text):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute("q", fail)
+    value = cache.get_or_compute("q", lambda text: np.ones((1, 2), dtype=np.float32))
+    assert value.shape == (1, 2)
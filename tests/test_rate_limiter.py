@@ -0,0 +1,159 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from src.rate_limiter import BATCH, INTERACTIVE, RateLimiter
+
+
+def test_max_in_flight_is_enforced():
+    limiter = RateLimiter(max_in_flight=2)
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def call():
+        with limiter.acquire():
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert peak[0] == 2
+
+
+def test_interactive_requests_overtake_batches():
+    limiter = RateLimiter(max_in_flight=1)
+    order = []
+    release = threading.Event()
+
+    def holder():
+        with limiter.acquire():
+            release.wait(5)
+
+    def call(name, priority):
+        with limiter.acquire(priority=priority):
+            order.append(name)
+
+    threads = [threading.Thread(target=holder)]
+    threads[0].start()
+    time.sleep(0.05)
+    for name, priority in (("batch-1", BATCH), ("batch-2", BATCH), ("question", INTERACTIVE)):
+        threads.append(threading.Thread(target=call, args=(name, priority)))
+        threads[-1].start()
+        time.sleep(0.05)
+    release.set()
+    for t in threads:
+        t.join()
+    assert order == ["question", "batch-1", "batch-2"]
+
+
+def test_request_and_token_buckets():
+    limiter = RateLimiter(requests_per_minute=6, tokens_per_minute=6000, max_in_flight=None)
+    with limiter.acquire(tokens=500):
+        pass
+    # One request per ten seconds: the next one has to wait.
+    assert limiter._delay(0, time.monotonic()) > 5
+    limiter = RateLimiter(tokens_per_minute=600, max_in_flight=None)
+    with limiter.acquire(tokens=100):
+        pass
+    assert limiter._delay(50, time.monotonic()) > 4
+
+
+def test_large_requests_pay_their_full_token_cost():
+    limiter = RateLimiter(tokens_per_minute=60_000, max_in_flight=None)
+    with limiter.acquire(tokens=100_000):
+        pass
+    # 100k tokens at 1000 tokens/s: the debt takes about 90 s to repay
+    # before the next full bucket is available.
+    assert limiter._delay(100_000, time.monotonic()) > 95
+
+
+class RateLimitError(Exception):
+    status_code = 429
+    response = SimpleNamespace(headers={"retry-after": "0.2"})
+
+
+def test_rate_limit_errors_shrink_and_pause():
+    limiter = RateLimiter(max_in_flight=8)
+    with pytest.raises(RateLimitError):
+        with limiter.acquire():
+            raise RateLimitError()
+    assert limiter.scale == 0.5
+    assert limiter._in_flight_limit() == 4
+    start = time.monotonic()
+    with limiter.acquire():
+        pass
+    assert time.monotonic() - start >= 0.15
+    for _ in range(20):
+        with limiter.acquire():
+            pass
+    assert limiter.scale == 1.0
+
+
+
+def test_async_acquire_shares_the_in_flight_limit():
+    limiter = RateLimiter(max_in_flight=2)
+    active, peak = [0], [0]
+
+    async def call():
+        async with limiter.acquire_async():
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            await asyncio.sleep(0.02)
+            active[0] -= 1
+
+    async def run():
+        await asyncio.gather(*(call() for _ in range(8)))
+
+    asyncio.run(run())
+    assert peak[0] == 2
+
+    # A thread blocked in acquire() still gets its turn behind coroutines.
+    with limiter.acquire():
+        pass
+
+
+def test_waiting_coroutines_are_woken_without_polling():
+    limiter = RateLimiter(max_in_flight=1)
+    attempts = []
+    try_take = limiter._try_take
+
+    def counting_try_take(entry, tokens):
+        attempts.append(entry)
+        return try_take(entry, tokens)
+
+    limiter._try_take = counting_try_take
+    release = threading.Event()
+
+    def hold():
+        with limiter.acquire():
+            release.wait()
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    while limiter._in_flight == 0:
+        time.sleep(0.001)
+
+    async def call():
+        async with limiter.acquire_async():
+            pass
+
+    async def run():
+        waiters = asyncio.gather(*(call() for _ in range(3)))
+        await asyncio.sleep(0.2)
+        release.set()
+        await asyncio.wait_for(waiters, 1)
+
+    asyncio.run(run())
+    holder.join()
+    # One check on arrival and one per wakeup, however long the wait.
+    assert len(attempts) <= 1 + 2 * 3
@@ -1,4 +1,4 @@
-from src.agent import ReActAgent
+from src.agent import Delta, ReActAgent
 from src.tools.web_scraper import get_tool
 
 
@@ -41,3 +41,39 @@ def test_run_iter_yields_steps(monkeypatch):
     assert steps[1] == "観察: dummy"
     assert steps[2].startswith("最終的な答え")
     assert steps[3] == "ok"
+
+
+def test_streamed_turns_stop_at_the_action_line(monkeypatch):
+    read = []
+
+    def stream_llm(prompt: str):
+        chunks = (
+            ["思考: 検索", "します\n行動: web_", "scraper: http://example.com\n観察: 捏造", "された結果"]
+            if "観察: dummy" not in prompt
+            else ["最終的な", "答え: ok"]
+        )
+        for chunk in chunks:
+            read.append(chunk)
+            yield chunk
+
+    monkeypatch.setattr(
+        "src.tools.web_scraper.scrape_website_content", lambda url, max_chars=1000: "dummy"
+    )
+    agent = ReActAgent(stream_llm, [get_tool()])
+    steps = list(agent.run_iter("質問"))
+
+    assert all(isinstance(s, Delta) for s in steps[:3])
+    # The model's invented observation is neither shown nor read to the end.
+    assert "".join(steps[:3]) == "思考: 検索します\n行動: web_scraper: http://example.com\n"
+    assert "された結果" not in read
+    assert steps[3] == "観察: dummy"
+    assert steps[-1] == "ok"
+    assert agent.run("質問") == "ok"
+
+
+def test_run_with_streaming_llm_returns_full_answer():
+    def stream_llm(prompt: str):
+        yield "最終的な答え: 東"
+        yield "京です"
+
+    assert ReActAgent(stream_llm, []).run("q") == "東京です"
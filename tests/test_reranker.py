@@ -0,0 +1,128 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from src.reranker import LLMReranker, Reranker, TfidfReranker, create_reranker, rerank
+from src.vector_store_manager import Document
+from tests.test_vector_store_manager import make_manager
+
+
+def _docs(*texts):
+    return [Document(t, {"n": n}) for n, t in enumerate(texts)]
+
+
+class FixedReranker(Reranker):
+    name = "fixed"
+
+    def __init__(self, scores=None, delay=0.0, error=None):
+        self.scores = scores
+        self.delay = delay
+        self.error = error
+
+    def score(self, query, texts):
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.scores or [float(len(t)) for t in texts]
+
+
+def test_tfidf_prefers_matching_text():
+    docs = _docs("自動車保険の保険料について", "火災保険の免責金額は5万円です", "地震保険の補償範囲")
+    result = rerank(TfidfReranker(), "火災保険の免責金額", docs, top_k=2)
+    assert result[0].metadata["n"] == 1
+    assert len(result) == 2
+
+
+def test_rerank_orders_by_score():
+    docs = _docs("a", "bbb", "cc")
+    assert [d.page_content for d in rerank(FixedReranker(), "q", docs, top_k=3)] == ["bbb", "cc", "a"]
+
+
+def test_rerank_falls_back_when_budget_exceeded():
+    docs = _docs("a", "bbb", "cc")
+    start = time.perf_counter()
+    result = rerank(FixedReranker(delay=1.0), "q", docs, top_k=2, budget=0.05)
+    assert time.perf_counter() - start < 0.5
+    assert [d.page_content for d in result] == ["a", "bbb"]
+
+
+def test_rerank_falls_back_on_error():
+    docs = _docs("a", "bbb")
+    result = rerank(FixedReranker(error=RuntimeError("down")), "q", docs, top_k=1)
+    assert [d.page_content for d in result] == ["a"]
+
+
+def test_llm_reranker_single_call():
+    prompts = []
+
+    def llm(prompt):
+        prompts.append(prompt)
+        return "スコア: [2, 9, 5]"
+
+    docs = _docs("a", "b", "c")
+    result = rerank(LLMReranker(llm), "質問", docs, top_k=2)
+    assert [d.page_content for d in result] == ["b", "c"]
+    assert len(prompts) == 1
+    assert "[3] c" in prompts[0]
+
+
+def test_llm_reranker_rejects_wrong_length():
+    with pytest.raises(ValueError):
+        LLMReranker(lambda prompt: "[1, 2]").score("q", ["a", "b", "c"])
+
+
+def test_reranker_requires_score():
+    class Unfinished(Reranker):
+        name = "unfinished"
+
+    with pytest.raises(TypeError):
+        Unfinished()
+
+
+def test_create_reranker():
+    assert create_reranker("none") is None
+    assert isinstance(create_reranker("tfidf"), TfidfReranker)
+    with pytest.raises(ValueError):
+        create_reranker("llm")
+    with pytest.raises(ValueError):
+        create_reranker("bm42")
+
+
+def test_manager_reranks_recalled_candidates(monkeypatch):
+    monkeypatch.setenv("RERANK_CANDIDATES", "10")
+    manager = make_manager(monkeypatch)
+    manager.reranker = FixedReranker()
+    manager.add_documents([Document("条" * (i + 1), {"source": "a.pdf"}) for i in range(10)])
+    results = manager.search("条", top_k=2, mode="vector")
+    assert [len(d.page_content) for d in results] == [10, 9]
+    assert len(manager.search("条", top_k=2, mode="vector", rerank=False)) == 2
+
+
+def test_invalid_reranker_env_uses_tfidf(monkeypatch):
+    monkeypatch.setenv("RERANKER", "magic")
+    assert isinstance(make_manager(monkeypatch).reranker, TfidfReranker)
+
+
+def test_llm_reranker_call_is_bounded_by_its_budget(monkeypatch):
+    monkeypatch.setenv("RERANKER", "llm")
+    manager = make_manager(monkeypatch)
+    assert isinstance(manager.reranker, LLMReranker)
+    assert manager.rerank_budget == LLMReranker.DEFAULT_BUDGET_MS / 1000 > 1
+    requests = []
+
+    def create(**kwargs):
+        requests.append(kwargs)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="[1, 2]"))])
+
+    manager.client.chat = SimpleNamespace(completions=SimpleNamespace(create=create))
+    assert manager.reranker.score("q", ["a", "b"]) == [1.0, 2.0]
+    assert 0 < requests[0]["timeout"] <= manager.rerank_budget
+    # A budget spent before the request could start skips it.
+    manager.rerank_budget = 0
+    with pytest.raises(TimeoutError):
+        manager.reranker.score("q", ["a", "b"])
+    assert len(requests) == 1
+
+    monkeypatch.setenv("RERANK_BUDGET_MS", "2500")
+    assert make_manager(monkeypatch).rerank_budget == 2.5
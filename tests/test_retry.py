@@ -0,0 +1,144 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src import retry
+from src.retry import LatencyTracker, acall_with_retries, call_with_retries, is_retryable
+
+
+class ServerError(Exception):
+    status_code = 503
+
+
+class BadRequest(Exception):
+    status_code = 400
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(retry.time, "sleep", lambda s: None)
+
+
+def test_is_retryable():
+    assert is_retryable(ServerError())
+    assert not is_retryable(BadRequest())
+    assert is_retryable(type("RateLimitError", (Exception,), {})())
+
+
+def test_transient_errors_are_retried():
+    failures = [ServerError(), ServerError()]
+
+    def attempt(timeout):
+        if failures:
+            raise failures.pop()
+        return "ok"
+
+    assert call_with_retries(attempt, max_retries=3) == "ok"
+    assert failures == []
+
+
+def test_client_errors_and_exhausted_retries_raise():
+    calls = []
+
+    def bad(timeout):
+        calls.append(timeout)
+        raise BadRequest()
+
+    with pytest.raises(BadRequest):
+        call_with_retries(bad, max_retries=3)
+    assert len(calls) == 1
+
+    def busy(timeout):
+        calls.append(timeout)
+        raise ServerError()
+
+    with pytest.raises(ServerError):
+        call_with_retries(busy, max_retries=2)
+    assert len(calls) == 4
+
+
+def test_deadline_limits_attempt_timeouts(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(retry.time, "monotonic", lambda: clock[0])
+    timeouts = []
+
+    def slow(timeout):
+        timeouts.append(timeout)
+        clock[0] += 4.0
+        raise ServerError()
+
+    with pytest.raises(TimeoutError):
+        call_with_retries(slow, max_retries=5, timeout=30.0, deadline=10.0)
+    # Each attempt only gets the time left before the deadline.
+    assert timeouts == [10.0, 6.0, 2.0]
+
+
+def test_slow_requests_are_hedged():
+    tracker = LatencyTracker(min_samples=3)
+    for _ in range(3):
+        tracker.record(0.01)
+    release = threading.Event()
+    calls = []
+
+    def attempt(timeout):
+        calls.append(timeout)
+        if len(calls) == 1:
+            release.wait(5)  # the first request is stuck
+            return "late"
+        return "hedged"
+
+    start = time.monotonic()
+    assert call_with_retries(attempt, hedge=tracker) == "hedged"
+    assert time.monotonic() - start < 1
+    assert len(calls) == 2
+    release.set()
+
+
+def test_no_hedging_without_latency_history():
+    tracker = LatencyTracker(min_samples=3)
+    calls = []
+
+    def attempt(timeout):
+        calls.append(timeout)
+        return "ok"
+
+    assert call_with_retries(attempt, hedge=tracker) == "ok"
+    assert calls == [None]
+    assert tracker.quantile(0.95) is None
+
+
+def test_async_retries_and_hedging():
+    failures = [ServerError()]
+
+    async def flaky(timeout):
+        if failures:
+            raise failures.pop()
+        return "ok"
+
+    tracker = LatencyTracker(min_samples=3)
+    for _ in range(3):
+        tracker.record(0.01)
+    cancelled = []
+
+    async def first_stuck(timeout):
+        if not cancelled:
+            cancelled.append(False)
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled[0] = True
+                raise
+            return "late"
+        return "hedged"
+
+    async def run():
+        first = await acall_with_retries(flaky, max_retries=2, base_delay=0)
+        second = await acall_with_retries(first_stuck, hedge=tracker)
+        await asyncio.sleep(0)
+        return first, second
+
+    assert asyncio.run(run()) == ("ok", "hedged")
+    # The losing request is cancelled rather than left running.
+    assert cancelled == [True]
@@ -0,0 +1,182 @@
+import time
+
+import pytest
+
+from src.text_splitter import RecursiveTextSplitter, estimate_tokens
+from src.vector_store_manager import Document
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("保険金") == 3
+    assert estimate_tokens("abcdefgh") == 2
+    assert estimate_tokens("") == 0
+
+
+def test_short_text_is_one_chunk():
+    splitter = RecursiveTextSplitter(chunk_size=100, chunk_overlap=10)
+    assert splitter.split_text("第1段落\n\n第2段落") == ["第1段落\n\n第2段落"]
+
+
+def test_chunks_respect_budget_and_sentences():
+    splitter = RecursiveTextSplitter(chunk_size=40, chunk_overlap=0)
+    text = "".join(f"これは{i}番目の文です。" for i in range(30))
+    chunks = splitter.split_text(text)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(c) <= 40 for c in chunks)
+    assert all(c.endswith("。") for c in chunks)
+    assert "".join(chunks) == text
+
+
+def test_budget_counts_separators():
+    splitter = RecursiveTextSplitter(chunk_size=100, chunk_overlap=20)
+    chunks = splitter.split_text("word " * 1000)
+    assert all(estimate_tokens(c) <= 100 for c in chunks)
+    assert max(estimate_tokens(c) for c in chunks) > 90
+
+
+def test_overlap_repeats_trailing_sentences():
+    splitter = RecursiveTextSplitter(chunk_size=30, chunk_overlap=12)
+    text = "".join(f"文{i:02d}の内容です。" for i in range(10))
+    chunks = splitter.split_text(text)
+    for prev, nxt in zip(chunks, chunks[1:]):
+        last_sentence = prev.split("。")[-2] + "。"
+        assert nxt.startswith(last_sentence)
+
+
+def test_headings_start_new_chunk():
+    splitter = RecursiveTextSplitter(chunk_size=60, chunk_overlap=10)
+    text = (
+        "第1条 目的\n" + "この約款は保険契約について定めます。" * 2 + "\n"
+        "第2条 定義\n" + "用語の定義は次のとおりとします。" * 2
+    )
+    chunks = splitter.split_text(text)
+    assert chunks[0].startswith("第1条")
+    assert chunks[1].startswith("第2条")
+    assert "第1条" not in chunks[1]
+
+
+def test_unbreakable_text_is_hard_split():
+    splitter = RecursiveTextSplitter(chunk_size=10, chunk_overlap=0)
+    chunks = splitter.split_text("あ" * 25)
+    assert chunks == ["あ" * 10, "あ" * 10, "あ" * 5]
+
+
+def test_split_documents_copies_metadata():
+    splitter = RecursiveTextSplitter(chunk_size=12, chunk_overlap=0)
+    doc = Document("一二三四五六七八九十。一二三四五六七八九十。", {"source": "a.pdf", "page": 3})
+    chunks = splitter.split_documents([doc])
+    assert len(chunks) == 2
+    assert all(isinstance(c, Document) for c in chunks)
+    assert all(c.metadata == {"source": "a.pdf", "page": 3} for c in chunks)
+    chunks[0].metadata["page"] = 99
+    assert doc.metadata["page"] == 3
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        RecursiveTextSplitter(chunk_size=10, chunk_overlap=10)
+
+
+def test_split_speed():
+    splitter = RecursiveTextSplitter(chunk_size=500, chunk_overlap=50)
+    page = ("第3条 保険金の支払\n" + "当会社は、次の事由によって生じた損害に対して保険金を支払います。\n" * 12) * 2
+    docs = [Document(page, {"source": "a.pdf", "page": i}) for i in range(1000)]
+    start = time.perf_counter()
+    splitter.split_documents(docs)
+    assert time.perf_counter() - start < 1.0
+
+
+POLICY_PAGE_1 = """普通保険約款
+第１章　総則
+（用語の定義）
+第１条　この約款において使用される用語の意味は次のとおりとします。
+（保険責任の始期および終期）
+第２条　保険期間は、保険証券記載の始期日の午後４時に始まります。
+２　前項の時刻は、保険証券にこれと異なる時刻が記載されている場合はその時刻とします。"""
+
+POLICY_PAGE_2 = """３　保険期間が始まった後でも、保険料領収前に生じた事故による損害に対しては、保険金を支払いません。
+第２章　保険金の支払
+（保険金を支払う場合）
+第３条　当会社は、火災によって保険の対象に生じた損害に対して、保険金を支払います。"""
+
+
+def _policy_docs():
+    return [
+        Document(POLICY_PAGE_1, {"source": "policy.pdf", "page": 1}),
+        Document(POLICY_PAGE_2, {"source": "policy.pdf", "page": 2}),
+    ]
+
+
+def test_clause_splitter_keeps_articles_whole():
+    from src.text_splitter import ClauseTextSplitter
+
+    chunks = ClauseTextSplitter(chunk_size=500, chunk_overlap=0).split_documents(_policy_docs())
+    articles = [c for c in chunks if "article" in c.metadata]
+    assert [c.metadata["article"] for c in articles] == ["第1条", "第2条", "第3条"]
+    second = articles[1]
+    assert second.page_content.startswith("（保険責任の始期および終期）\n第２条")
+    assert "保険料領収前" in second.page_content
+    assert second.metadata["page"] == 1
+    assert second.metadata["chapter"] == "第1章 総則"
+    assert articles[2].metadata["chapter"] == "第2章 保険金の支払"
+    assert articles[2].metadata["page"] == 2
+    assert articles[2].page_content.startswith("第２章　保険金の支払\n（保険金を支払う場合）\n第３条")
+    assert chunks[0].page_content == "普通保険約款"
+    assert "article" not in chunks[0].metadata
+
+
+def test_clause_splitter_splits_oversize_article_by_paragraph():
+    from src.text_splitter import ClauseTextSplitter, format_citation
+
+    chunks = ClauseTextSplitter(chunk_size=60, chunk_overlap=0).split_documents(_policy_docs())
+    second = [c for c in chunks if c.metadata.get("article") == "第2条"]
+    assert [c.metadata["paragraph"] for c in second] == ["第1項", "第2項", "第3項"]
+    assert [c.metadata["page"] for c in second] == [1, 1, 2]
+    assert second[2].page_content.startswith("第2条\n３　保険期間")
+    assert format_citation(second[1].metadata) == "第2条第2項"
+
+
+def test_clause_splitter_falls_back_without_articles():
+    from src.text_splitter import ClauseTextSplitter
+
+    doc = Document("ご契約のしおり\n\n重要事項の説明です。", {"source": "guide.pdf", "page": 1})
+    chunks = ClauseTextSplitter(chunk_size=100, chunk_overlap=0).split_documents([doc])
+    assert len(chunks) == 1
+    assert chunks[0].metadata == {"source": "guide.pdf", "page": 1}
+
+
+def test_format_citation_without_article():
+    from src.text_splitter import format_citation
+
+    assert format_citation({"source": "a.pdf"}) == ""
+    assert format_citation({"article": "第12条"}) == "第12条"
+
+
+def test_iter_split_documents_matches_split_documents():
+    from src.text_splitter import ClauseTextSplitter
+
+    guide = [Document(f"ご契約のしおり {n} ページ目の説明です。", {"source": "guide.pdf", "page": n}) for n in (1, 2)]
+    for chunk_size in (60, 500):
+        splitter = ClauseTextSplitter(chunk_size=chunk_size, chunk_overlap=0)
+        docs = _policy_docs() + guide
+        expected = [(c.page_content, c.metadata) for c in splitter.split_documents(docs)]
+        streamed = [(c.page_content, c.metadata) for c in splitter.iter_split_documents(iter(docs))]
+        assert streamed == expected
+
+
+def test_iter_split_documents_yields_before_input_ends():
+    from src.text_splitter import ClauseTextSplitter
+
+    read = []
+
+    def pages():
+        for doc in _policy_docs():
+            read.append(doc.metadata["page"])
+            yield doc
+
+    chunks = ClauseTextSplitter(chunk_size=500, chunk_overlap=0).iter_split_documents(pages())
+    first = next(chunks)
+    assert first.page_content == "普通保険約款"
+    # Articles from the first page are complete before the second is read.
+    assert next(chunks).metadata["article"] == "第1条"
+    assert read == [1]
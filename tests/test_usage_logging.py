@@ -1,7 +1,12 @@
+import asyncio
 import logging
+import time
 from types import SimpleNamespace
 
+import pytest
+
 from src import main as src_main
+from src.llm_cache import CacheMiss, LLMCache
 
 class DummyResp:
     def __init__(self):
@@ -20,7 +25,7 @@ class DummyClient:
 
 def test_create_llm_logs_usage(monkeypatch, caplog):
     caplog.set_level(logging.INFO)
-    monkeypatch.setattr(src_main, "OpenAI", lambda api_key: DummyClient())
+    monkeypatch.setattr(src_main, "OpenAI", lambda api_key, max_retries=2: DummyClient())
     monkeypatch.setenv("OPENAI_API_KEY", "x")
     monkeypatch.setenv("OPENAI_TOKEN_PRICE", "0.001")
     llm = src_main.create_llm(log_usage=True)
@@ -31,7 +36,7 @@ def test_create_llm_logs_usage(monkeypatch, caplog):
 
 def test_create_llm_timeout(monkeypatch):
     dummy = DummyClient()
-    monkeypatch.setattr(src_main, "OpenAI", lambda api_key: dummy)
+    monkeypatch.setattr(src_main, "OpenAI", lambda api_key, max_retries=2: dummy)
     monkeypatch.setenv("OPENAI_API_KEY", "x")
     monkeypatch.setenv("OPENAI_TIMEOUT", "5")
     llm = src_main.create_llm()
@@ -41,7 +46,7 @@ def test_create_llm_timeout(monkeypatch):
 
 def test_create_llm_bad_timeout(monkeypatch):
     dummy = DummyClient()
-    monkeypatch.setattr(src_main, "OpenAI", lambda api_key: dummy)
+    monkeypatch.setattr(src_main, "OpenAI", lambda api_key, max_retries=2: dummy)
     monkeypatch.setenv("OPENAI_API_KEY", "x")
     monkeypatch.setenv("OPENAI_TIMEOUT", "oops")
     llm = src_main.create_llm()
@@ -60,7 +65,7 @@ def test_create_llm_base_url(monkeypatch):
         def create(self, model, messages, **kwargs):
             return DummyResp()
 
-    def fake_openai(api_key, base_url=None):
+    def fake_openai(api_key, base_url=None, max_retries=2):
         captured["base_url"] = base_url
         return DummyClient()
 
@@ -70,3 +75,201 @@ def test_create_llm_base_url(monkeypatch):
     llm = src_main.create_llm()
     llm("hi")
     assert captured["base_url"] == "https://example.com"
+
+
+class CountingClient(DummyClient):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def create(self, model, messages, **kwargs):
+        self.calls += 1
+        return super().create(model, messages, **kwargs)
+
+
+def _llm(monkeypatch, client, **kwargs):
+    monkeypatch.setattr(src_main, "OpenAI", lambda **params: client)
+    monkeypatch.setenv("OPENAI_API_KEY", "x")
+    return src_main.create_llm(**kwargs)
+
+
+def test_repeated_prompts_are_served_from_cache(monkeypatch, tmp_path):
+    client = CountingClient()
+    cache = LLMCache(str(tmp_path / "llm.db"))
+    llm = _llm(monkeypatch, client, cache=cache)
+    assert llm("hi") == "ok"
+    assert llm("hi") == "ok"
+    assert llm("other") == "ok"
+    assert client.calls == 2
+    assert cache.stats()["hits"] == 1
+
+
+def test_key_covers_model_and_endpoint(monkeypatch, tmp_path):
+    client = CountingClient()
+    cache = LLMCache(str(tmp_path / "llm.db"))
+    _llm(monkeypatch, client, cache=cache, model="a")("hi")
+    _llm(monkeypatch, client, cache=cache, model="b")("hi")
+    monkeypatch.setenv("OPENAI_BASE_URL", "https://example.com")
+    _llm(monkeypatch, client, cache=cache, model="a")("hi")
+    assert client.calls == 3
+
+
+def test_replay_mode_is_read_only_and_offline(monkeypatch, tmp_path):
+    path = str(tmp_path / "llm.db")
+    _llm(monkeypatch, CountingClient(), cache=LLMCache(path))("hi")
+
+    monkeypatch.delenv("OPENAI_API_KEY")
+    monkeypatch.setenv("LLM_CACHE_PATH", path)
+    monkeypatch.setenv("LLM_CACHE_MODE", "replay")
+    monkeypatch.setenv("LLM_CACHE_TTL", "1e-9")
+    monkeypatch.setattr(src_main, "OpenAI", lambda **params: pytest.fail("replay must not call the API"))
+    llm = src_main.create_llm()
+    time.sleep(0.01)
+    assert llm("hi") == "ok"
+    with pytest.raises(CacheMiss):
+        llm("unseen")
+
+
+def test_cache_is_off_by_default(monkeypatch):
+    monkeypatch.delenv("LLM_CACHE_PATH", raising=False)
+    client = CountingClient()
+    llm = _llm(monkeypatch, client)
+    llm("hi")
+    llm("hi")
+    assert client.calls == 2
+
+
+def test_create_llm_retries_server_errors(monkeypatch):
+    class ServerError(Exception):
+        status_code = 503
+
+    class FlakyClient(CountingClient):
+        def create(self, model, messages, **kwargs):
+            self.calls += 1
+            if self.calls == 1:
+                raise ServerError("busy")
+            return DummyResp()
+
+    monkeypatch.setattr("src.retry.time.sleep", lambda s: None)
+    monkeypatch.delenv("LLM_CACHE_PATH", raising=False)
+    client = FlakyClient()
+    assert _llm(monkeypatch, client)("hi") == "ok"
+    assert client.calls == 2
+
+
+class AsyncCountingClient(CountingClient):
+    async def create(self, model, messages, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return DummyResp()
+
+
+def test_create_async_llm_shares_client_and_cache(monkeypatch, tmp_path):
+    client = AsyncCountingClient()
+    created = []
+    monkeypatch.setattr(src_main, "AsyncOpenAI", lambda **params: created.append(params) or client)
+    monkeypatch.setenv("OPENAI_API_KEY", "x")
+    cache = LLMCache(str(tmp_path / "llm.db"))
+    llm = src_main.create_async_llm(cache=cache)
+
+    async def run():
+        first = await asyncio.gather(*(llm(f"q{i}") for i in range(20)))
+        return first + [await llm("q0")]
+
+    assert asyncio.run(run()) == ["ok"] * 21
+    assert len(created) == 1
+    assert client.calls == 20
+    assert cache.stats()["hits"] == 1
+
+
+class StreamingClient(CountingClient):
+    def __init__(self, pieces):
+        super().__init__()
+        self.pieces = pieces
+        self.closed = 0
+
+    def create(self, model, messages, **kwargs):
+        self.calls += 1
+        self.last_kwargs = kwargs
+        client = self
+
+        class Response:
+            def __iter__(self):
+                for piece in client.pieces:
+                    delta = SimpleNamespace(content=piece)
+                    yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+                yield SimpleNamespace(choices=[], usage=SimpleNamespace(total_tokens=7))
+
+            def close(self):
+                client.closed += 1
+
+        return Response()
+
+
+def test_stream_yields_deltas_and_caches_complete_answers(monkeypatch, tmp_path, caplog):
+    caplog.set_level(logging.INFO)
+    client = StreamingClient(["o", "k"])
+    cache = LLMCache(str(tmp_path / "llm.db"))
+    llm = _llm(monkeypatch, client, cache=cache, log_usage=True)
+
+    assert list(llm.stream("hi")) == ["o", "k"]
+    assert client.last_kwargs["stream"] is True
+    assert "Tokens used: 7" in caplog.text
+    # Served from the cache as one delta, and shared with the plain callable.
+    assert list(llm.stream("hi")) == ["ok"]
+    assert llm("hi") == "ok"
+    assert client.calls == 1
+
+    # Abandoned streams close the response, are not cached and free their slot.
+    partial = llm.stream("other")
+    assert next(partial) == "o"
+    partial.close()
+    assert client.closed == 2
+    assert list(llm.stream("other")) == ["o", "k"]
+    assert src_main.get_rate_limiter()._in_flight == 0
+
+
+class SDKClient(DummyClient):
+    """Fake SDK client that retries internally like ``openai.OpenAI``."""
+
+    def __init__(self, clock, max_retries=2, **params):
+        super().__init__()
+        self.clock = clock
+        self.max_retries = max_retries
+        self.transport_attempts = 0
+
+    def create(self, model, messages, **kwargs):
+        class ServerError(Exception):
+            status_code = 503
+
+        for _ in range(self.max_retries + 1):
+            self.transport_attempts += 1
+            # Each HTTP attempt hangs until its timeout.
+            self.clock[0] += kwargs.get("timeout") or 60.0
+        raise ServerError("busy")
+
+
+def test_deadline_bounds_transport_attempts(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr("src.retry.time.monotonic", lambda: clock[0])
+    monkeypatch.setattr("src.retry.time.sleep", lambda s: clock.__setitem__(0, clock[0] + s))
+    monkeypatch.delenv("LLM_CACHE_PATH", raising=False)
+    monkeypatch.setenv("OPENAI_API_KEY", "x")
+    monkeypatch.setenv("OPENAI_MAX_RETRIES", "3")
+    monkeypatch.setenv("OPENAI_DEADLINE", "10")
+    clients = []
+    monkeypatch.setattr(src_main, "OpenAI", lambda **params: clients.append(SDKClient(clock, **params)) or clients[-1])
+    llm = src_main.create_llm()
+
+    with pytest.raises(TimeoutError):
+        llm("hi")
+    assert clients[0].transport_attempts == 1
+    assert clock[0] <= 10.0
+
+    monkeypatch.setenv("OPENAI_DEADLINE", "0")
+    monkeypatch.setenv("OPENAI_TIMEOUT", "1")
+    llm = src_main.create_llm()
+    with pytest.raises(Exception, match="busy"):
+        llm("hi")
+    # OPENAI_MAX_RETRIES=3 means four HTTP requests in total, not twelve.
+    assert clients[1].transport_attempts == 4
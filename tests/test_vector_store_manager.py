@@ -0,0 +1,668 @@
+import hashlib
+import os
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from src import ann_index, vector_store_manager as vsm
+from src.vector_store_manager import Document, VectorStoreManager
+
+
+def fake_vector(text, dim=8):
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return (np.frombuffer(digest[:dim], dtype=np.uint8) / 255.0).astype(np.float32).tolist()
+
+
+class DummyEmbeddings:
+    def __init__(self):
+        self.calls = []
+
+    def create(self, input, model):
+        self.calls.append(list(input))
+        return SimpleNamespace(data=[SimpleNamespace(embedding=fake_vector(t)) for t in input])
+
+
+class DummyClient:
+    def __init__(self, api_key=None, max_retries=2):
+        self.embeddings = DummyEmbeddings()
+
+
+def make_manager(monkeypatch):
+    monkeypatch.setattr(vsm, "OpenAI", DummyClient)
+    return VectorStoreManager(openai_api_key="x")
+
+
+def test_add_documents_appends(monkeypatch):
+    manager = make_manager(monkeypatch)
+    manager.add_documents([Document("火災保険の補償範囲", {"source": "a.pdf"})])
+    manager.add_documents([Document("自動車保険の免責事項", {"source": "b.pdf"})])
+    assert manager.index.ntotal == 2
+    assert sorted(manager.documents) == [0, 1]
+    results = manager.search("自動車保険の免責事項", top_k=1)
+    assert results[0].metadata["source"] == "b.pdf"
+
+
+def test_add_documents_skips_indexed_chunks(monkeypatch):
+    manager = make_manager(monkeypatch)
+    doc = Document("同じ本文", {"source": "a.pdf"})
+    assert manager.add_documents([doc]) == 1
+    assert manager.add_documents([doc]) == 0
+    assert manager.index.ntotal == 1
+    assert len(manager.client.embeddings.calls) == 1
+
+
+def test_add_documents_threads(monkeypatch):
+    manager = make_manager(monkeypatch)
+    threads = [
+        threading.Thread(
+            target=manager.add_documents,
+            args=([Document(f"本文 {i}", {"source": f"{i}.pdf"})],),
+        )
+        for i in range(20)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert manager.index.ntotal == 20
+    assert sorted(manager.documents) == list(range(20))
+
+
+def test_build_from_documents_replaces(monkeypatch):
+    manager = make_manager(monkeypatch)
+    manager.add_documents([Document("古い", {"source": "old.pdf"})])
+    manager.build_from_documents([Document("新しい", {"source": "new.pdf"})])
+    assert manager.index.ntotal == 1
+    assert [d.metadata["source"] for d in manager.documents.values()] == ["new.pdf"]
+
+
+def test_embedding_cache_persists(monkeypatch, tmp_path):
+    from src.embedding_cache import EmbeddingCache
+
+    path = str(tmp_path / "emb.sqlite")
+    monkeypatch.setattr(vsm, "OpenAI", DummyClient)
+    first = VectorStoreManager(openai_api_key="x", embedding_cache=EmbeddingCache(path))
+    first.add_documents([Document("約款本文", {"source": "a.pdf"})])
+
+    second = VectorStoreManager(openai_api_key="x", embedding_cache=EmbeddingCache(path))
+    second.add_documents([Document("約款本文", {"source": "a.pdf"})])
+    assert second.client.embeddings.calls == []
+    assert second.cache_stats()["hits"] == 1
+    np.testing.assert_allclose(
+        second.index.index.reconstruct(0), np.array(fake_vector("約款本文"), dtype=np.float32)
+    )
+
+
+def test_embedding_cache_only_sends_misses(monkeypatch):
+    manager = make_manager(monkeypatch)
+    manager.add_documents([Document("既知", {"source": "a.pdf"})])
+    manager.add_documents([Document("既知", {"source": "b.pdf"}), Document("未知", {"source": "b.pdf"})])
+    assert manager.client.embeddings.calls == [["既知"], ["未知"]]
+    assert manager.cache_stats() == {"hits": 1, "misses": 2, "hit_rate": 1 / 3}
+
+
+def test_embedding_batches_preserve_order(monkeypatch):
+    monkeypatch.setenv("EMBEDDING_BATCH_SIZE", "3")
+    manager = make_manager(monkeypatch)
+    texts = [f"条文 {i}" for i in range(10)]
+    vectors = manager._request_embeddings(texts)
+    assert [len(c) for c in manager.client.embeddings.calls] == [3, 3, 3, 1]
+    np.testing.assert_allclose(vectors, np.array([fake_vector(t) for t in texts], dtype=np.float32))
+
+
+def test_embedding_batches_bounded_by_tokens(monkeypatch):
+    monkeypatch.setenv("EMBEDDING_BATCH_TOKENS", "10")
+    manager = make_manager(monkeypatch)
+    assert manager._make_batches(["a" * 6, "b" * 6, "c" * 3, "d" * 20]) == [
+        ["a" * 6],
+        ["b" * 6, "c" * 3],
+        ["d" * 20],
+    ]
+
+
+class ServerError(Exception):
+    status_code = 503
+
+
+def test_embedding_retries_server_errors(monkeypatch):
+    manager = make_manager(monkeypatch)
+    monkeypatch.setattr(vsm.time, "sleep", lambda s: None)
+    real_create = manager.client.embeddings.create
+    failures = [ServerError("busy"), ServerError("busy")]
+
+    def flaky_create(input, model):
+        if failures:
+            raise failures.pop()
+        return real_create(input=input, model=model)
+
+    manager.client.embeddings.create = flaky_create
+    assert manager._request_embeddings(["本文"]).shape == (1, 8)
+
+
+
+class TooManyRequests(Exception):
+    status_code = 429
+    response = SimpleNamespace(headers={"retry-after": "0"})
+
+
+def test_embedding_rate_limits_feed_the_shared_limiter(monkeypatch):
+    from src.rate_limiter import RateLimiter
+
+    manager = make_manager(monkeypatch)
+    limiter = RateLimiter(max_in_flight=4)
+    monkeypatch.setattr(vsm, "get_rate_limiter", lambda: limiter)
+    monkeypatch.setattr(vsm.time, "sleep", lambda s: None)
+    real_create = manager.client.embeddings.create
+    failures = [TooManyRequests("slow down")]
+
+    def limited_create(input, model):
+        if failures:
+            raise failures.pop()
+        return real_create(input=input, model=model)
+
+    manager.client.embeddings.create = limited_create
+    assert manager._request_embeddings(["本文"]).shape == (1, 8)
+    assert limiter.scale < 1.0
+
+def test_embedding_does_not_retry_client_errors(monkeypatch):
+    manager = make_manager(monkeypatch)
+    calls = []
+
+    def bad_create(input, model):
+        calls.append(input)
+        raise ValueError("bad request")
+
+    manager.client.embeddings.create = bad_create
+    with pytest.raises(ValueError):
+        manager._request_embeddings(["本文"])
+    assert len(calls) == 1
+
+
+def test_save_and_load(monkeypatch, tmp_path):
+    manager = make_manager(monkeypatch)
+    manager.add_documents([
+        Document("火災保険の補償範囲", {"source": "a.pdf", "page": 1}),
+        Document("自動車保険の免責事項", {"source": "b.pdf", "page": 2}),
+    ])
+    manager.save(str(tmp_path))
+
+    loaded = make_manager(monkeypatch)
+    loaded.load(str(tmp_path))
+    assert loaded.index.ntotal == 2
+    assert loaded.sources() == ["a.pdf", "b.pdf"]
+    result = loaded.search("自動車保険の免責事項", top_k=1)[0]
+    assert result.page_content == "自動車保険の免責事項"
+    assert result.metadata == {"source": "b.pdf", "page": 2}
+
+
+def test_load_maps_flat_index_codes(monkeypatch, tmp_path):
+    manager = make_manager(monkeypatch)
+    manager.add_documents([Document("火災保険の補償範囲", {"source": "a.pdf"})])
+    manager.save(str(tmp_path))
+    flags = []
+    read_index = vsm.faiss.read_index
+    monkeypatch.setattr(vsm.faiss, "read_index", lambda path, *f: flags.append(f) or read_index(path, *f))
+
+    mapped = make_manager(monkeypatch)
+    mapped.load(str(tmp_path))
+    make_manager(monkeypatch).load(str(tmp_path), mmap=False)
+    # The pinned FAISS provides IO_FLAG_MMAP_IFC, so nothing falls back to a read.
+    assert flags == [(vsm.faiss.IO_FLAG_MMAP_IFC,), ()]
+    assert mapped._snapshot.mapped
+    if os.path.exists("/proc/self/maps"):
+        with open("/proc/self/maps") as f:
+            assert str(tmp_path / "index-0.faiss") in f.read()
+
+
+def test_loaded_store_accepts_new_documents(monkeypatch, tmp_path):
+    monkeypatch.setenv("VECTOR_COMPACT_FRACTION", "0.9")
+    manager = make_manager(monkeypatch)
+    manager.add_documents([Document("既存の条文", {"source": "a.pdf"})])
+    manager.save(str(tmp_path))
+
+    loaded = make_manager(monkeypatch)
+    loaded.load(str(tmp_path))
+    assert loaded.add_documents([Document("既存の条文", {"source": "a.pdf"})]) == 0
+    assert loaded.add_documents([Document("新しい条文", {"source": "c.pdf"})]) == 1
+    assert sorted(loaded.documents) == [0, 1]
+    loaded.save(str(tmp_path))
+
+    again = make_manager(monkeypatch)
+    again.load(str(tmp_path), mmap=False)
+    assert [d.page_content for d in again.documents.values()] == ["既存の条文", "新しい条文"]
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "chunks-1.jsonl",
+        "delta-1.faiss",
+        "index-1.faiss",
+        "keys-1.npy",
+        "lexical-1.bm25",
+        "manifest.json",
+        "offsets-1.npy",
+    ]
+
+
+def test_loaded_store_survives_newer_saves(monkeypatch, tmp_path):
+    writer = make_manager(monkeypatch)
+    writer.add_documents([Document("火災保険の補償範囲", {"source": "a.pdf"})])
+    writer.save(str(tmp_path))
+    reader = make_manager(monkeypatch)
+    reader.load(str(tmp_path))
+
+    # Saving twice deletes the generation the reader loaded.
+    writer.add_documents([Document("地震保険の補償範囲", {"source": "b.pdf"})])
+    writer.save(str(tmp_path))
+    writer.save(str(tmp_path))
+    assert not (tmp_path / "keys-0.npy").exists()
+
+    assert reader.add_documents([Document("自動車保険の免責事項", {"source": "c.pdf"})]) == 1
+    assert reader.search("火災保険の補償範囲", top_k=1, mode="lexical")[0].metadata["source"] == "a.pdf"
+
+
+def test_trained_index_type_converts_after_threshold(monkeypatch, tmp_path):
+    monkeypatch.setenv("VECTOR_INDEX_TYPE", "ivf_flat")
+    monkeypatch.setenv("VECTOR_NLIST", "2")
+    monkeypatch.setenv("VECTOR_TRAIN_MIN", "80")
+    manager = make_manager(monkeypatch)
+    manager.add_documents([Document(f"条文 {i}", {"source": "a.pdf"}) for i in range(50)])
+    assert manager._snapshot.index_type == "flat"
+    manager.add_documents([Document(f"条文 {i}", {"source": "b.pdf"}) for i in range(50)])
+    assert manager._snapshot.index_type == "ivf_flat"
+    assert manager.index.ntotal == 100
+    result = manager.search("条文 7", top_k=1, nprobe=2)[0]
+    assert result.page_content == "条文 7"
+
+    manager.save(str(tmp_path))
+    loaded = make_manager(monkeypatch)
+    loaded.load(str(tmp_path))
+    assert loaded._snapshot.index_type == "ivf_flat"
+
+    # Mapped inverted lists are copied, not referenced, by writes and saves.
+    loaded.add_documents([Document("追加の条文", {"source": "c.pdf"})])
+    loaded.save(str(tmp_path))
+    again = make_manager(monkeypatch)
+    again.load(str(tmp_path), mmap=False)
+    assert again.index.ntotal == 101
+    assert again.search("追加の条文", top_k=1, nprobe=2)[0].page_content == "追加の条文"
+
+
+def test_rebuild_index(monkeypatch):
+    manager = make_manager(monkeypatch)
+    manager.add_documents([Document(f"条文 {i}", {"source": "a.pdf"}) for i in range(30)])
+    manager.rebuild_index("hnsw")
+    assert manager._snapshot.index_type == "hnsw"
+    assert manager.search("条文 3", top_k=1, ef_search=32)[0].page_content == "条文 3"
+    report = manager.index_report([{"index_type": "flat"}, {"index_type": "fp16"}], num_queries=5, top_k=3)
+    assert report[0]["recall"] == 1.0
+
+
+def _embedding_calls(manager):
+    return len(manager.client.embeddings.calls)
+
+
+def test_keyword_query_skips_embedding(monkeypatch):
+    manager = make_manager(monkeypatch)
+    manager.add_documents([
+        Document("地震保険特約 EQ-100 の補償内容", {"source": "a.pdf"}),
+        Document("火災保険の一般条項", {"source": "b.pdf"}),
+    ])
+    before = _embedding_calls(manager)
+    results = manager.search("EQ-100", top_k=1)
+    assert results[0].metadata["source"] == "a.pdf"
+    assert _embedding_calls(manager) == before
+
+
+@pytest.mark.parametrize("query", ["事故の時どうすればいい", "解約したらお金は戻る", "地震保険特約"])
+def test_short_questions_are_embedded(monkeypatch, query):
+    manager = make_manager(monkeypatch)
+    manager.add_documents([
+        Document("事故の時は直ちに保険会社へ連絡してください", {"source": "a.pdf"}),
+        Document("解約したら未経過分の保険料をお返しします", {"source": "b.pdf"}),
+    ])
+    before = _embedding_calls(manager)
+    manager.search(query, top_k=1)
+    assert _embedding_calls(manager) == before + 1
+
+
+def test_hybrid_search_fuses_rankings(monkeypatch):
+    manager = make_manager(monkeypatch)
+    manager.add_documents([
+        Document("地震保険特約の補償内容について説明します", {"source": "a.pdf"}),
+        Document("火災保険の一般条項について説明します", {"source": "b.pdf"}),
+    ])
+    queries = []
+
+    def embed_queries(texts):
+        queries.extend(texts)
+        return np.array([fake_vector("地震保険特約の補償内容について説明します")], dtype=np.float32)
+
+    monkeypatch.setattr(manager, "_embed_queries", embed_queries)
+    results = manager.search("地震保険特約の補償内容はどうなっていますか？", top_k=2)
+    assert len(queries) == 1
+    assert results[0].metadata["source"] == "a.pdf"
+    assert len(results) == 2
+
+
+def test_lexical_index_survives_save_and_load(monkeypatch, tmp_path):
+    manager = make_manager(monkeypatch)
+    manager.add_documents([Document("特約コード AB-123", {"source": "a.pdf"})])
+    manager.save(str(tmp_path))
+    loaded = make_manager(monkeypatch)
+    loaded.load(str(tmp_path))
+    # Opened with the store, so a later save cannot delete it first.
+    assert loaded._snapshot.lexical_index is not None
+    assert loaded.search("AB-123", top_k=1, mode="lexical")[0].metadata["source"] == "a.pdf"
+
+
+def test_repeated_query_uses_cached_embedding(monkeypatch):
+    manager = make_manager(monkeypatch)
+    manager.add_documents([Document("火災保険の補償範囲について説明します", {"source": "a.pdf"})])
+    question = "火災保険ではどのような損害が補償されますか？"
+    manager.search(question, top_k=1)
+    before = _embedding_calls(manager)
+    manager.search(question, top_k=1)
+    assert _embedding_calls(manager) == before
+    assert manager.query_cache_stats()["hits"] == 1
+
+
+def test_search_many_batches_queries(monkeypatch):
+    manager = make_manager(monkeypatch)
+    texts = [f"第{i}条の内容を説明する本文です" for i in range(5)]
+    manager.add_documents([Document(t, {"source": "a.pdf", "n": i}) for i, t in enumerate(texts)])
+    before = _embedding_calls(manager)
+    results = manager.search_many(texts, top_k=1, mode="vector")
+    assert _embedding_calls(manager) == before + 1
+    assert [r[0].metadata["n"] for r in results] == list(range(5))
+
+
+def test_search_many_distance_threshold(monkeypatch):
+    manager = make_manager(monkeypatch)
+    manager.add_documents([Document("火災保険の補償範囲について説明します", {"source": "a.pdf"})])
+    results = manager.search_many(
+        ["火災保険の補償範囲について説明します", "まったく関係のない質問文です"],
+        top_k=3,
+        mode="vector",
+        max_distance=1e-6,
+    )
+    assert len(results[0]) == 1
+    assert results[1] == []
+
+
+def test_distance_threshold_applies_to_hybrid_results(monkeypatch):
+    manager = make_manager(monkeypatch)
+    manager.add_documents([
+        Document("地震保険特約 EQ-100 の補償内容", {"source": "a.pdf"}),
+        Document("火災保険の一般条項", {"source": "b.pdf"}),
+    ])
+    # Neither lexical hits nor keyword queries bypass the threshold.
+    assert manager.search("火災保険の一般条項", top_k=2, max_distance=-1) == []
+    assert manager.search("EQ-100", top_k=2, max_distance=-1) == []
+    results = manager.search("火災保険の一般条項", top_k=2, max_distance=1e-6)
+    assert [d.metadata["source"] for d in results] == ["b.pdf"]
+    with pytest.raises(ValueError):
+        manager.search("EQ-100", mode="lexical", max_distance=1.0)
+
+
+def test_search_many_not_ready(monkeypatch):
+    manager = make_manager(monkeypatch)
+    assert manager.search_many(["a", "b"]) == [[], []]
+
+
+def _filter_corpus():
+    return [
+        Document(f"自動車保険 第{i}条 の補償内容", {"source": "auto-2025.pdf" if i % 2 else "fire.pdf", "page": i})
+        for i in range(1, 21)
+    ]
+
+
+@pytest.mark.parametrize("mode", ["vector", "hybrid", "lexical"])
+def test_search_filters_by_source(monkeypatch, mode):
+    manager = make_manager(monkeypatch)
+    manager.add_documents(_filter_corpus())
+    results = manager.search(
+        "自動車保険 第2条 の補償内容", top_k=5, mode=mode, filters=vsm.SearchFilter(sources={"auto-2025.pdf"})
+    )
+    assert results
+    assert {d.metadata["source"] for d in results} == {"auto-2025.pdf"}
+
+
+def test_search_filters_by_page_and_predicate(monkeypatch):
+    manager = make_manager(monkeypatch)
+    manager.add_documents(_filter_corpus())
+    results = manager.search(
+        "自動車保険の補償内容",
+        top_k=20,
+        mode="vector",
+        filters=vsm.SearchFilter(pages=(5, 10), predicate=lambda m: m["page"] % 2 == 0),
+    )
+    assert sorted(d.metadata["page"] for d in results) == [6, 8, 10]
+
+
+def test_page_range_excludes_pageless_chunks(monkeypatch):
+    manager = make_manager(monkeypatch)
+    manager.add_documents([
+        Document("自動車保険の約款 1 ページ", {"source": "auto.pdf", "page": 1}),
+        Document("自動車保険の案内", {"source": "guide.docx"}),
+    ])
+    results = manager.search("自動車保険", top_k=5, mode="vector", filters=vsm.SearchFilter(pages=(None, 2)))
+    assert [d.metadata["source"] for d in results] == ["auto.pdf"]
+
+
+def test_search_filter_without_matches(monkeypatch):
+    manager = make_manager(monkeypatch)
+    manager.add_documents(_filter_corpus())
+    assert manager.search("補償", filters=vsm.SearchFilter(sources={"missing.pdf"})) == []
+
+
+def test_search_filters_after_load(monkeypatch, tmp_path):
+    manager = make_manager(monkeypatch)
+    manager.add_documents(_filter_corpus()[:10])
+    manager.save(str(tmp_path))
+    loaded = make_manager(monkeypatch)
+    loaded.load(str(tmp_path))
+    loaded.add_documents(_filter_corpus()[10:])
+    results = loaded.search(
+        "自動車保険の補償内容",
+        top_k=20,
+        mode="vector",
+        filters=vsm.SearchFilter(sources=["fire.pdf"], pages=(8, 14)),
+    )
+    assert sorted(d.metadata["page"] for d in results) == [8, 10, 12, 14]
+
+
+def test_selective_filter_on_hnsw(monkeypatch):
+    monkeypatch.setenv("VECTOR_INDEX_TYPE", "hnsw")
+    manager = make_manager(monkeypatch)
+    manager.add_documents([Document(f"条文 {i}", {"source": f"{i % 50}.pdf"}) for i in range(500)])
+    results = manager.search("条文 7", top_k=10, mode="vector", filters=vsm.SearchFilter(sources=["7.pdf"]))
+    assert sorted(d.page_content for d in results) == sorted(f"条文 {i}" for i in range(7, 500, 50))
+
+
+def test_chunk_store_columns_follow_removals(tmp_path):
+    store = vsm.ChunkStore()
+    for i in range(6):
+        store.add(i, Document(f"chunk {i}", {"source": f"{i % 3}.pdf", "page": i}))
+    paths = [str(tmp_path / name) for name in ("chunks.jsonl", "offsets.npy", "keys.npy")]
+    store.save(*paths)
+    loaded = vsm.ChunkStore.open(*paths, store.sources())
+    for i in range(6, 10):
+        loaded.add(i, Document(f"chunk {i}", {"source": f"{i % 3}.pdf", "page": i}))
+    # Drops on-disk rows and moves the last new row into a freed one.
+    loaded.remove([2, 5, 8])
+    assert loaded.sources() == ["0.pdf", "1.pdf"]
+    assert sorted(loaded.select_ids(["0.pdf"], None).tolist()) == [0, 3, 6, 9]
+    assert sorted(loaded.select_ids(None, (4, 9)).tolist()) == [4, 6, 7, 9]
+    loaded.remove([1, 4, 7])
+    assert loaded.sources() == ["0.pdf"]
+    loaded.close()
+
+
+def _policy(version):
+    return [
+        Document("第1条 保険金を支払う場合について定めます。", {"source": "auto.pdf", "page": 1}),
+        Document(f"第2条 免責金額は{version}万円とします。", {"source": "auto.pdf", "page": 2}),
+    ]
+
+
+def test_remove_source(monkeypatch):
+    monkeypatch.setenv("VECTOR_COMPACT_FRACTION", "0.9")
+    manager = make_manager(monkeypatch)
+    manager.add_documents(_policy(5) + [Document("火災保険の補償範囲", {"source": "fire.pdf"})])
+    assert manager.remove_source("auto.pdf") == 2
+    assert manager.sources() == ["fire.pdf"]
+    assert manager.index.ntotal == 3
+    results = manager.search("免責金額は5万円とします", top_k=5, mode="vector")
+    assert [d.metadata["source"] for d in results] == ["fire.pdf"]
+    assert manager.search("免責金額", mode="lexical") == []
+    # The removed chunks can be indexed again.
+    assert manager.add_documents(_policy(5)) == 2
+
+
+def test_replace_source_embeds_only_changed_chunks(monkeypatch):
+    monkeypatch.setenv("TEXT_SPLITTER", "recursive")
+    manager = make_manager(monkeypatch)
+    manager.add_documents(_policy(5))
+    first_id = manager.documents.select_ids(["auto.pdf"]).tolist()[0]
+    calls = manager.client.embeddings.calls
+    before = len(calls)
+
+    revised = _policy(10)
+    revised[0].metadata["page"] = 3
+    assert manager.replace_source("auto.pdf", revised) == {"added": 1, "removed": 1, "updated": 1}
+    assert calls[before:] == [["第2条 免責金額は10万円とします。"]]
+    assert manager.documents[first_id].metadata["page"] == 3
+    assert sorted(d.page_content for d in manager.documents.values()) == [
+        "第1条 保険金を支払う場合について定めます。",
+        "第2条 免責金額は10万円とします。",
+    ]
+    results = manager.search("第2条 免責金額は5万円とします。", top_k=5, mode="vector")
+    assert len(results) == 2
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_compaction_drops_tombstones(monkeypatch, index_type):
+    monkeypatch.setenv("VECTOR_INDEX_TYPE", index_type)
+    monkeypatch.setenv("VECTOR_COMPACT_FRACTION", "0.5")
+    manager = make_manager(monkeypatch)
+    manager.add_documents([Document(f"条文 {i}", {"source": f"{i % 4}.pdf"}) for i in range(40)])
+    manager.remove_source("0.pdf")
+    assert manager._compaction is None
+    assert manager.index.ntotal == 40
+    manager.remove_source("1.pdf")
+    manager._compaction.join()
+    assert manager.index.ntotal == 20
+    assert not manager._snapshot.tombstones
+    results = manager.search("条文 2", top_k=20, mode="vector")
+    assert {d.metadata["source"] for d in results} == {"2.pdf", "3.pdf"}
+
+
+def test_removal_survives_save_and_load(monkeypatch, tmp_path):
+    monkeypatch.setenv("VECTOR_COMPACT_FRACTION", "0.9")
+    manager = make_manager(monkeypatch)
+    manager.add_documents(_policy(5) + [Document("火災保険の補償範囲", {"source": "fire.pdf", "page": 1})])
+    manager.save(str(tmp_path))
+
+    loaded = make_manager(monkeypatch)
+    loaded.load(str(tmp_path))
+    loaded.remove_source("fire.pdf")
+    loaded.save(str(tmp_path))
+
+    again = make_manager(monkeypatch)
+    again.load(str(tmp_path))
+    assert again.sources() == ["auto.pdf"]
+    assert again._snapshot.tombstones == {2}
+    results = again.search("火災保険の補償範囲", top_k=5, mode="vector")
+    assert {d.metadata["source"] for d in results} == {"auto.pdf"}
+    again.compact()
+    assert again.index.ntotal == 2
+
+
+def test_search_does_not_wait_for_writers(monkeypatch):
+    manager = make_manager(monkeypatch)
+    manager.add_documents([Document("火災保険の補償範囲", {"source": "a.pdf"})])
+    results = []
+    with manager._write_lock:
+        # A writer is building the next generation.
+        thread = threading.Thread(target=lambda: results.append(manager.search("火災保険の補償範囲", top_k=1)))
+        thread.start()
+        thread.join(timeout=5)
+        assert not thread.is_alive()
+    assert results[0][0].metadata["source"] == "a.pdf"
+
+
+def test_writes_change_the_index_in_place(monkeypatch):
+    monkeypatch.setenv("VECTOR_COMPACT_FRACTION", "0.9")
+    manager = make_manager(monkeypatch)
+    manager.add_documents([Document("火災保険の補償範囲", {"source": "a.pdf"})])
+    index = manager.index
+    monkeypatch.setattr(vsm.faiss, "clone_index", None)
+    manager.add_documents([Document("自動車保険の免責事項", {"source": "b.pdf"})])
+    manager.remove_source("a.pdf")
+    assert manager.index is index
+    assert manager.sources() == ["b.pdf"]
+    assert manager.index.ntotal == 2
+
+
+def test_search_waits_while_the_index_changes(monkeypatch):
+    manager = make_manager(monkeypatch)
+    manager.add_documents([Document("火災保険の補償範囲", {"source": "a.pdf"})])
+    results = []
+    thread = threading.Thread(target=lambda: results.append(manager.search("火災保険の補償範囲", top_k=1)))
+    with manager._rw.write():
+        thread.start()
+        thread.join(timeout=0.2)
+        assert thread.is_alive()
+    thread.join(timeout=5)
+    assert results[0][0].metadata["source"] == "a.pdf"
+
+
+def test_mapped_store_adds_to_write_segment(monkeypatch, tmp_path):
+    monkeypatch.setenv("VECTOR_COMPACT_FRACTION", "0.9")
+    manager = make_manager(monkeypatch)
+    manager.add_documents(_policy(5))
+    manager.save(str(tmp_path))
+
+    loaded = make_manager(monkeypatch)
+    loaded.load(str(tmp_path))
+    mapped = loaded.index
+    loaded.add_documents([Document("火災保険の補償範囲", {"source": "fire.pdf"})])
+    assert loaded.index is mapped and loaded._snapshot.delta.ntotal == 1
+    assert loaded.search("火災保険の補償範囲", top_k=1, mode="vector")[0].metadata["source"] == "fire.pdf"
+    loaded.save(str(tmp_path))
+
+    again = make_manager(monkeypatch)
+    again.load(str(tmp_path))
+    assert again._snapshot.delta.ntotal == 1
+    again.compact()
+    assert (again.index.ntotal, again._snapshot.delta, again._snapshot.mapped) == (3, None, False)
+    assert again.search("火災保険の補償範囲", top_k=1, mode="vector")[0].metadata["source"] == "fire.pdf"
+
+
+def test_add_document_stream_indexes_in_batches(monkeypatch):
+    manager = make_manager(monkeypatch)
+    seen = []
+
+    def pages():
+        for page in range(1, 6):
+            # Earlier batches are published before later pages are read.
+            seen.append(manager.index.ntotal if manager.index is not None else 0)
+            yield Document(f"{page}ページ目の補償内容です。", {"source": "long.pdf", "page": page})
+
+    assert manager.add_document_stream(pages(), batch_chunks=2) == 5
+    assert seen == [0, 0, 0, 2, 2]
+    assert [len(call) for call in manager.client.embeddings.calls] == [2, 2, 1]
+    assert manager.add_document_stream(pages(), batch_chunks=2) == 0
+
+
+def test_client_leaves_retries_to_the_manager(monkeypatch):
+    captured = {}
+
+    def fake_openai(**kwargs):
+        captured.update(kwargs)
+        return DummyClient()
+
+    monkeypatch.setattr(vsm, "OpenAI", fake_openai)
+    VectorStoreManager(openai_api_key="x")
+    # SDK-level retries would hide 429s from the rate limiter.
+    assert captured["max_retries"] == 0
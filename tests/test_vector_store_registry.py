@@ -0,0 +1,93 @@
+import threading
+
+import pytest
+
+from src import vector_store_manager as vsm
+from src import vector_store_registry as registry_module
+from src.vector_store_manager import Document
+from src.vector_store_registry import VectorStoreRegistry
+from tests.test_vector_store_manager import DummyClient
+
+
+@pytest.fixture
+def registry(monkeypatch, tmp_path):
+    monkeypatch.setattr(vsm, "OpenAI", DummyClient)
+    return VectorStoreRegistry(str(tmp_path), openai_api_key="x")
+
+
+def test_get_creates_and_reuses_stores(registry):
+    auto = registry.get("auto")
+    assert registry.get("auto") is auto
+    assert registry.get("fire") is not auto
+    assert registry.names() == ["auto", "fire"]
+
+
+def test_invalid_names_are_rejected(registry):
+    with pytest.raises(ValueError):
+        registry.get("../other")
+
+
+def test_evicted_store_is_saved_and_reloaded(registry):
+    registry.get("auto").add_documents([Document("自動車保険の免責事項", {"source": "auto.pdf"})])
+    assert registry.evict("auto")
+    assert registry.names() == []
+    assert registry.available() == ["auto"]
+    reloaded = registry.get("auto")
+    assert reloaded.sources() == ["auto.pdf"]
+    assert not reloaded.is_dirty()
+
+
+def test_budget_evicts_least_recently_used(registry, monkeypatch):
+    for name in ("a", "b", "c"):
+        registry.get(name)
+    registry.get("a")
+    registry.memory_budget = 100
+    rss = iter([150, 150, 50])
+    monkeypatch.setattr(registry_module, "_rss_bytes", lambda: next(rss))
+    registry.get("d")
+    # "b" and "c" were the least recently used; "d" is never evicted.
+    assert registry.names() == ["a", "d"]
+
+
+def test_concurrent_gets_load_once(registry, monkeypatch):
+    loads = []
+    original = vsm.VectorStoreManager.__init__
+
+    def counting_init(self, *args, **kwargs):
+        loads.append(1)
+        original(self, *args, **kwargs)
+
+    monkeypatch.setattr(vsm.VectorStoreManager, "__init__", counting_init)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("auto"))) for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(loads) == 1
+    assert all(r is results[0] for r in results)
+
+
+def test_store_stays_loaded_until_eviction_saved_it(registry, monkeypatch):
+    store = registry.get("auto")
+    store.add_documents([Document("自動車保険の免責事項", {"source": "auto.pdf"})])
+    saving, release = threading.Event(), threading.Event()
+    save = store.save
+
+    def slow_save(directory):
+        saving.set()
+        release.wait(5)
+        save(directory)
+
+    monkeypatch.setattr(store, "save", slow_save)
+    evictor = threading.Thread(target=registry.evict, args=("auto",))
+    evictor.start()
+    assert saving.wait(5)
+    # Not reloaded from the generation the eviction is replacing.
+    assert registry.get("auto") is store
+    store.add_documents([Document("火災保険の補償範囲", {"source": "fire.pdf"})])
+    release.set()
+    evictor.join()
+    reloaded = registry.get("auto")
+    assert reloaded is not store
+    assert reloaded.sources() == ["auto.pdf", "fire.pdf"]